@@ -0,0 +1,162 @@
+"""Join admission control and aggregated ready counts.
+
+At the start of an exam every student joins within a few seconds. Joins
+are admitted from a FIFO queue at ``rate`` per second, with bursts of up
+to ``burst``, instead of being handled all at once. ``on_admit`` then
+sends the options to the joining socket only. A student who reconnects
+while still queued keeps their place, and the newer sid replaces the old
+one.
+
+The teacher gets a ``ReadyCounts`` aggregate instead of one event per join
+or confirm: the joined and ready totals per exam, plus the students who
+joined since the previous flush. It is flushed on a fixed interval and
+only for exams that changed.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from registry import MemoryRegistry
+
+log = logging.getLogger(__name__)
+
+
+class AdmissionQueue:
+    def __init__(self, rate=100.0, burst=None, tick=0.05, on_admit=None, clock=time.monotonic):
+        self.rate = rate
+        # Room for two ticks, so a late tick (sleep jitter) does not lose admissions.
+        self.burst = burst if burst is not None else max(1.0, 2 * rate * tick)
+        self.tick = tick
+        self.on_admit = on_admit
+        self.clock = clock
+        self._queue = OrderedDict()  # (exam_id, student_id) -> (sid, enqueued_at)
+        self._tokens = self.burst
+        self._refilled_at = clock()
+        self._lock = threading.Lock()
+        self._running = False
+        self.stats = {'submitted': 0, 'admitted': 0, 'superseded': 0, 'cancelled': 0, 'failed': 0, 'max_depth': 0,
+                      'wait_total': 0.0, 'wait_max': 0.0}
+
+    def submit(self, exam_id, student_id, sid):
+        key = (exam_id, student_id)
+        with self._lock:
+            self.stats['submitted'] += 1
+            queued = self._queue.get(key)
+            if queued:
+                self.stats['superseded'] += 1
+                self._queue[key] = (sid, queued[1])
+            else:
+                self._queue[key] = (sid, self.clock())
+            self.stats['max_depth'] = max(self.stats['max_depth'], len(self._queue))
+
+    def cancel(self, exam_id, student_id):
+        with self._lock:
+            if self._queue.pop((exam_id, student_id), None):
+                self.stats['cancelled'] += 1
+
+    def depth(self):
+        return len(self._queue)
+
+    def admit_ready(self):
+        """Admit as many queued joins as the token bucket allows; returns them.
+
+        A join whose ``on_admit`` raises goes back to the head of the queue
+        and is retried on a later tick.
+        """
+        now = self.clock()
+        admitted = []
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            while self._queue and self._tokens >= 1:
+                (exam_id, student_id), (sid, enqueued_at) = self._queue.popitem(last=False)
+                self._tokens -= 1
+                waited = now - enqueued_at
+                self.stats['admitted'] += 1
+                self.stats['wait_total'] += waited
+                self.stats['wait_max'] = max(self.stats['wait_max'], waited)
+                admitted.append((exam_id, student_id, sid, waited))
+        if self.on_admit:
+            for exam_id, student_id, sid, waited in list(admitted):
+                try:
+                    self.on_admit(exam_id, student_id, sid)
+                except Exception:
+                    log.exception('admitting %s to exam %s failed; requeued', student_id, exam_id)
+                    admitted.remove((exam_id, student_id, sid, waited))
+                    self._requeue(exam_id, student_id, sid, now - waited)
+        return admitted
+
+    def _requeue(self, exam_id, student_id, sid, enqueued_at):
+        key = (exam_id, student_id)
+        with self._lock:
+            self.stats['admitted'] -= 1
+            self.stats['failed'] += 1
+            if key not in self._queue:  # a reconnect may have queued it again meanwhile
+                self._queue[key] = (sid, enqueued_at)
+                self._queue.move_to_end(key, last=False)
+
+    def run(self, sleep=time.sleep):
+        """Admit forever."""
+        self._running = True
+        while self._running:
+            try:
+                self.admit_ready()
+            except Exception:
+                log.exception('admission tick failed')
+            sleep(self.tick)
+
+    def stop(self):
+        self._running = False
+
+    def report(self):
+        admitted = self.stats['admitted']
+        return dict(self.stats, depth=self.depth(), rate=self.rate,
+                    wait_avg=round(self.stats['wait_total'] / admitted, 4) if admitted else 0.0)
+
+
+class ReadyCounts:
+    """Totals live in ``registry`` (see registry.py) so every worker reports the same numbers;
+    the students new since the last flush and the changed exams are kept per worker."""
+
+    def __init__(self, registry=None):
+        self.registry = registry or MemoryRegistry()
+        self._new = defaultdict(list)
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def joined(self, exam_id, student_id):
+        if self.registry.join(exam_id, student_id):
+            self._mark(exam_id, student_id)
+
+    def ready(self, exam_id, student_id):
+        if self.registry.join(exam_id, student_id):
+            self._mark(exam_id, student_id)
+        self.registry.ready(exam_id, student_id)
+        self._mark(exam_id)
+
+    def _mark(self, exam_id, new_student=None):
+        with self._lock:
+            if new_student is not None:
+                self._new[exam_id].append(new_student)
+            self._dirty.add(exam_id)
+
+    def left(self, exam_id, student_id):
+        self.registry.leave(exam_id, student_id)
+        self._mark(exam_id)
+
+    def drop_exam(self, exam_id):
+        self.registry.drop_exam(exam_id)
+        with self._lock:
+            self._new.pop(exam_id, None)
+            self._dirty.discard(exam_id)
+
+    def counts(self, exam_id):
+        return self.registry.counts(exam_id)
+
+    def flush(self):
+        """``[(exam_id, {'joined', 'ready', 'newStudents'})]`` for every exam changed since the last flush."""
+        with self._lock:
+            changed = [(exam_id, self._new.pop(exam_id, [])) for exam_id in self._dirty]
+            self._dirty.clear()
+        return [(exam_id, dict(self.counts(exam_id), newStudents=new)) for exam_id, new in changed]
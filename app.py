@@ -1,32 +1,177 @@
 import os
+import json
 import uuid
-import sqlite3
 from datetime import datetime
-from flask import Flask, render_template_string, request, jsonify, session, redirect, url_for, send_from_directory
-from flask_socketio import SocketIO, emit, join_room, leave_room
+from flask import Flask, Response, render_template_string, request, jsonify, session, redirect, url_for, send_from_directory, send_file, make_response
 from werkzeug.utils import secure_filename
+from functions import sqlite_db as db
+from functions.channels import proctor_room, student_room
+from functions.chunk_ingest import MAX_SEGMENT_BYTES, ChunkIngest, SegmentStream, UploadTooLarge
+from functions.exam_cache import ExamState, ExamStateCache
+from event_journal import journal
+from presence import PresenceTracker
+from admission import AdmissionQueue, ReadyCounts
+from dashboard import Dashboard
+from capture_profile import CaptureProfiles
+from flow_control import RateLimiter, SendQueues, parse_limits
+from audio_stream import AudioStreams, read_ranges
+from voice_activity import VoiceActivity
+from backplane import make_client_manager
+from registry import make_registry, registry_kind
+from media import MAX_MEDIA_BYTES, as_bytes, media_size
+from screenshot_dedup import ScreenshotDeduper
+from screenshot_store import DIGEST_RE, ScreenshotStore, sniff_mimetype
 
 app = Flask(__name__)
 app.secret_key = 'your_super_secret_key_change_me'
 app.config['UPLOAD_FOLDER'] = 'recordings'
+# Form posts larger than a recording segment plus its fields are refused with 413 before they are parsed
+app.config['MAX_CONTENT_LENGTH'] = MAX_SEGMENT_BYTES + 64 * 1024
+# Behind nginx/Apache, let the front server stream recordings with sendfile (X-Sendfile)
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
-
-# SQLite setup
-DB_FILE = 'proctoring.db'
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS exams
-                 (id TEXT PRIMARY KEY, options TEXT, active INTEGER, created_at TEXT)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS students
-                 (id TEXT PRIMARY KEY, exam_id TEXT, joined_at TEXT)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS recordings
-                 (id TEXT PRIMARY KEY, exam_id TEXT, student_id TEXT, filename TEXT, uploaded_at TEXT)''')
-    conn.commit()
-    conn.close()
-
-init_db()
+# With PROCTOR_MESSAGE_QUEUE set, emits and rooms reach sockets on every worker (see backplane.py);
+# exam rosters and teacher sockets are kept in the shared registry (see registry.py).
+if os.environ.get('PROCTOR_GATEWAY') == 'asgi':
+    # One event loop for all sockets, handlers in a bounded pool (see gateway.py, asgi.py)
+    from gateway import AsyncGateway, current_sid, emit, join_room, leave_room
+    # A heartbeat that revives a stale student writes its presence to the registry; only the
+    # in-memory one can do that without blocking the loop.
+    inline_events = ('heartbeat',) if registry_kind() == 'memory' else ()
+    socketio = AsyncGateway(app, inline_events=inline_events, max_http_buffer_size=MAX_MEDIA_BYTES,
+                            client_manager=make_client_manager(async_mode=True))
+else:
+    from flask_socketio import SocketIO, emit, join_room, leave_room
+    socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', max_http_buffer_size=MAX_MEDIA_BYTES,
+                        client_manager=make_client_manager())
+
+    def current_sid():
+        return request.sid
+
+# Student events over their connection's SOCKET_RATE_LIMITS are dropped unhandled; each connection's send
+# queue holds at most SEND_QUEUE_LIMIT packets, shedding the oldest dashboard frame (see flow_control.py).
+limiter = RateLimiter(parse_limits(os.environ.get('SOCKET_RATE_LIMITS')), current_sid=current_sid)
+send_queues = SendQueues(limit=int(os.environ.get('SEND_QUEUE_LIMIT', '64')))
+send_queues.install(socketio.server.eio)
+
+# SQLite setup (pooled per-thread WAL connections, see functions/sqlite_db.py)
+db.init_db()
+# Join/leave/tab/heartbeat events are written behind, in batches (see event_journal.py)
+journal.start()
+registry = make_registry()
+# Student events update the exam's dashboard; teachers get one coalesced diff per DASHBOARD_INTERVAL.
+dashboard = Dashboard()
+DASHBOARD_INTERVAL = float(os.environ.get('DASHBOARD_INTERVAL', os.environ.get('READY_COUNT_INTERVAL', '1')))
+
+# Heartbeats only refresh last-seen; the teacher hears about state transitions.
+def emit_presence(exam_id, student_id, state):
+    registry.set_presence(exam_id, student_id, state)
+    dashboard.update(exam_id, student_id, status=state)
+    app.logger.info(f'Student {student_id} in exam {exam_id} is {state}')
+
+presence = PresenceTracker(on_transition=emit_presence)
+socketio.start_background_task(presence.run, socketio.sleep)
+
+# Near-identical consecutive screenshots are replaced by a 'screenshot_unchanged' tick.
+screenshot_dedup = ScreenshotDeduper(max_distance=int(os.environ.get('SCREENSHOT_DEDUP_DISTANCE', '4')))
+# Recording chunks are written at their offsets and may arrive in any order (see functions/chunk_ingest.py);
+# uploads larger than PROCTOR_MAX_UPLOAD_BYTES are refused before anything is allocated.
+chunk_ingest = ChunkIngest(app.config['UPLOAD_FOLDER'])
+# ...or streamed in as MediaRecorder segments during the exam and appended in order
+segment_stream = SegmentStream(app.config['UPLOAD_FOLDER'])
+# Forwarded screenshots are stored by content hash; socket events only carry the reference.
+screenshot_store = ScreenshotStore(os.path.join(app.config['UPLOAD_FOLDER'], 'screenshots'))
+# Microphone pieces are appended to one WebM per student and indexed by cluster timecode;
+# teachers fetch the newest AUDIO_TAIL_SECONDS instead of receiving every piece (see audio_stream.py).
+audio_streams = AudioStreams(os.path.join(app.config['UPLOAD_FOLDER'], 'audio'))
+AUDIO_TAIL_SECONDS = int(os.environ.get('AUDIO_TAIL_SECONDS', '30'))
+
+# With NumPy and PyAV installed, teachers get 'speech' alerts with a clip URL instead of
+# a new audio URL per piece; detection runs in AUDIO_VAD_WORKERS threads (see voice_activity.py).
+def emit_speech(exam_id, student_id, segment):
+    end = segment['start'] + round(segment['duration'] * 1000)
+    url = f'/audio/{exam_id}/{student_id}?session={segment["session"]}&start={segment["start"]}&end={end}'
+    journal.record('speech', exam_id, student_id, segment)
+    dashboard.update(exam_id, student_id, audio=url,
+                     speech={'start': segment['start'], 'duration': segment['duration'], 'rms': segment['rms']})
+
+voice_activity = VoiceActivity(audio_streams, on_speech=emit_speech,
+                               workers=int(os.environ.get('AUDIO_VAD_WORKERS', '2')),
+                               threshold_db=float(os.environ.get('AUDIO_VAD_THRESHOLD_DB', '-50')))
+# Parsed exam options; start_exam/end_exam write through, other workers catch up after the TTL.
+exam_state = ExamStateCache()
+
+# Joins are admitted at JOIN_ADMIT_RATE per second; each admitted socket gets the options
+# pushed to it alone, and the teacher gets aggregated ready counts (see admission.py).
+ready_counts = ReadyCounts(registry)
+
+# Each admitted student gets its exam's screenshot capture profile, which is re-negotiated every
+# CAPTURE_PROFILE_INTERVAL from exam size, media ingest and event-loop lag (see capture_profile.py).
+def push_capture_profile(exam_id, profile, sids):
+    for sid in sids:
+        socketio.emit('capture_profile', profile, room=sid)
+    app.logger.info(f'Capture profile for exam {exam_id} is now level {profile["level"]}')
+
+capture_profiles = CaptureProfiles(ingest_budget=float(os.environ.get('CAPTURE_INGEST_BUDGET', '4e6')),
+                                   lag_budget=float(os.environ.get('CAPTURE_LAG_BUDGET', '0.1')),
+                                   tick=float(os.environ.get('CAPTURE_PROFILE_INTERVAL', '5')),
+                                   count=lambda exam_id: registry.counts(exam_id)['joined'],
+                                   lag_probe=getattr(socketio, 'loop_lag', None), on_change=push_capture_profile)
+
+def admit_student(exam_id, student_id, sid):
+    ready_counts.joined(exam_id, student_id)
+    socketio.emit('capture_profile', capture_profiles.attach(exam_id, student_id, sid), room=sid)
+    state = exam_state.get(exam_id)
+    if state and state.options:
+        socketio.emit('options_push', state.options, room=sid)
+    else:
+        app.logger.warning(f'No options found for exam {exam_id}')
+
+def dashboard_snapshot(exam_id):
+    return {'students': dashboard.snapshot(exam_id), 'ready': dict(ready_counts.counts(exam_id), newStudents=[])}
+
+def push_dashboard():
+    frames = {exam_id: {'students': students} for exam_id, students in dashboard.flush()}
+    for exam_id, counts in ready_counts.flush():
+        frames.setdefault(exam_id, {'students': {}})['ready'] = counts
+    for exam_id, frame in frames.items():
+        socketio.emit('dashboard', frame, room=proctor_room(exam_id))
+    # Teachers whose send queue shed a frame get the full state instead.
+    for eio_sid in send_queues.take_resyncs():
+        sid = socketio.server.manager.sid_from_eio_sid(eio_sid, '/')
+        exam_id = sid and registry.socket_exam(sid)
+        if exam_id:
+            socketio.emit('dashboard', dashboard_snapshot(exam_id), room=sid)
+
+def emit_dashboard():
+    while True:
+        try:
+            push_dashboard()
+        except Exception:
+            app.logger.exception('Dashboard push failed')
+        socketio.sleep(DASHBOARD_INTERVAL)
+
+admission = AdmissionQueue(rate=float(os.environ.get('JOIN_ADMIT_RATE', '100')), on_admit=admit_student)
+socketio.start_background_task(admission.run, socketio.sleep)
+socketio.start_background_task(emit_dashboard)
+socketio.start_background_task(capture_profiles.run, socketio.sleep)
+
+# Chunked uploads nobody finished (a tab closed mid-upload) are discarded after UPLOAD_TTL seconds;
+# streamed recordings that never got their final segment keep what was appended.
+UPLOAD_TTL = int(os.environ.get('UPLOAD_TTL', '86400'))
+
+def sweep_uploads():
+    while True:
+        socketio.sleep(min(UPLOAD_TTL, 3600))
+        try:
+            aborted = chunk_ingest.abort_stale(UPLOAD_TTL) + segment_stream.abort_stale(UPLOAD_TTL)
+        except Exception:
+            app.logger.exception('Upload sweep failed')
+            continue
+        if aborted:
+            app.logger.info(f'Discarded {aborted} abandoned uploads')
+
+socketio.start_background_task(sweep_uploads)
 
 # Hardcoded auth
 TEACHER_USER = 'admin'
@@ -87,6 +232,7 @@ TEACHER_HTML = """
         .status-indicator { font-size: 0.9em; color: #fff; padding: 5px; border-radius: 5px; }
         .status-active { background-color: green; }
         .status-tab-changed { background-color: orange; }
+        .status-stale { background-color: gray; }
         .status-disconnected { background-color: red; }
         .audio-player { max-width: 100%; }
     </style>
@@ -106,6 +252,7 @@ TEACHER_HTML = """
         <div class="form-check"><label class="form-check-label"><input type="checkbox" class="form-check-input" id="record"> Record</label></div>
         <div id="examId" class="alert alert-info mt-3"></div>
         <h3>Student Dashboard</h3>
+        <div id="readyCount" class="mb-2"></div>
         <div id="studentDashboard" class="row"></div>
         <div id="recordings" class="mt-3"></div>
     </div>
@@ -149,52 +296,83 @@ TEACHER_HTML = """
             document.getElementById('examId').innerHTML += ' - ACTIVE';
         });
 
-        socket.on('student_joined', (data) => {
-            updateStudentCard(data.studentId, 'Joined', 'status-active');
-        });
-
-        socket.on('tab_change', (data) => {
-            updateStudentCard(data.studentId, 'Tab Changed', 'status-tab-changed');
-        });
-
-        socket.on('screenshot', (data) => {
-            updateStudentCard(data.studentId, 'Active', 'status-active', data.screenshot, data.timestamp);
+        socket.on('recording_saved', (data) => {
+            document.getElementById('recordings').innerHTML += `<div class="alert alert-info">Recording saved: <a href="/download/${data.filename}" target="_blank">${data.filename}</a></div>`;
         });
 
-        socket.on('audio_chunk', (data) => {
-            updateStudentCard(data.studentId, 'Active', 'status-active', null, data.timestamp, data.audio);
+        socket.on('status', (data) => {
+            console.log('Status:', data.msg);
         });
 
-        socket.on('recording_saved', (data) => {
-            document.getElementById('recordings').innerHTML += `<div class="alert alert-info">Recording saved: <a href="/download/${data.filename}" target="_blank">${data.filename}</a></div>`;
-        });
+        const statusLabels = {
+            joined: ['Joined', 'status-active'],
+            active: ['Active', 'status-active'],
+            tab_changed: ['Tab Changed', 'status-tab-changed'],
+            stale: ['No heartbeat', 'status-stale'],
+            disconnected: ['Disconnected', 'status-disconnected']
+        };
 
-        socket.on('student_leave', (data) => {
-            updateStudentCard(data.studentId, 'Disconnected', 'status-disconnected');
+        // One frame per interval, holding only the students (and fields) that changed.
+        socket.on('dashboard', (frame) => {
+            if (frame.ready) {
+                document.getElementById('readyCount').innerHTML = `${frame.ready.ready} of ${frame.ready.joined} students ready`;
+                frame.ready.newStudents.forEach(studentId => updateStudentCard(studentId, {status: 'joined'}));
+            }
+            Object.entries(frame.students).forEach(([studentId, changes]) => updateStudentCard(studentId, changes));
         });
 
-        socket.on('status', (data) => {
-            console.log('Status:', data.msg);
+        socket.on('presence_snapshot', (data) => {
+            Object.entries(data).forEach(([studentId, state]) => updateStudentCard(studentId, {status: state}));
         });
 
-        function updateStudentCard(studentId, status, statusClass, screenshot = null, timestamp = null, audio = null) {
+        function studentCard(studentId) {
             let card = document.getElementById(`student-${studentId}`);
-            if (!card) {
-                card = document.createElement('div');
-                card.id = `student-${studentId}`;
-                card.className = 'col-md-4 student-card';
-                document.getElementById('studentDashboard').appendChild(card);
-            }
+            if (card) return card;
+            card = document.createElement('div');
+            card.id = `student-${studentId}`;
+            card.className = 'col-md-4 student-card';
             card.innerHTML = `
                 <div class="card">
-                    <div class="card-header">Student ${studentId}</div>
+                    <div class="card-header"></div>
                     <div class="card-body">
-                        <p>Status: <span class="status-indicator ${statusClass}">${status}</span></p>
-                        ${screenshot ? `<img src="data:image/png;base64,${screenshot}" class="card-img-top" alt="Screenshot" style="max-width: 100%;">` : ''}
-                        ${audio ? `<audio class="audio-player" controls><source src="data:audio/webm;base64,${audio}" type="audio/webm"></audio>` : ''}
-                        ${timestamp ? `<p>Last Update: ${timestamp}</p>` : ''}
+                        <p>Status: <span class="status-indicator"></span> <span class="tab-changes"></span></p>
+                        <img class="card-img-top" alt="Screenshot" style="max-width: 100%; display: none;">
+                        <p class="speech"></p>
+                        <audio class="audio-player" controls style="display: none;"></audio>
+                        <p class="last-seen"></p>
                     </div>
                 </div>`;
+            card.querySelector('.card-header').textContent = `Student ${studentId}`;
+            document.getElementById('studentDashboard').appendChild(card);
+            return card;
+        }
+
+        // Only the changed parts of a card are touched, so images and players are not rebuilt.
+        function updateStudentCard(studentId, changes) {
+            const card = studentCard(studentId);
+            if (changes.status) {
+                const [label, statusClass] = statusLabels[changes.status] || [changes.status, 'status-active'];
+                const indicator = card.querySelector('.status-indicator');
+                indicator.textContent = label;
+                indicator.className = `status-indicator ${statusClass}`;
+            }
+            if (changes.tabChanges) card.querySelector('.tab-changes').textContent = `(${changes.tabChanges} tab changes)`;
+            if (changes.screenshot) {
+                const img = card.querySelector('img');
+                img.src = changes.screenshot;
+                img.style.display = '';
+            }
+            if (changes.speech) {
+                card.querySelector('.speech').textContent = `Speech detected (${changes.speech.duration.toFixed(1)} s, ${changes.speech.rms} dBFS)`;
+            }
+            if (changes.audio) {
+                const player = card.querySelector('audio');
+                if (player.paused) player.src = changes.audio;  // never cut off a clip the teacher is listening to
+                player.style.display = '';
+            }
+            if (changes.lastSeen) {
+                card.querySelector('.last-seen').textContent = `Last seen: ${new Date(changes.lastSeen).toLocaleTimeString()}`;
+            }
         }
     </script>
 </body>
@@ -263,7 +441,7 @@ STUDENT_HTML = """
 
         socket.on('options_push', (data) => {
             console.log('Received options:', data);
-            const options = data;
+            options = data;
             const cameraCheckbox = document.getElementById('camera');
             const micCheckbox = document.getElementById('mic');
             const screenCheckbox = document.getElementById('screen');
@@ -283,7 +461,14 @@ STUDENT_HTML = """
         let chunkSize = 1024 * 1024; // 1MB
         let currentChunk = 0;
         let totalChunks = 0;
-        let screenshotInterval;
+        let screenshotTimer = null;
+        // Set by the server from its current load and re-sent when that changes (see capture_profile.py).
+        let captureProfile = {format: 'image/webp', quality: 0.8, scale: 0.5, interval: 5000};
+
+        socket.on('capture_profile', (profile) => {
+            console.log('Capture profile:', profile);
+            captureProfile = profile;
+        });
 
         document.getElementById('confirmOptions').onclick = async () => {
             console.log('Start Exam clicked');
@@ -292,9 +477,13 @@ STUDENT_HTML = """
             document.getElementById('testIframe').style.display = 'block';
             await initMedia();
             document.getElementById('status').innerHTML = 'Exam Started - Do not switch tabs or leave the page!';
-            if (options.record && (streams.camera || streams.mic || streams.screen)) mediaRecorder.start();
+            if (options.record && (streams.camera || streams.mic || streams.screen)) {
+                if (streamRecording) mediaRecorder.start(segmentMs);
+                else mediaRecorder.start();
+            }
             if (options.mic) audioRecorder.start(10000); // Send audio every 10s
-            if (options.screen || options.camera) screenshotInterval = setInterval(captureScreenshot, 5000);
+            // Start at a random point so a class that starts together does not capture in lockstep.
+            if (options.screen || options.camera) scheduleScreenshot(Math.random() * captureProfile.interval);
         };
 
         async function initMedia() {
@@ -310,12 +499,9 @@ STUDENT_HTML = """
                     audioRecorder = new MediaRecorder(audioStream, {mimeType: 'audio/webm'});
                     audioRecorder.ondataavailable = async (event) => {
                         if (event.data.size > 0) {
-                            const reader = new FileReader();
-                            reader.onload = () => {
-                                const audio = reader.result.split(',')[1];
-                                socket.emit('audio_chunk', {examId, studentId, audio, timestamp: new Date().toISOString()});
-                            };
-                            reader.readAsDataURL(event.data);
+                            // Sent as a Socket.IO binary attachment, not base64 in JSON
+                            const audio = await event.data.arrayBuffer();
+                            socket.emit('audio_chunk', {examId, studentId, audio, timestamp: new Date().toISOString()});
                         }
                     };
                 }
@@ -332,8 +518,12 @@ STUDENT_HTML = """
                 if (options.record && tracks.length > 0) {
                     const combined = new MediaStream(tracks);
                     mediaRecorder = new MediaRecorder(combined, {mimeType: 'video/webm'});
-                    mediaRecorder.ondataavailable = handleChunk;
-                    mediaRecorder.onstop = finalizeUpload;
+                    if (streamRecording) {
+                        mediaRecorder.ondataavailable = handleSegment;
+                    } else {
+                        mediaRecorder.ondataavailable = handleChunk;
+                        mediaRecorder.onstop = () => { chunkedUpload = finalizeUpload(); };
+                    }
                     console.log('MediaRecorder initialized');
                 }
                 
@@ -355,40 +545,129 @@ STUDENT_HTML = """
             if (event.data.size > 0) recordedChunks.push(event.data);
         }
 
-        function finalizeUpload() {
+        // Streaming mode: each timeslice is uploaded as soon as it is recorded and appended to
+        // the recording server-side, so nothing accumulates in memory and a crashed tab loses
+        // at most one segment. The segment delivered after stop() is marked final.
+        const streamRecording = true;
+        const segmentMs = 5000;
+        const recordingName = `${examId}_${studentId}_${Date.now()}.webm`;
+        let segmentSeq = 0;
+        let segmentUploads = Promise.resolve();
+        let failedSegments = 0;
+        let chunkedUpload = Promise.resolve();
+
+        function handleSegment(event) {
+            const final = mediaRecorder.state === 'inactive';
+            if (event.data.size === 0 && !final) return;
+            sendSegment(segmentSeq++, event.data, final);
+        }
+
+        function sendSegment(seq, data, final) {
+            const formData = new FormData();
+            formData.append('examId', examId);
+            formData.append('studentId', studentId);
+            formData.append('filename', recordingName);
+            formData.append('seq', seq);
+            formData.append('final', final ? '1' : '0');
+            formData.append('segment', data);
+            segmentUploads = segmentUploads.then(async () => {
+                for (let attempt = 0; attempt < 5; attempt++) {
+                    try {
+                        const res = await fetch('/append_segment', {method: 'POST', body: formData});
+                        if (res.ok) return;
+                    } catch (err) {
+                        console.error(`Segment ${seq} upload failed:`, err);
+                    }
+                    await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
+                }
+                // Given up: the server skips the gap once later segments pile up behind it.
+                console.error(`Segment ${seq} could not be uploaded; the recording will skip it`);
+                failedSegments++;
+            });
+        }
+
+        // Resolves once the recorder has delivered its last data and every upload has settled.
+        function stopRecording() {
+            const uploads = () => streamRecording ? segmentUploads : chunkedUpload;
+            if (!mediaRecorder || mediaRecorder.state === 'inactive') return uploads();
+            return new Promise(resolve => {
+                mediaRecorder.addEventListener('stop', () => resolve(uploads()), {once: true});
+                mediaRecorder.stop();
+            });
+        }
+
+        const uploadConcurrency = 6;
+        const uploadRetries = 3;
+
+        async function finalizeUpload() {
             const blob = new Blob(recordedChunks, {type: 'video/webm'});
             totalChunks = Math.ceil(blob.size / chunkSize);
-            uploadChunk(blob, 0);
+            const filename = `${examId}_${studentId}_${Date.now()}.webm`;
+            // Chunks are written at their own offsets server-side, so several can be in flight at
+            // once. Anything still missing afterwards (per the server's manifest) is re-sent.
+            let pending = [...Array(totalChunks).keys()];
+            for (let attempt = 0; attempt <= uploadRetries && pending.length; attempt++) {
+                await uploadChunks(blob, filename, pending);
+                const query = new URLSearchParams({examId, studentId, filename});
+                const res = await fetch(`/upload_status?${query}`);
+                pending = res.ok ? (await res.json()).missing : pending;
+            }
+            if (pending.length) alert(`Upload incomplete: ${pending.length} chunks failed`);
+        }
+
+        async function uploadChunks(blob, filename, indexes) {
+            const queue = [...indexes];
+            const worker = async () => {
+                while (queue.length) {
+                    const chunkIndex = queue.shift();
+                    try {
+                        await uploadChunk(blob, filename, chunkIndex);
+                    } catch (err) {
+                        console.error(`Upload of chunk ${chunkIndex} failed:`, err);
+                    }
+                }
+            };
+            await Promise.all(Array.from({length: uploadConcurrency}, worker));
         }
 
-        function uploadChunk(blob, chunkIndex) {
+        async function uploadChunk(blob, filename, chunkIndex) {
             const start = chunkIndex * chunkSize;
             const end = Math.min(start + chunkSize, blob.size);
-            const chunk = blob.slice(start, end);
             const formData = new FormData();
             formData.append('examId', examId);
             formData.append('studentId', studentId);
-            formData.append('chunk', chunk);
+            formData.append('chunk', blob.slice(start, end));
             formData.append('chunkIndex', chunkIndex);
             formData.append('totalChunks', totalChunks);
-            formData.append('filename', `${examId}_${studentId}_${Date.now()}.webm`);
+            formData.append('filename', filename);
+            const res = await fetch('/upload_chunk', {method: 'POST', body: formData});
+            const data = await res.json();
+            if (!data.success) throw new Error(data.error);
+            return data;
+        }
 
-            fetch('/upload_chunk', {method: 'POST', body: formData}).then(res => res.json()).then(data => {
-                if (data.success && chunkIndex < totalChunks - 1) {
-                    uploadChunk(blob, chunkIndex + 1);
-                }
-            }).catch(err => {
-                console.error('Upload error:', err);
-                alert('Upload failed: ' + err.message);
-            });
+        // Each capture reads the profile afresh, so a new interval applies from the next one.
+        function scheduleScreenshot(delay) {
+            screenshotTimer = setTimeout(async () => {
+                await captureScreenshot();
+                if (screenshotTimer) scheduleScreenshot(captureProfile.interval);
+            }, delay);
+        }
+
+        function stopScreenshots() {
+            clearTimeout(screenshotTimer);
+            screenshotTimer = null;
         }
 
         async function captureScreenshot() {
             try {
-                const canvas = await html2canvas(document.body, {scale: 0.5});
-                const dataUrl = canvas.toDataURL('image/png');
-                const screenshot = dataUrl.split(',')[1];
-                socket.emit('screenshot', {examId, studentId, screenshot, timestamp: new Date().toISOString()});
+                const {format, quality, scale} = captureProfile;
+                const canvas = await html2canvas(document.body, {scale});
+                let blob = await new Promise(resolve => canvas.toBlob(resolve, format, quality));
+                // Browsers without a WebP encoder hand back a PNG instead; JPEG is much smaller.
+                if (blob.type !== format) blob = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', quality));
+                const screenshot = await blob.arrayBuffer();
+                socket.emit('screenshot', {examId, studentId, screenshot, mimeType: blob.type, timestamp: new Date().toISOString()});
             } catch (err) {
                 console.error('Screenshot failed:', err);
             }
@@ -397,15 +676,17 @@ STUDENT_HTML = """
         window.onbeforeunload = () => {
             if (mediaRecorder && mediaRecorder.state === 'recording') mediaRecorder.stop();
             if (audioRecorder && audioRecorder.state === 'recording') audioRecorder.stop();
-            if (screenshotInterval) clearInterval(screenshotInterval);
+            stopScreenshots();
             socket.emit('student_leave', {examId, studentId});
         };
 
-        socket.on('exam_ended', () => {
+        socket.on('exam_ended', async () => {
             alert('Exam ended by teacher.');
-            if (mediaRecorder) mediaRecorder.stop();
-            if (audioRecorder) audioRecorder.stop();
-            if (screenshotInterval) clearInterval(screenshotInterval);
+            if (audioRecorder && audioRecorder.state !== 'inactive') audioRecorder.stop();
+            stopScreenshots();
+            document.getElementById('status').innerHTML = 'Exam ended - uploading the rest of your recording...';
+            await stopRecording();
+            if (failedSegments) alert(`Recording incomplete: ${failedSegments} segments failed to upload`);
             window.location = '/login';
         });
     </script>
@@ -439,18 +720,23 @@ def student():
     if not exam_id:
         return redirect(url_for('login'))
     student_id = str(uuid.uuid4())[:8]
+    # Uploads are only accepted from the session that was handed this student id.
+    session['exam_id'] = exam_id
+    session['student_id'] = student_id
     return render_template_string(STUDENT_HTML, student_id=student_id)
 
+def owns_upload(exam_id, student_id, filename):
+    # The student page names its uploads <examId>_<studentId>_<ms>.webm
+    return (exam_id and student_id and session.get('exam_id') == exam_id and session.get('student_id') == student_id
+            and filename.startswith(f'{exam_id}_{student_id}_'))
+
 @app.route('/create_exam')
 def create_exam():
     if not session.get('is_teacher'):
-        return jsonify({'error': 'Unauthorized'}, 401)
+        return jsonify({'error': 'Unauthorized'}), 401
     exam_id = str(uuid.uuid4())[:8]
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("INSERT INTO exams (id, active, created_at) VALUES (?, 0, ?)", (exam_id, datetime.now().isoformat()))
-    conn.commit()
-    conn.close()
+    db.execute("INSERT INTO exams (id, active, created_at) VALUES (?, 0, ?)", (exam_id, datetime.now().isoformat()))
+    exam_state.invalidate(exam_id)
     app.logger.info(f'Exam created: {exam_id}')
     return jsonify({'exam_id': exam_id})
 
@@ -463,132 +749,285 @@ def upload_chunk():
     total_chunks = int(request.form['totalChunks'])
     filename = request.form['filename']
     secure_name = secure_filename(filename)
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_name)
+    if not owns_upload(exam_id, student_id, secure_name):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
 
     try:
-        with open(filepath, 'ab') as f:
-            f.seek(chunk_index * (1024 * 1024))
-            chunk.save(f)
-
-        if chunk_index == total_chunks - 1:
-            conn = sqlite3.connect(DB_FILE)
-            c = conn.cursor()
-            c.execute("INSERT INTO recordings (id, exam_id, student_id, filename, uploaded_at) VALUES (?, ?, ?, ?, ?)",
-                      (str(uuid.uuid4())[:8], exam_id, student_id, secure_name, datetime.now().isoformat()))
-            conn.commit()
-            conn.close()
-            socketio.emit('recording_saved', {'filename': secure_name}, room=exam_id)
+        status = chunk_ingest.write_chunk(secure_name, chunk_index, total_chunks, chunk.stream.read())
+        if status['finalized']:
+            db.execute("INSERT INTO recordings (id, exam_id, student_id, filename, uploaded_at) VALUES (?, ?, ?, ?, ?)",
+                       (str(uuid.uuid4())[:8], exam_id, student_id, secure_name, datetime.now().isoformat()))
+            socketio.emit('recording_saved', {'filename': secure_name}, room=proctor_room(exam_id))
             app.logger.info(f'Recording saved: {secure_name} for student {student_id} in exam {exam_id}')
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'received': status['received'], 'total': status['total'],
+                        'complete': status['complete']})
+    except UploadTooLarge as e:
+        return jsonify({'success': False, 'error': str(e)}), 413
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         app.logger.error(f'Upload chunk failed: {str(e)}')
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/append_segment', methods=['POST'])
+def append_segment():
+    exam_id = request.form['examId']
+    student_id = request.form['studentId']
+    secure_name = secure_filename(request.form['filename'])
+    if not owns_upload(exam_id, student_id, secure_name):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    try:
+        segment = request.files['segment'].stream.read(segment_stream.max_segment_bytes + 1)
+        status = segment_stream.append(secure_name, int(request.form['seq']), segment,
+                                       final=request.form.get('final') == '1')
+        if status['started']:
+            # Recorded up front so a partial recording from a crashed tab is still listed.
+            db.execute("INSERT INTO recordings (id, exam_id, student_id, filename, uploaded_at) VALUES (?, ?, ?, ?, ?)",
+                       (str(uuid.uuid4())[:8], exam_id, student_id, secure_name, datetime.now().isoformat()))
+        if status['finalized']:
+            socketio.emit('recording_saved', {'filename': secure_name}, room=proctor_room(exam_id))
+            app.logger.info(f'Recording saved: {secure_name} ({status["size"]} bytes) for student {student_id} in exam {exam_id}')
+            if status['skipped']:
+                app.logger.warning(f'Recording {secure_name} is missing {status["skipped"]} segments the client gave up on')
+        return jsonify({'success': True, 'nextSeq': status['next_seq'], 'complete': status['complete']})
+    except UploadTooLarge as e:
+        return jsonify({'success': False, 'error': str(e)}), 413
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f'Append segment failed: {str(e)}')
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/upload_status')
+def upload_status():
+    secure_name = secure_filename(request.args.get('filename', ''))
+    if not owns_upload(request.args.get('examId'), request.args.get('studentId'), secure_name):
+        return jsonify({'error': 'Unauthorized'}), 401
+    status = chunk_ingest.status(secure_name)
+    if status is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+    return jsonify(status)
+
+@app.route('/metrics')
+def metrics():
+    if not session.get('is_teacher'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    report = {
+        'journal': dict(journal.stats, queued=journal.qsize()),
+        'screenshot_dedup': screenshot_dedup.report(),
+        'screenshot_store': screenshot_store.report(),
+        'exam_cache': exam_state.report(),
+        'admission': admission.report(),
+        'dashboard': dashboard.report(),
+        'capture_profiles': capture_profiles.report(),
+        'rate_limits': limiter.report(),
+        'send_queues': send_queues.report(),
+        'audio': audio_streams.report(),
+        'voice_activity': voice_activity.report(),
+    }
+    if hasattr(socketio, 'report'):
+        report['gateway'] = socketio.report()
+    return jsonify(report)
+
+@app.route('/screenshots/<exam_id>')
+def list_screenshots(exam_id):
+    if not session.get('is_teacher'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    rows = db.fetchall("SELECT ts, student_id, payload FROM events WHERE exam_id=? AND type='screenshot' ORDER BY ts",
+                       (exam_id,))
+    refs = [(ts, student_id, json.loads(payload)['ref']) for ts, student_id, payload in rows]
+    return jsonify([{'timestamp': ts, 'studentId': student_id, 'ref': ref, 'url': screenshot_url(exam_id, ref)}
+                    for ts, student_id, ref in refs])
+
+def screenshot_url(exam_id, digest):
+    return f'/screenshots/{exam_id}/{digest}'
+
+@app.route('/screenshots/<exam_id>/<digest>')
+def get_screenshot(exam_id, digest):
+    if not session.get('is_teacher'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    if not DIGEST_RE.match(digest):
+        return jsonify({'error': 'Not found'}), 404
+    data = screenshot_store.get(exam_id, digest)
+    if data is None:
+        return jsonify({'error': 'Not found'}), 404
+    response = make_response(data)
+    response.headers['Content-Type'] = sniff_mimetype(data[:12])
+    # The URL is the content hash, so the response can never change.
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    response.set_etag(digest)
+    return response.make_conditional(request)
+
+def audio_url(exam_id, student_id, seconds=AUDIO_TAIL_SECONDS):
+    return f'/audio/{exam_id}/{student_id}?last={seconds}'
+
+@app.route('/audio/<exam_id>/<student_id>')
+def get_audio(exam_id, student_id):
+    if not session.get('is_teacher'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    if 'start' in request.args:
+        # One speech segment (see voice_activity.py), by media time in ms.
+        clip = audio_streams.clip(exam_id, student_id, request.args.get('start', type=int),
+                                  request.args.get('end', type=int), session=request.args.get('session', type=int))
+        if clip is None:
+            return jsonify({'error': 'Not found'}), 404
+        path, ranges, _ = clip
+    elif 'last' in request.args:
+        tail = audio_streams.tail(exam_id, student_id, request.args.get('last', AUDIO_TAIL_SECONDS, type=float))
+        if tail is None:
+            return jsonify({'error': 'Not found'}), 404
+        path, ranges = tail
+    else:
+        path = audio_streams.latest(exam_id, student_id)
+        if path is None:
+            return jsonify({'error': 'Not found'}), 404
+        return send_file(path, mimetype='audio/webm', conditional=True, etag=True, max_age=0)
+    # Initialization segment + the selected clusters, streamed with positioned reads.
+    response = Response(read_ranges(path, ranges), mimetype='audio/webm')
+    response.headers['Content-Length'] = str(sum(end - start for start, end in ranges))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 @app.route('/download/<filename>')
 def download(filename):
     if not session.get('is_teacher'):
-        return jsonify({'error': 'Unauthorized'}, 401)
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        return jsonify({'error': 'Unauthorized'}), 401
+    # Range/If-Range/If-None-Match are answered by send_file's conditional handling, so the
+    # video player can seek without fetching the whole recording; the file is streamed in
+    # blocks (or handed to the server's sendfile-capable file_wrapper), never read whole.
+    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, mimetype='video/webm',
+                               conditional=True, etag=True, max_age=0)
 
 @socketio.on('join_teacher')
 def on_join_teacher(data):
     exam_id = data.get('examId')
     if exam_id:
-        join_room(exam_id)
-        emit('status', {'msg': 'Teacher joined'}, room=exam_id)
+        registry.bind_socket(current_sid(), exam_id)
+        join_room(proctor_room(exam_id))
+        emit('status', {'msg': 'Teacher joined'}, room=proctor_room(exam_id))
+        # Presence covers students on every worker (see registry.py); the dashboard snapshot,
+        # sent second so its richer status wins, covers this worker's students.
+        emit('presence_snapshot', registry.presence(exam_id))
+        emit('dashboard', dashboard_snapshot(exam_id))
         app.logger.info(f'Teacher joined exam: {exam_id}')
 
 @socketio.on('set_exam')
 def set_exam(data):
-    global exam_id
     exam_id = data['examId']
+    registry.bind_socket(current_sid(), exam_id)
+    join_room(proctor_room(exam_id))
     app.logger.info(f'Exam set: {exam_id}')
 
+@socketio.on('disconnect')
+def on_disconnect(reason=None):
+    registry.unbind_socket(current_sid())
+    limiter.forget(current_sid())
+
 @socketio.on('join_student')
 def on_join_student(data):
     exam_id = data['examId']
     student_id = data['studentId']
-    join_room(exam_id)
-    
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("INSERT OR IGNORE INTO students (id, exam_id, joined_at) VALUES (?, ?, ?)",
-              (student_id, exam_id, datetime.now().isoformat()))
-    c.execute("SELECT options FROM exams WHERE id=?", (exam_id,))
-    row = c.fetchone()
-    conn.commit()
-    conn.close()
+    join_room(student_room(exam_id))
     
+    journal.record('join', exam_id, student_id)
+    presence.touch(exam_id, student_id)
+    admission.submit(exam_id, student_id, current_sid())
     app.logger.info(f'Student {student_id} joined exam {exam_id}')
-    emit('student_joined', {'studentId': student_id}, room=exam_id)
-    if row and row[0]:
-        import json
-        options = json.loads(row[0])
-        emit('options_push', options, room=exam_id)
-        app.logger.info(f'Pushed options to exam {exam_id}: {options}')
-    else:
-        app.logger.warning(f'No options found for exam {exam_id}')
 
 @socketio.on('start_exam')
 def start_exam(data):
     exam_id = data['examId']
     options = data['options']
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    import json
-    c.execute("UPDATE exams SET options=?, active=1 WHERE id=?", (json.dumps(options), exam_id))
-    conn.commit()
-    conn.close()
-    emit('exam_started', {'examId': exam_id}, room=exam_id)
-    emit('options_push', options, room=exam_id)
+    started_at = datetime.now().isoformat()
+    db.execute("UPDATE exams SET options=?, active=1, started_at=? WHERE id=?", (json.dumps(options), started_at, exam_id))
+    exam_state.put(exam_id, ExamState(options, True, started_at))
+    emit('exam_started', {'examId': exam_id}, room=proctor_room(exam_id))
+    emit('options_push', options, room=student_room(exam_id))
     app.logger.info(f'Exam {exam_id} started with options: {options}')
 
 @socketio.on('end_exam')
 def end_exam(data):
     exam_id = data['examId']
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("UPDATE exams SET active=0 WHERE id=?", (exam_id,))
-    conn.commit()
-    conn.close()
-    emit('exam_ended', {}, room=exam_id)
+    # Options are cleared as in functions/db.end_exam, so late joiners are not prompted.
+    db.execute("UPDATE exams SET options='{}', active=0 WHERE id=?", (exam_id,))
+    started_at = (db.fetchone("SELECT started_at FROM exams WHERE id=?", (exam_id,)) or (None,))[0]
+    exam_state.put(exam_id, ExamState({}, False, started_at))
+    emit('exam_ended', {}, room=student_room(exam_id))
+    screenshot_store.drop_exam(exam_id)
+    ready_counts.drop_exam(exam_id)
+    dashboard.drop_exam(exam_id)
+    capture_profiles.drop_exam(exam_id)
     app.logger.info(f'Exam {exam_id} ended')
 
 @socketio.on('options_confirmed')
 def options_confirmed(data):
-    emit('status', {'msg': f'Student {data["studentId"]} confirmed'}, room=data['examId'])
+    journal.record('options_confirmed', data['examId'], data['studentId'])
+    ready_counts.ready(data['examId'], data['studentId'])
     app.logger.info(f'Student {data["studentId"]} confirmed options for exam {data["examId"]}')
 
 @socketio.on('tab_changed')
+@limiter.limit('tab_changed')
 def tab_changed(data):
-    emit('tab_change', {'studentId': data['studentId']}, room=data['examId'])
+    journal.record('tab_change', data['examId'], data['studentId'])
+    presence.touch(data['examId'], data['studentId'])
+    dashboard.tab_changed(data['examId'], data['studentId'])
     app.logger.info(f'Student {data["studentId"]} changed tab in exam {data["examId"]}')
 
 @socketio.on('heartbeat')
+@limiter.limit('heartbeat')
 def heartbeat(data):
-    emit('status', {'msg': f'Student {data["studentId"]} active'}, room=data['examId'])
+    journal.record('heartbeat', data['examId'], data['studentId'], block=False)
+    presence.touch(data['examId'], data['studentId'])
+    dashboard.seen(data['examId'], data['studentId'])
 
+# Screenshots are deduplicated and stored, and audio is appended to the student's stream;
+# the dashboard carries a URL to fetch either way.
 @socketio.on('screenshot')
+@limiter.limit('screenshot')
 def screenshot(data):
-    emit('screenshot', data, room=data['examId'])
-    app.logger.info(f'Screenshot received from student {data["studentId"]} in exam {data["examId"]}')
+    presence.touch(data['examId'], data['studentId'])
+    image = as_bytes(data.get('screenshot'))
+    if not image:  # a capture that produced nothing; the store refuses empty frames
+        return
+    capture_profiles.ingested(len(image))
+    if not screenshot_dedup.should_forward(data['examId'], data['studentId'], image):
+        dashboard.update(data['examId'], data['studentId'], status='active')
+        return
+    digest = screenshot_store.put(data['examId'], image)
+    journal.record('screenshot', data['examId'], data['studentId'], {'ref': digest})
+    dashboard.update(data['examId'], data['studentId'], status='active', screenshot=screenshot_url(data['examId'], digest))
+    app.logger.info(f'Screenshot received from student {data["studentId"]} in exam {data["examId"]} ({media_size(data.get("screenshot"))} bytes)')
 
 @socketio.on('audio_chunk')
+@limiter.limit('audio_chunk')
 def audio_chunk(data):
-    emit('audio_chunk', data, room=data['examId'])
-    app.logger.info(f'Audio chunk received from student {data["studentId"]} in exam {data["examId"]}')
+    presence.touch(data['examId'], data['studentId'])
+    audio = as_bytes(data.get('audio'))
+    capture_profiles.ingested(len(audio))
+    status = audio_streams.append(data['examId'], data['studentId'], audio)
+    if status is None:
+        app.logger.warning(f'Audio chunk without a stream header from student {data["studentId"]} in exam {data["examId"]}')
+        return
+    if voice_activity.enabled:
+        voice_activity.submit(data['examId'], data['studentId'], status['session'])
+    else:
+        dashboard.update(data['examId'], data['studentId'], audio=f'{audio_url(data["examId"], data["studentId"])}&v={status["size"]}')
+    app.logger.info(f'Audio chunk received from student {data["studentId"]} in exam {data["examId"]} ({media_size(data.get("audio"))} bytes)')
 
 @socketio.on('student_leave')
 def student_leave(data):
     exam_id = data['examId']
     student_id = data['studentId']
-    leave_room(exam_id)
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("DELETE FROM students WHERE id=? AND exam_id=?", (student_id, exam_id))
-    conn.commit()
-    conn.close()
-    emit('student_leave', {'studentId': student_id}, room=exam_id)
+    leave_room(student_room(exam_id))
+    journal.record('leave', exam_id, student_id)
+    presence.remove(exam_id, student_id)
+    admission.cancel(exam_id, student_id)
+    ready_counts.left(exam_id, student_id)
+    screenshot_dedup.forget(exam_id, student_id)
+    audio_streams.forget(exam_id, student_id)
+    voice_activity.forget(exam_id, student_id)
+    capture_profiles.detach(exam_id, student_id)
+    dashboard.update(exam_id, student_id, status='disconnected')
     app.logger.info(f'Student {student_id} left exam {exam_id}')
 
 if __name__ == '__main__':
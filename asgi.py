@@ -0,0 +1,29 @@
+"""ASGI entry point for the asyncio gateway (see gateway.py).
+
+    pip install -r requirements-server.txt
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+One process serves every socket. For more than one worker process, set
+``PROCTOR_MESSAGE_QUEUE`` so that rooms and emits are shared: ``memory://``
+between servers in one process, ``unix://`` between processes on one host
+and ``redis://`` across hosts (see backplane.py). Exam state then goes to
+the shared registry (see registry.py):
+
+    python -m backplane /tmp/proctor.sock &
+    export PROCTOR_MESSAGE_QUEUE=unix:///tmp/proctor.sock
+    uvicorn asgi:application --port 5001 & uvicorn asgi:application --port 5002 &
+
+Each worker needs its own port behind a sticky load balancer, or clients
+that use only the WebSocket transport.
+"""
+import os
+
+os.environ.setdefault('PROCTOR_GATEWAY', 'asgi')
+
+from app import socketio  # noqa: E402
+
+application = socketio.asgi_app
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(application, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
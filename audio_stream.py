@@ -0,0 +1,268 @@
+"""Server-side assembly of each student's microphone stream.
+
+MediaRecorder timeslices are pieces of one WebM file. Only the first piece
+carries the EBML header and track info (the initialization segment), so
+any later piece on its own is unplayable. Each student's pieces are
+therefore appended, in order, to one growing ``<n>.webm`` per recorder
+session under ``<root>/<exam>/<student>/``. A piece that begins with a new
+EBML header means the recorder was restarted, for example after a reload,
+and starts the next session file.
+
+While appending, the bytes are scanned for Cluster elements. Each cluster
+is a point where playback can start. Its file offset and timecode (in ms)
+go to an ``<n>.idx`` sidecar, one ``offset timecode`` line per cluster, so
+any worker can read it. ``tail(seconds)`` bisects that index. The newest
+N seconds are then the initialization segment plus the bytes from the
+last cluster that starts at or before the cutoff. Both are read from the
+file with positioned reads, so the response can be at most one cluster
+longer than requested.
+"""
+import bisect
+import os
+
+from werkzeug.utils import secure_filename
+
+from functions.keyed_locks import KeyedLocks
+
+EBML_MAGIC = b'\x1a\x45\xdf\xa3'
+CLUSTER_ID = b'\x1f\x43\xb6\x75'
+TIMECODE_ID = 0xE7
+TIMECODE_SCALE_ID = b'\x2a\xd7\xb1'
+DEFAULT_TIMECODE_SCALE = 1000000  # ns per timecode unit
+# Cluster ID + size + Timecode ID + size + value; kept from each piece's end in case a header straddles pieces.
+MAX_CLUSTER_HEADER = 4 + 8 + 1 + 8 + 8
+READ_BLOCK = 64 * 1024
+
+
+def _vint(buf, pos, keep_marker=False):
+    """EBML variable-length integer at ``pos``: ``(value, next_pos)``, or None if ``buf`` ends first."""
+    if pos >= len(buf):
+        return None
+    if not buf[pos]:
+        raise ValueError('invalid EBML length')
+    length = 9 - buf[pos].bit_length()
+    if pos + length > len(buf):
+        return None
+    value = buf[pos] if keep_marker else buf[pos] & (0xFF >> length)
+    for byte in buf[pos + 1:pos + length]:
+        value = value << 8 | byte
+    return value, pos + length
+
+
+def _uint(buf, pos, size):
+    return int.from_bytes(buf[pos:pos + size], 'big')
+
+
+def cluster_timecode(buf, pos):
+    """Timecode of the Cluster starting at ``pos``, None if not a cluster, or ``...`` if ``buf`` is too short."""
+    try:
+        return _cluster_timecode(buf, pos)
+    except ValueError:
+        return None  # the ID bytes occurred inside a frame
+
+
+def _cluster_timecode(buf, pos):
+    size = _vint(buf, pos + len(CLUSTER_ID))
+    if size is None:
+        return ...
+    element = _vint(buf, size[1], keep_marker=True)
+    if element is None:
+        return ...
+    if element[0] != TIMECODE_ID:
+        return None
+    length = _vint(buf, element[1])
+    if length is None or length[1] + length[0] > len(buf):
+        return ...
+    if not 1 <= length[0] <= 8:
+        return None
+    return _uint(buf, length[1], length[0])
+
+
+def timecode_scale(init):
+    pos = init.find(TIMECODE_SCALE_ID)
+    if pos < 0:
+        return DEFAULT_TIMECODE_SCALE
+    try:
+        size = _vint(init, pos + len(TIMECODE_SCALE_ID))
+    except ValueError:
+        return DEFAULT_TIMECODE_SCALE
+    if size is None or not 1 <= size[0] <= 8:
+        return DEFAULT_TIMECODE_SCALE
+    return _uint(init, size[1], size[0]) or DEFAULT_TIMECODE_SCALE
+
+
+def _session_numbers(directory):
+    return [int(name[:-5]) for name in os.listdir(directory) if name.endswith('.webm') and name[:-5].isdigit()]
+
+
+class _Session:
+    __slots__ = ('number', 'size', 'last_offset', 'first_ms', 'last_ms', 'tail', 'scale')
+
+    def __init__(self, number):
+        self.number = number
+        self.size = 0
+        self.last_offset = -1  # of the newest indexed cluster
+        self.first_ms = None
+        self.last_ms = None
+        self.tail = b''
+        self.scale = DEFAULT_TIMECODE_SCALE
+
+
+class AudioStreams:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)  # paths handed to send_file must not depend on the app root
+        self._sessions = {}  # (exam_id, student_id) -> _Session being appended by this worker
+        self._locks = KeyedLocks()
+        self.stats = {'chunks': 0, 'bytes': 0, 'clusters': 0, 'sessions': 0, 'headerless': 0, 'tails': 0}
+        os.makedirs(root, exist_ok=True)
+
+    def directory(self, exam_id, student_id):
+        return os.path.join(self.root, secure_filename(exam_id), secure_filename(student_id))
+
+    def append(self, exam_id, student_id, data):
+        """Append one recorder piece. Returns ``{'session', 'size', 'duration'}``, or None if it was dropped."""
+        key = (exam_id, student_id)
+        data = bytes(data)
+        with self._locks.hold(key):
+            session = self._sessions.get(key)
+            if data.startswith(EBML_MAGIC):
+                session = self._sessions[key] = self._new_session(exam_id, student_id)
+            elif session is None:
+                # The piece with the header never reached this worker; nothing can play without it.
+                self.stats['headerless'] += 1
+                return None
+            directory = self.directory(exam_id, student_id)
+            fd = os.open(os.path.join(directory, f'{session.number}.webm'), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+            clusters = self._scan(session, data)
+            if clusters:
+                with open(os.path.join(directory, f'{session.number}.idx'), 'a') as f:
+                    f.writelines(f'{offset} {timecode}\n' for offset, timecode in clusters)
+            self.stats['chunks'] += 1
+            self.stats['bytes'] += len(data)
+            self.stats['clusters'] += len(clusters)
+            return {'session': session.number, 'size': session.size, 'duration': self._duration(session)}
+
+    def _new_session(self, exam_id, student_id):
+        directory = self.directory(exam_id, student_id)
+        os.makedirs(directory, exist_ok=True)
+        numbers = _session_numbers(directory)
+        self.stats['sessions'] += 1
+        return _Session(max(numbers, default=-1) + 1)
+
+    def _scan(self, session, data):
+        """Index the clusters that start in ``data`` (or in the carried-over tail of the previous piece)."""
+        base = session.size - len(session.tail)
+        buf = session.tail + data
+        if session.size == 0:
+            first = buf.find(CLUSTER_ID)
+            session.scale = timecode_scale(buf[:first if first >= 0 else len(buf)])
+        clusters = []
+        pos = buf.find(CLUSTER_ID)
+        while pos >= 0:
+            if base + pos > session.last_offset:
+                timecode = cluster_timecode(buf, pos)
+                if timecode is ...:
+                    break  # finish it with the next piece
+                if timecode is not None:
+                    ms = timecode * session.scale // 1000000
+                    clusters.append((base + pos, ms))
+                    session.last_offset = base + pos
+                    session.last_ms = ms
+                    if session.first_ms is None:
+                        session.first_ms = ms
+            pos = buf.find(CLUSTER_ID, pos + 1)
+        session.size += len(data)
+        session.tail = buf[-MAX_CLUSTER_HEADER:]
+        return clusters
+
+    @staticmethod
+    def _duration(session):
+        return (session.last_ms - session.first_ms) / 1000 if session.first_ms is not None else 0.0
+
+    def latest(self, exam_id, student_id):
+        """Path of the newest session file, or None."""
+        return self.session_path(exam_id, student_id)
+
+    def session_path(self, exam_id, student_id, session=None):
+        """Path of session file ``session`` (default: the newest), or None if there is none."""
+        directory = self.directory(exam_id, student_id)
+        try:
+            numbers = _session_numbers(directory)
+        except FileNotFoundError:
+            return None
+        if session is None:
+            session = max(numbers, default=None)
+        return os.path.join(directory, f'{session}.webm') if session in numbers else None
+
+    @staticmethod
+    def _index(path):
+        offsets, timecodes = [], []
+        try:
+            with open(path[:-5] + '.idx') as f:
+                for line in f:
+                    offset, timecode = line.split()
+                    offsets.append(int(offset))
+                    timecodes.append(int(timecode))
+        except FileNotFoundError:
+            pass
+        return offsets, timecodes
+
+    def clip(self, exam_id, student_id, start_ms=None, end_ms=None, session=None):
+        """``(path, ranges, first_ms)`` for the clusters covering media time ``start_ms``..``end_ms``, or None.
+
+        ``ranges`` are byte ranges (end exclusive): the initialization segment, then the clusters
+        from the last one starting at or before ``start_ms``. ``first_ms`` is that cluster's timecode.
+        """
+        path = self.session_path(exam_id, student_id, session)
+        if path is None:
+            return None
+        return self._clip(path, *self._index(path), start_ms, end_ms)
+
+    @staticmethod
+    def _clip(path, offsets, timecodes, start_ms, end_ms):
+        end = os.path.getsize(path)
+        if not offsets:
+            return path, [(0, end)], 0
+        first = 0 if start_ms is None else max(0, bisect.bisect_right(timecodes, start_ms) - 1)
+        if end_ms is not None:
+            after = bisect.bisect_right(timecodes, end_ms)
+            if after < len(offsets):
+                end = offsets[after]
+        if first == 0:
+            return path, [(0, end)], timecodes[0]
+        return path, [(0, offsets[0]), (offsets[first], end)], timecodes[first]
+
+    def tail(self, exam_id, student_id, seconds):
+        """``(path, ranges)`` that play the newest ``seconds`` (see ``clip``), or None."""
+        path = self.latest(exam_id, student_id)
+        if path is None:
+            return None
+        offsets, timecodes = self._index(path)
+        self.stats['tails'] += 1
+        start_ms = timecodes[-1] - seconds * 1000 if timecodes else None
+        return self._clip(path, offsets, timecodes, start_ms, None)[:2]
+
+    def forget(self, exam_id, student_id):
+        self._sessions.pop((exam_id, student_id), None)
+
+    def report(self):
+        return dict(self.stats, streams=len(self._sessions))
+
+
+def read_ranges(path, ranges, block=READ_BLOCK):
+    """Yield the byte ranges of ``path`` in blocks, using positioned reads."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        for start, end in ranges:
+            while start < end:
+                data = os.pread(fd, min(block, end - start), start)
+                if not data:
+                    break
+                start += len(data)
+                yield data
+    finally:
+        os.close(fd)
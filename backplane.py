@@ -0,0 +1,254 @@
+"""Pluggable pub/sub backplane so several Socket.IO workers share rooms.
+
+Each worker keeps its own sockets. Every emit, and every room change for a
+socket that lives on another worker, is published on the backplane and
+replayed by the other workers (python-socketio's pub/sub client managers).
+``PROCTOR_MESSAGE_QUEUE`` selects the backend:
+
+- unset: single process, rooms in memory (the default).
+- ``memory://<name>``: an in-process hub. Several server instances in one
+  process share rooms, which lets tests run "workers" side by side.
+- ``unix:///path/to.sock``: a local broker for worker processes on one
+  host. Start it once with ``python -m backplane /path/to.sock``.
+- ``redis://host:6379/0``: Redis, for workers on several hosts (needs the
+  ``redis`` package).
+
+Exam-scoped state (rosters, ready counts, presence) is shared through
+registry.py, not through the backplane.
+
+Sticky sessions: Engine.IO long-polling sends each request of a session
+separately. All of them must reach the worker that owns the session, or
+the client gets "Invalid session" (400) errors. Either pin clients to a
+worker at the load balancer, or make clients use only the WebSocket
+transport (``io({transports: ['websocket']})``), which needs no stickiness.
+With nginx, run one worker per port and hash on the client address:
+
+    upstream proctor {
+        ip_hash;
+        server 127.0.0.1:5001;
+        server 127.0.0.1:5002;
+    }
+    location /socket.io/ {
+        proxy_pass http://proctor;
+        proxy_http_version 1.1;
+        proxy_set_header Upgrade $http_upgrade;
+        proxy_set_header Connection "upgrade";
+    }
+
+    python -m backplane /tmp/proctor.sock &
+    export PROCTOR_MESSAGE_QUEUE=unix:///tmp/proctor.sock PROCTOR_GATEWAY=asgi
+    uvicorn asgi:application --port 5001 & uvicorn asgi:application --port 5002 &
+
+Do not use ``uvicorn --workers N`` or ``gunicorn -w N`` on a single port:
+their load balancing is not sticky.
+"""
+import asyncio
+import json
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+CHANNEL = 'proctor'
+RECONNECT_DELAY = 1.0
+
+
+def make_client_manager(url=None, async_mode=False, channel=CHANNEL):
+    """Client manager for ``url`` (default: PROCTOR_MESSAGE_QUEUE), or None for in-process rooms."""
+    url = url if url is not None else os.environ.get('PROCTOR_MESSAGE_QUEUE')
+    if not url:
+        return None
+    scheme = urlparse(url).scheme
+    if scheme == 'memory':
+        cls = AsyncMemoryManager if async_mode else MemoryManager
+        return cls(urlparse(url).netloc or 'default', channel=channel)
+    if scheme == 'unix':
+        cls = AsyncUnixSocketManager if async_mode else UnixSocketManager
+        return cls(urlparse(url).path, channel=channel)
+    if scheme in ('redis', 'rediss'):
+        cls = socketio.AsyncRedisManager if async_mode else socketio.RedisManager
+        return cls(url, channel=channel)
+    raise ValueError(f'unsupported message queue URL: {url}')
+
+
+# In-process hub: every subscriber of a (hub, channel) gets its own queue.
+_hubs = defaultdict(list)
+_hubs_lock = threading.Lock()
+
+
+class MemoryManager(socketio.PubSubManager):
+    name = 'memory'
+
+    def __init__(self, hub='default', channel=CHANNEL, write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.key = (hub, channel)
+        self.inbox = queue.Queue()
+        with _hubs_lock:
+            _hubs[self.key].append(self.inbox)
+
+    def _publish(self, data):
+        with _hubs_lock:
+            subscribers = list(_hubs[self.key])
+        for inbox in subscribers:
+            inbox.put(data)
+
+    def _listen(self):
+        while True:
+            yield self.inbox.get()
+
+
+class AsyncMemoryManager(AsyncPubSubManager):
+    name = 'memory'
+
+    def __init__(self, hub='default', channel=CHANNEL, write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.key = (hub, channel)
+        self.inbox = asyncio.Queue()
+        with _hubs_lock:
+            _hubs[self.key].append(self.inbox)
+
+    async def _publish(self, data):
+        with _hubs_lock:
+            subscribers = list(_hubs[self.key])
+        for inbox in subscribers:
+            inbox.put_nowait(data)
+
+    async def _listen(self):
+        while True:
+            yield await self.inbox.get()
+
+
+# Broker protocol: a client first sends its role line, then newline-delimited JSON frames.
+PUBLISHER = b'pub\n'
+SUBSCRIBER = b'sub\n'
+
+
+def _frame(channel, data):
+    return (json.dumps([channel, data]) + '\n').encode()
+
+
+class UnixSocketManager(socketio.PubSubManager):
+    """Publishes on one connection to the broker and listens on another, reconnecting as needed."""
+    name = 'unix'
+
+    def __init__(self, path, channel=CHANNEL, write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self, role):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(self.path)
+        conn.sendall(role)
+        return conn
+
+    def _publish(self, data):
+        frame = _frame(self.channel, data)
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._conn is None:
+                        self._conn = self._connect(PUBLISHER)
+                    self._conn.sendall(frame)
+                    return
+                except OSError:
+                    self._conn = None
+                    if attempt:
+                        raise
+
+    def _listen(self):
+        while True:
+            try:
+                with self._connect(SUBSCRIBER) as conn, conn.makefile('rb') as lines:
+                    for line in lines:
+                        channel, data = json.loads(line)
+                        if channel == self.channel:
+                            yield data
+            except OSError as e:
+                self._get_logger().error(f'backplane broker unavailable ({e}), retrying')
+            time.sleep(RECONNECT_DELAY)
+
+
+class AsyncUnixSocketManager(AsyncPubSubManager):
+    name = 'unix'
+
+    def __init__(self, path, channel=CHANNEL, write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = path
+        self._writer = None
+        self._lock = None
+
+    async def _publish(self, data):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        frame = _frame(self.channel, data)
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None:
+                        _, self._writer = await asyncio.open_unix_connection(self.path)
+                        self._writer.write(PUBLISHER)
+                    self._writer.write(frame)
+                    await self._writer.drain()
+                    return
+                except OSError:
+                    self._writer = None
+                    if attempt:
+                        raise
+
+    async def _listen(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=2 ** 26)
+                writer.write(SUBSCRIBER)
+                try:
+                    while line := await reader.readline():
+                        channel, data = json.loads(line)
+                        if channel == self.channel:
+                            yield data
+                finally:
+                    writer.close()
+            except OSError as e:
+                self._get_logger().error(f'backplane broker unavailable ({e}), retrying')
+            await asyncio.sleep(RECONNECT_DELAY)
+
+
+async def serve_broker(path):
+    """Relay every frame a publisher sends to all connected subscribers."""
+    subscribers = set()
+
+    async def handle(reader, writer):
+        try:
+            role = await reader.readline()
+            if role == SUBSCRIBER:
+                subscribers.add(writer)
+                await reader.read()  # subscribers send nothing more; wait for them to go away
+            elif role == PUBLISHER:
+                while line := await reader.readline():
+                    for subscriber in list(subscribers):
+                        subscriber.write(line)
+                    await asyncio.gather(*(s.drain() for s in list(subscribers)), return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            subscribers.discard(writer)
+            writer.close()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(handle, path, limit=2 ** 26)
+    print(f'backplane broker listening on {path}')
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    asyncio.run(serve_broker(sys.argv[1] if len(sys.argv) > 1 else '/tmp/proctor.sock'))
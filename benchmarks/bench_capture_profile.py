@@ -0,0 +1,90 @@
+"""Screenshot ingest per exam size: fixed PNG capture against negotiated profiles.
+
+A synthetic exam page (text lines, a form and a photo-like block) is
+rendered at ``--width`` x ``--height`` and encoded with Pillow at each
+``LADDER`` rung, the way the browser would after html2canvas: scaled by
+the rung's ``scale``, as WebP or JPEG at its ``quality``. The old fixed
+capture (PNG at scale 0.5 every 5 s) is encoded the same way. For each
+exam size, the script reports the rung ``CaptureProfiles`` picks with no
+extra pressure, the bytes per frame, the ingest rate and the time to hash
+one frame for dedup.
+
+    pip install numpy Pillow
+    python benchmarks/bench_capture_profile.py --sizes 50,250,500,1000,2000
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from capture_profile import LADDER, CaptureProfiles  # noqa: E402
+from screenshot_dedup import dhash  # noqa: E402
+
+OLD = {'format': 'image/png', 'quality': 1.0, 'scale': 0.5, 'interval': 5000}
+
+
+def page(width, height, seed=3):
+    rng = np.random.default_rng(seed)
+    img = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((0, 0, width, 60), fill=(33, 37, 41))
+    for y in range(100, height - 80, 28):
+        x = 40
+        while x < width * 0.6:
+            w = int(rng.integers(20, 90))
+            draw.rectangle((x, y, x + w, y + 12), fill=(60, 60, 60))
+            x += w + 10
+    photo = rng.normal(128, 40, (height // 3, width // 4, 3)).clip(0, 255).astype(np.uint8)
+    img.paste(Image.fromarray(photo).resize((width // 4, height // 3)), (int(width * 0.7), 120))
+    return img
+
+
+def encode(img, profile):
+    scaled = img.resize((int(img.width * profile['scale']), int(img.height * profile['scale'])), Image.BILINEAR)
+    buf = io.BytesIO()
+    fmt = profile['format'].split('/')[1].upper()
+    if fmt == 'PNG':
+        scaled.save(buf, 'PNG')
+    else:
+        scaled.save(buf, fmt, quality=int(profile['quality'] * 100))
+    return buf.getvalue()
+
+
+def hash_ms(data, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        dhash(data)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='50,250,500,1000,2000')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    args = parser.parse_args()
+
+    img = page(args.width, args.height)
+    frames = [encode(img, profile) for profile in LADDER]
+    old = encode(img, OLD)
+    print(f'fixed PNG @0.5 every 5 s: {len(old) / 1e3:.0f} kB/frame, hash {hash_ms(old):.1f} ms')
+    for rung, (profile, data) in enumerate(zip(LADDER, frames)):
+        print(f'rung {rung}: {profile["format"]} q{profile["quality"]} @{profile["scale"]} every '
+              f'{profile["interval"] / 1000:g} s: {len(data) / 1e3:.0f} kB/frame, hash {hash_ms(data):.1f} ms')
+    print()
+    for students in (int(n) for n in args.sizes.split(',')):
+        profiles = CaptureProfiles(count=lambda exam_id: students)
+        rung = profiles.attach('bench', 's0', 'sid')['level']
+        before = students * len(old) / (OLD['interval'] / 1000)
+        after = students * len(frames[rung]) / (LADDER[rung]['interval'] / 1000)
+        print(f'{students:>5} students: rung {rung}, ingest {before / 1e6:6.2f} MB/s fixed -> {after / 1e6:5.2f} MB/s '
+              f'({100 * (1 - after / before):.0f}% less), {students * 1000 / LADDER[rung]["interval"]:.0f} frames/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Cold-start import profile of the Netlify function modules.
+
+Imports each handler module in fresh interpreters under ``-X importtime``
+and reports the wall time of the import (p50/p99 across runs), the slowest
+imports by cumulative time, and any SDK that got imported eagerly. Clients
+should be built on first use (functions/clients.py), not at import time.
+Exits non-zero when a module's p99 exceeds the budget or when an eager
+import is found, so it can gate a deploy.
+
+    python -m functions.templates   # as the Netlify build does
+    python benchmarks/bench_cold_start.py --runs 30 --budget-ms 150
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ['functions.student', 'functions.teacher', 'functions.upload_chunk', 'functions.download']
+# Nothing on the import path may pull these in; they are loaded lazily on first use.
+EAGER = ['flask', 'jinja2', 'werkzeug', 'pusher', 'boto3', 'botocore', 'faunadb']
+
+PROBE = """
+import json, sys, time
+t = time.perf_counter()
+import {module}
+t = time.perf_counter() - t
+print(json.dumps({{'ms': t * 1000, 'eager': sorted(m for m in {eager!r} if m in sys.modules)}}))
+"""
+
+
+def parse_importtime(stderr):
+    """``{module: cumulative_us}`` from ``-X importtime`` output."""
+    out = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+        out[name.strip()] = int(cumulative_us)
+    return out
+
+
+def run_once(module, env):
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE.format(module=module, eager=EAGER)],
+                          cwd=ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode:
+        raise RuntimeError(f'{module} failed to import:\n{proc.stderr.strip().splitlines()[-1]}')
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['imports'] = parse_importtime(proc.stderr)
+    return result
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--budget-ms', type=float, default=150.0)
+    parser.add_argument('--top', type=int, default=5)
+    parser.add_argument('--modules', nargs='+', default=MODULES)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    env = dict(os.environ, PROCTOR_DB=os.path.join(tmp, 'proctor.db'),
+               PUSHER_APP_ID='1', PUSHER_KEY='key', PUSHER_SECRET='secret', PUSHER_CLUSTER='eu')
+    env.pop('FAUNA_SECRET', None)
+    run_once(MODULES[0], env)  # warm the bytecode cache, as a deployed bundle would have
+    failed = False
+    for module in args.modules:
+        results = [run_once(module, env) for _ in range(args.runs)]
+        times = [r['ms'] for r in results]
+        p50, p99 = percentile(times, 50), percentile(times, 99)
+        eager = results[0]['eager']
+        over = p99 > args.budget_ms
+        failed |= over or bool(eager)
+        print(f'{module:24s} p50 {p50:7.1f} ms  p99 {p99:7.1f} ms  {"OVER BUDGET" if over else "ok"}')
+        if eager:
+            print(f'    eager SDK imports: {", ".join(eager)}')
+        imports = results[-1]['imports']
+        for name, us in sorted(imports.items(), key=lambda kv: -kv[1])[:args.top]:
+            print(f'    {us / 1000:7.1f} ms  {name}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
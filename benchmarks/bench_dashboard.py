@@ -0,0 +1,113 @@
+"""Teacher-bound messages for one exam: per-event relay against coalesced dashboard frames.
+
+Simulates ``--students`` students for ``--seconds`` on a virtual clock.
+Each student sends a heartbeat every 5 s, a screenshot every 5 s (half of
+them unchanged after dedup), an audio piece every 10 s, and now and then
+a tab change. The events are replayed two ways:
+
+- old: one proctor-room message per screenshot, screenshot_unchanged,
+  audio and tab_change event (heartbeats were not forwarded);
+- new: ``Dashboard.update``/``seen`` per event and one ``flush`` per
+  ``--interval``, each non-empty flush being one message.
+
+The script reports the message count and the JSON bytes for each, and the
+largest number of messages the teacher received in any one second.
+
+    python benchmarks/bench_dashboard.py --students 300 --seconds 120
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dashboard import Dashboard  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def schedule(students, seconds, rng):
+    events = []
+    for n in range(students):
+        student = f's{n}'
+        offset = rng.uniform(0, 5)
+        for t in range(int(seconds / 5)):
+            events.append((offset + t * 5, 'heartbeat', student))
+            events.append((offset + t * 5 + rng.uniform(0, 1), 'screenshot', student))
+        for t in range(int(seconds / 10)):
+            events.append((offset + t * 10 + rng.uniform(0, 1), 'audio', student))
+        for _ in range(rng.randrange(3)):
+            events.append((rng.uniform(0, seconds), 'tab_change', student))
+    return sorted(events)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=300)
+    parser.add_argument('--seconds', type=float, default=120.0)
+    parser.add_argument('--interval', type=float, default=1.0)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    events = schedule(args.students, args.seconds, rng)
+    clock = FakeClock()
+    dashboard = Dashboard(clock=clock)
+    old = {'messages': 0, 'bytes': 0}
+    new = {'messages': 0, 'bytes': 0}
+    old_per_second, new_per_second = Counter(), Counter()
+    next_flush = args.interval
+    shots = Counter()
+
+    def flush():
+        for _, students in dashboard.flush():
+            new['messages'] += 1
+            new['bytes'] += len(json.dumps({'students': students}))
+            new_per_second[int(clock.now)] += 1
+
+    for ts, kind, student in events:
+        while next_flush <= ts:
+            clock.now = next_flush
+            flush()
+            next_flush += args.interval
+        clock.now = ts
+        if kind == 'heartbeat':
+            dashboard.seen('bench', student)
+            continue
+        if kind == 'screenshot':
+            shots[student] += 1
+            if rng.random() < 0.5:
+                message = {'studentId': student, 'timestamp': ts}
+                dashboard.update('bench', student, status='active')
+            else:
+                url = f'/screenshots/bench/{student}-{shots[student]:064d}'
+                message = {'studentId': student, 'ref': url[-64:], 'timestamp': ts, 'url': url}
+                dashboard.update('bench', student, status='active', screenshot=url)
+        elif kind == 'audio':
+            url = f'/audio/bench/{student}?last=30&v={int(ts * 1600)}'
+            message = {'studentId': student, 'timestamp': ts, 'size': int(ts * 1600), 'duration': ts, 'url': url}
+            dashboard.update('bench', student, audio=url)
+        else:
+            message = {'studentId': student}
+            dashboard.tab_changed('bench', student)
+        old['messages'] += 1
+        old['bytes'] += len(json.dumps(message))
+        old_per_second[int(ts)] += 1
+    clock.now = next_flush
+    flush()
+
+    print(f'{args.students} students, {args.seconds:.0f} s, {len(events)} student events')
+    print(f'old: {old["messages"]} messages, {old["bytes"] / 1e6:.2f} MB, peak {max(old_per_second.values())}/s')
+    print(f'new: {new["messages"]} messages, {new["bytes"] / 1e6:.2f} MB, peak {max(new_per_second.values())}/s '
+          f'({dashboard.stats["coalesced"]} updates coalesced)')
+
+
+if __name__ == '__main__':
+    main()
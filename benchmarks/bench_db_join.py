@@ -0,0 +1,90 @@
+"""Join throughput: connect-per-statement vs. pooled WAL connections.
+
+Simulates the DB work of ``on_join_student`` (insert student + read options)
+from a pool of worker threads, the way Flask-SocketIO's threading mode runs
+handlers.
+
+    python benchmarks/bench_db_join.py --students 400 --threads 32
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from functions import sqlite_db  # noqa: E402
+
+INSERT_STUDENT = "INSERT OR IGNORE INTO students (id, exam_id, joined_at) VALUES (?, ?, ?)"
+SELECT_OPTIONS = "SELECT options FROM exams WHERE id=?"
+
+
+def setup(db_file, exam_id):
+    conn = sqlite3.connect(db_file)
+    for stmt in sqlite_db.SCHEMA:
+        conn.execute(stmt)
+    conn.execute("INSERT INTO exams (id, options, active, created_at) VALUES (?, ?, 1, ?)",
+                 (exam_id, '{"camera": true, "mic": true}', datetime.now().isoformat()))
+    conn.commit()
+    conn.close()
+
+
+def join_naive(db_file, exam_id):
+    # The pre-pooling code path: fresh connection, rollback journal, no busy retry.
+    conn = sqlite3.connect(db_file)
+    c = conn.cursor()
+    c.execute(INSERT_STUDENT, (str(uuid.uuid4()), exam_id, datetime.now().isoformat()))
+    c.execute(SELECT_OPTIONS, (exam_id,))
+    c.fetchone()
+    conn.commit()
+    conn.close()
+
+
+def join_pooled(db_file, exam_id):
+    with sqlite_db.transaction(db_file) as c:
+        c.execute(INSERT_STUDENT, (str(uuid.uuid4()), exam_id, datetime.now().isoformat()))
+        c.execute(SELECT_OPTIONS, (exam_id,)).fetchone()
+
+
+def run(name, fn, students, threads):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'bench.db')
+        exam_id = 'bench'
+        setup(db_file, exam_id)
+        errors = []
+        err_lock = threading.Lock()
+
+        def one(_):
+            try:
+                fn(db_file, exam_id)
+            except sqlite3.Error as e:
+                with err_lock:
+                    errors.append(e)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(one, range(students)))
+        elapsed = time.perf_counter() - start
+        sqlite_db.close_all()
+    print(f'{name:8s} {students} joins / {threads} threads: {elapsed * 1000:8.1f} ms '
+          f'({students / elapsed:8.0f} joins/s, {len(errors)} errors)')
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=400)
+    parser.add_argument('--threads', type=int, default=32)
+    args = parser.parse_args()
+    before = run('before', join_naive, args.students, args.threads)
+    after = run('after', join_pooled, args.students, args.threads)
+    print(f'speedup: {before / after:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
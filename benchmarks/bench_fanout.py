@@ -0,0 +1,67 @@
+"""Bytes fanned out per exam: one shared room vs. proctor/student sub-rooms.
+
+Replays one screenshot interval (every student sends one screenshot and one
+audio chunk) through a minimal room router, and counts the bytes the server
+would write to sockets under each routing model.
+
+    python benchmarks/bench_fanout.py --students 50 100 300 --screenshot-kb 300
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from functions.channels import proctor_room, student_room  # noqa: E402
+
+
+class Router:
+    def __init__(self):
+        self.rooms = defaultdict(set)
+        self.sent = defaultdict(int)
+
+    def join(self, sid, room):
+        self.rooms[room].add(sid)
+
+    def emit(self, event, data, room, skip_sid=None):
+        size = len(json.dumps([event, data]))
+        for sid in self.rooms[room]:
+            if sid != skip_sid:
+                self.sent[sid] += size
+
+
+def simulate(students, screenshot_kb, audio_kb, split):
+    exam_id = 'bench'
+    router = Router()
+    router.join('teacher', proctor_room(exam_id) if split else exam_id)
+    sids = [f'student-{i}' for i in range(students)]
+    for sid in sids:
+        router.join(sid, student_room(exam_id) if split else exam_id)
+    screenshot = base64.b64encode(os.urandom(screenshot_kb * 1024)).decode()
+    audio = base64.b64encode(os.urandom(audio_kb * 1024)).decode()
+    media_room = proctor_room(exam_id) if split else exam_id
+    for sid in sids:
+        router.emit('screenshot', {'examId': exam_id, 'studentId': sid, 'screenshot': screenshot}, media_room)
+        router.emit('audio_chunk', {'examId': exam_id, 'studentId': sid, 'audio': audio}, media_room)
+    teacher = router.sent['teacher']
+    total = sum(router.sent.values())
+    return teacher, total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, nargs='+', default=[50, 100, 300])
+    parser.add_argument('--screenshot-kb', type=int, default=300)
+    parser.add_argument('--audio-kb', type=int, default=80)
+    args = parser.parse_args()
+    print(f'{"students":>8} {"model":>8} {"to teacher":>12} {"total out":>12}')
+    for n in args.students:
+        for split in (False, True):
+            teacher, total = simulate(n, args.screenshot_kb, args.audio_kb, split)
+            print(f'{n:8d} {"split" if split else "shared":>8} {teacher / 2**20:10.1f}MB {total / 2**20:10.1f}MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Student join against Fauna: add_student + get_exam_options vs. join_exam.
+
+Runs against the database FAUNA_SECRET points at. Use a local Fauna dev
+container (``docker run -p 8443:8443 fauna/faunadb``, then FAUNA_SECRET=secret
+FAUNA_DOMAIN=localhost FAUNA_PORT=8443 FAUNA_SCHEME=http) rather than a real
+database. Every query is counted, and ``--rtt-ms`` adds that much delay per
+round trip to model a WAN link to the hosted service.
+
+    FAUNA_SECRET=secret FAUNA_DOMAIN=localhost FAUNA_PORT=8443 FAUNA_SCHEME=http \\
+        python benchmarks/bench_fauna_join.py --joins 50 --rtt-ms 100
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.environ.get('FAUNA_SECRET'):
+    sys.exit('FAUNA_SECRET is not set; see the module docstring for a local Fauna container')
+
+from functions import db, provision  # noqa: E402
+from functions.clients import get_fauna  # noqa: E402
+
+
+class RoundTrips:
+    def __init__(self, client, rtt):
+        self.count = 0
+        self.rtt = rtt
+        self._query = client.query
+        client.query = self
+
+    def __call__(self, expr, *args, **kwargs):
+        self.count += 1
+        time.sleep(self.rtt)
+        return self._query(expr, *args, **kwargs)
+
+
+def old_join(student_id, exam_id):
+    db.add_student(student_id, exam_id)
+    return db.get_exam_options(exam_id)
+
+
+def measure(name, join, exam_id, joins, trips):
+    trips.count = 0
+    latencies = []
+    for _ in range(joins):
+        start = time.perf_counter()
+        join(str(uuid.uuid4())[:8], exam_id)
+        latencies.append((time.perf_counter() - start) * 1000)
+    print(f'{name:10s} p50 {statistics.median(latencies):7.1f} ms  max {max(latencies):7.1f} ms  '
+          f'{trips.count / joins:.1f} round trips/join')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--joins', type=int, default=50)
+    parser.add_argument('--bulk', type=int, default=200)
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    provision.provision_fauna()
+    exam_id = f'bench-{uuid.uuid4().hex[:6]}'
+    db.create_exam(exam_id)
+    db.update_exam_options(exam_id, {'screenshots': True, 'interval': 30})
+    trips = RoundTrips(get_fauna(), args.rtt_ms / 1000)
+
+    db._exam_refs.clear()
+    measure('old', old_join, exam_id, args.joins, trips)
+    db._exam_refs.clear()
+    measure('join_exam', db.join_exam, exam_id, args.joins, trips)
+
+    trips.count = 0
+    start = time.perf_counter()
+    db.add_students([(str(uuid.uuid4())[:8], exam_id) for _ in range(args.bulk)])
+    print(f'add_students({args.bulk}) {(time.perf_counter() - start) * 1000:7.1f} ms  {trips.count} round trip(s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""Idle connections held by the Socket.IO server on one CPU core.
+
+Starts the server pinned to core 0, either the asyncio gateway (``uvicorn
+asgi:application``) or the threading-mode app, and opens ``--connections``
+raw Engine.IO WebSockets from this process. Each connection joins the exam
+as a student, answers pings, and sends a heartbeat every ``--heartbeat``
+seconds, like an idle student page. While the connections are held, the
+script samples the server's RSS, thread count and CPU use. A separate
+probe socket measures event round-trip latency (``join_teacher`` ->
+``presence_snapshot``). The run fails if any connection could not be
+opened or was dropped.
+
+    pip install websockets
+    python benchmarks/bench_gateway_idle.py --connections 5000 --hold 60
+    python benchmarks/bench_gateway_idle.py --server threading --connections 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+
+
+def raise_nofile(limit):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(max(soft, limit), hard), hard))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind, port, connections, workdir):
+    env = dict(os.environ, PROCTOR_DB=os.path.join(workdir, 'proctor.db'), PYTHONPATH=ROOT)
+    if kind == 'asgi':
+        env['PROCTOR_GATEWAY'] = 'asgi'
+        cmd = [sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', str(port),
+               '--log-level', 'warning', '--backlog', str(max(2048, connections))]
+    else:
+        cmd = [sys.executable, '-c', 'import app; app.socketio.run(app.app, port=%d, allow_unsafe_werkzeug=True)' % port]
+
+    def pin():
+        raise_nofile(connections * 2 + 1024)
+        os.sched_setaffinity(0, {0})
+    # Run in a scratch directory so recordings/ and the database do not land in the repo.
+    return subprocess.Popen(cmd, cwd=workdir, env=env, preexec_fn=pin,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def proc_sample(pid):
+    with open(f'/proc/{pid}/status') as f:
+        status = dict(line.split(':', 1) for line in f)
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / CLK_TCK  # utime + stime
+    return int(status['VmRSS'].split()[0]) / 1024, int(status['Threads']), cpu
+
+
+async def open_socket(url, timeout=60):
+    ws = await websockets.connect(url, max_size=None, ping_interval=None, open_timeout=timeout)
+    await ws.recv()  # Engine.IO open packet
+    await ws.send('40')
+    while not (await ws.recv()).startswith('40'):
+        pass
+    return ws
+
+
+async def student(url, n, args, state, ready):
+    try:
+        ws = await open_socket(url)
+    except Exception:
+        state['failed'] += 1
+        ready.release()
+        return
+    state['connected'] += 1
+    ready.release()
+    await ws.send('42' + json.dumps(['join_student', {'examId': 'bench', 'studentId': f's{n}'}]))
+    heartbeat = '42' + json.dumps(['heartbeat', {'examId': 'bench', 'studentId': f's{n}'}])
+    next_beat = time.monotonic() + random.uniform(0, args.heartbeat)
+    try:
+        while not state['done']:
+            try:
+                msg = await asyncio.wait_for(ws.recv(), timeout=max(0.01, next_beat - time.monotonic()))
+                if msg == '2':
+                    await ws.send('3')
+            except asyncio.TimeoutError:
+                await ws.send(heartbeat)
+                next_beat += args.heartbeat
+    except websockets.ConnectionClosed:
+        state['dropped'] += 1
+    finally:
+        await ws.close()
+
+
+async def probe(url, state, rtts):
+    ws = await open_socket(url)
+    request = '42' + json.dumps(['join_teacher', {'examId': 'bench'}])
+    while not state['done']:
+        start = time.perf_counter()
+        await ws.send(request)
+        while True:
+            msg = await ws.recv()
+            if msg == '2':
+                await ws.send('3')
+            elif msg.startswith('42["presence_snapshot"'):
+                break
+        rtts.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(1)
+    await ws.close()
+
+
+async def run(args, port, pid):
+    url = f'ws://127.0.0.1:{port}/socket.io/?EIO=4&transport=websocket'
+    for _ in range(100):  # wait for the server to listen
+        try:
+            await (await open_socket(url, timeout=1)).close()
+            break
+        except Exception:
+            await asyncio.sleep(0.2)
+    state = {'connected': 0, 'failed': 0, 'dropped': 0, 'done': False}
+    ready = asyncio.Semaphore(args.concurrency)
+    start = time.perf_counter()
+    tasks = []
+    for n in range(args.connections):
+        await ready.acquire()
+        tasks.append(asyncio.create_task(student(url, n, args, state, ready)))
+    while state['connected'] + state['failed'] < args.connections:
+        await asyncio.sleep(0.1)
+    ramp = time.perf_counter() - start
+    print(f'{state["connected"]}/{args.connections} connected in {ramp:.1f} s ({state["failed"]} failed)')
+
+    rtts = []
+    probe_task = asyncio.create_task(probe(url, state, rtts))
+    _, _, cpu0 = proc_sample(pid)
+    t0 = time.perf_counter()
+    samples = []
+    while time.perf_counter() - t0 < args.hold:
+        await asyncio.sleep(5)
+        samples.append(proc_sample(pid))
+    cpu = (samples[-1][2] - cpu0) / (time.perf_counter() - t0)
+    state['done'] = True
+    await asyncio.gather(probe_task, *tasks, return_exceptions=True)
+
+    rss = max(s[0] for s in samples)
+    threads = max(s[1] for s in samples)
+    print(f'held {args.hold:.0f} s: server RSS {rss:.0f} MB ({rss * 1024 / max(1, state["connected"]):.1f} KB/conn), '
+          f'{threads} threads, CPU {cpu * 100:.1f}% of one core, {state["dropped"]} dropped')
+    if rtts:
+        print(f'event round trip p50 {statistics.median(rtts):.1f} ms  max {max(rtts):.1f} ms')
+    return state['failed'] == 0 and state['dropped'] == 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--server', choices=['asgi', 'threading'], default='asgi')
+    parser.add_argument('--connections', type=int, default=5000)
+    parser.add_argument('--hold', type=float, default=60.0)
+    parser.add_argument('--heartbeat', type=float, default=5.0)
+    parser.add_argument('--concurrency', type=int, default=200, help='connections opening at once')
+    args = parser.parse_args()
+
+    raise_nofile(args.connections * 2 + 1024)
+    if hasattr(os, 'sched_setaffinity') and os.cpu_count() > 1:
+        os.sched_setaffinity(0, set(range(1, os.cpu_count())))  # keep the load generator off core 0
+    port = free_port()
+    workdir = tempfile.mkdtemp()
+    server = start_server(args.server, port, args.connections, workdir)
+    try:
+        ok = asyncio.run(run(args, port, server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Join storm: 1,000 students joining one exam at the same moment.
+
+All the joins hit ``AdmissionQueue.submit`` at once from their own threads,
+as Flask-SocketIO's threading mode would run the handlers. The queue is then
+drained on a simulated clock at the configured admission rate. The script
+reports admission waits and compares the socket messages each design sends:
+
+- old: options_push re-broadcast to the exam room on every join, plus one
+  student_joined event to the proctors per join.
+- new: options_push to the joining sid only, plus one ready_count per
+  flush interval.
+
+    python benchmarks/bench_join_storm.py --students 1000 --rate 100
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from admission import AdmissionQueue, ReadyCounts  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=100.0, help='admitted joins per second')
+    parser.add_argument('--flush-interval', type=float, default=1.0, help='ready_count interval (s)')
+    args = parser.parse_args()
+
+    clock = FakeClock()
+    ready = ReadyCounts()
+    messages = {'options_push': 0, 'ready_count': 0}
+
+    def on_admit(exam_id, student_id, sid):
+        ready.joined(exam_id, student_id)
+        messages['options_push'] += 1
+
+    queue = AdmissionQueue(rate=args.rate, on_admit=on_admit, clock=clock)
+    barrier = threading.Barrier(args.students)
+
+    def join(i):
+        barrier.wait()
+        queue.submit('storm', f's{i}', f'sid{i}')
+
+    threads = [threading.Thread(target=join, args=(i,)) for i in range(args.students)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    submit_ms = (time.perf_counter() - start) * 1000
+
+    waits = []
+    next_flush = args.flush_interval
+    while queue.depth():
+        clock.now += queue.tick
+        waits.extend(w for *_, w in queue.admit_ready())
+        if clock.now >= next_flush:
+            messages['ready_count'] += len(ready.flush())
+            next_flush += args.flush_interval
+    messages['ready_count'] += len(ready.flush())
+
+    n = args.students
+    old = n * (n + 1) // 2 + n
+    new = messages['options_push'] + messages['ready_count']
+    print(f'{n} simultaneous joins submitted in {submit_ms:.1f} ms (max queue depth {queue.stats["max_depth"]})')
+    print(f'admission at {args.rate:.0f}/s: drained in {clock.now:.2f} s, '
+          f'wait p50 {percentile(waits, 50):.2f} s  p99 {percentile(waits, 99):.2f} s')
+    print(f'messages  old {old:>9,d} (options_push to room per join + student_joined)')
+    print(f'          new {new:>9,d} ({messages["options_push"]} options_push to sid + '
+          f'{messages["ready_count"]} ready_count)')
+
+
+if __name__ == '__main__':
+    main()
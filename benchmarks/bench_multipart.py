@@ -0,0 +1,100 @@
+"""Upload handler body parsing: split()/BytesIO parser vs. memoryview parser.
+
+Builds the Netlify event for one upload chunk (base64 multipart body) and
+parses it repeatedly, reporting peak traced allocation per invocation, peak
+RSS of a fresh process, and MB/s of chunk payload.
+
+    python benchmarks/bench_multipart.py --chunk-mb 1 --iterations 200
+"""
+import argparse
+import base64
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from functions.multipart import boundary_from, decode_body, parse_form  # noqa: E402
+
+BOUNDARY = '----WebKitFormBoundary7MA4YWxkTrZu0gW'
+
+
+def make_event(chunk_mb):
+    fields = {'examId': 'bench', 'studentId': 's1', 'chunkIndex': '0', 'totalChunks': '1', 'filename': 'r.webm'}
+    body = b''
+    for name, value in fields.items():
+        body += f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+    body += (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="chunk"; filename="chunk-0"\r\n'
+             f'Content-Type: application/octet-stream\r\n\r\n').encode()
+    body += os.urandom(int(chunk_mb * 1024 * 1024)) + f'\r\n--{BOUNDARY}--\r\n'.encode()
+    return {'body': base64.b64encode(body).decode(), 'isBase64Encoded': True,
+            'headers': {'content-type': f'multipart/form-data; boundary={BOUNDARY}'}}
+
+
+def parse_old(event):
+    # The previous handler's parsing, unchanged apart from its missing imports.
+    body = base64.b64decode(event['body'])
+    boundary = event['headers']['content-type'].split('boundary=')[1]
+    parts = body.split(b'--' + boundary.encode())
+    form_data = {}
+    chunk = None
+    for part in parts:
+        if b'Content-Disposition' in part:
+            headers, content = part.split(b'\r\n\r\n', 1)
+            headers = headers.decode()
+            name_match = re.search(r'name="([^"]+)"', headers)
+            if name_match:
+                name = name_match.group(1)
+                content = content.rstrip(b'\r\n--')
+                if name == 'chunk':
+                    chunk = BytesIO(content)
+                else:
+                    form_data[name] = content.decode()
+    return len(chunk.getvalue())
+
+
+def parse_new(event):
+    fields, files = parse_form(decode_body(event), boundary_from(event['headers']['content-type']))
+    return len(files['chunk'][1])
+
+
+def measure(mode, chunk_mb, iterations):
+    parse = {'old': parse_old, 'new': parse_new}[mode]
+    event = make_event(chunk_mb)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    parse(event)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    payload = sum(parse(event) for _ in range(iterations))
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'mode': mode, 'peak_alloc_mb': peak / 2**20, 'rss_growth_mb': (rss_after - rss_before) / 1024,
+            'mb_per_s': payload / 2**20 / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunk-mb', type=float, default=1.0)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--mode', choices=['old', 'new'])
+    args = parser.parse_args()
+    if args.mode:  # child process: one mode, fresh RSS
+        print(json.dumps(measure(args.mode, args.chunk_mb, args.iterations)))
+        return
+    for mode in ('old', 'new'):
+        out = subprocess.run([sys.executable, __file__, '--mode', mode, '--chunk-mb', str(args.chunk_mb),
+                              '--iterations', str(args.iterations)], capture_output=True, text=True, check=True)
+        r = json.loads(out.stdout)
+        print(f'{r["mode"]:4s} peak alloc/invocation {r["peak_alloc_mb"]:6.2f} MB  '
+              f'RSS growth {r["rss_growth_mb"]:6.2f} MB  {r["mb_per_s"]:8.1f} MB/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""Latency seen by a well-behaved client while another client floods the server.
+
+Starts the ASGI server (``uvicorn asgi:application``) and opens a probe
+socket that joins as a teacher and measures the round trip of
+``join_teacher`` -> ``presence_snapshot`` once per 100 ms. After a quiet
+baseline, ``--noisy`` clients each emit ``--rate`` ``screenshot`` events
+per second, each a distinct PNG frame of about ``--payload`` bytes (so
+dedup cannot skip them). The run is repeated with the default
+SOCKET_RATE_LIMITS and with limits disabled, reporting the probe latency
+(p50/p99) quiet and under flood. The load generator is pinned away from
+the server's core when there is more than one.
+
+    pip install websockets numpy Pillow
+    python benchmarks/bench_noisy_client.py --noisy 4 --rate 100 --seconds 10
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import websockets
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UNLIMITED = 'screenshot=1000000/1000000,audio_chunk=1000000/1000000,tab_changed=1000000/1000000'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def open_socket(url, timeout=10):
+    ws = await websockets.connect(url, max_size=None, ping_interval=None, open_timeout=timeout)
+    await ws.recv()  # Engine.IO open packet
+    await ws.send('40')
+    while not (await ws.recv()).startswith('40'):
+        pass
+    return ws
+
+
+async def probe(url, state, rtts):
+    ws = await open_socket(url)
+    request = '42' + json.dumps(['join_teacher', {'examId': 'bench'}])
+    while not state['done']:
+        start = time.perf_counter()
+        await ws.send(request)
+        while True:
+            msg = await ws.recv()
+            if msg == '2':
+                await ws.send('3')
+            elif msg.startswith('42["presence_snapshot"'):
+                break
+        rtts[state['phase']].append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.1)
+    await ws.close()
+
+
+def frames(count, payload, seed):
+    side = max(8, int((payload / 3) ** 0.5))
+    rng = np.random.default_rng(seed)
+    out = []
+    for _ in range(count):
+        buf = io.BytesIO()
+        Image.fromarray(rng.integers(0, 256, (side, side, 3), dtype=np.uint8)).save(buf, 'PNG')
+        out.append(buf.getvalue())
+    return out
+
+
+async def flood(url, n, images, rate, state):
+    ws = await open_socket(url)
+    # Socket.IO binary event: a placeholder header followed by the attachment.
+    header = '451-' + json.dumps(['screenshot', {'examId': 'bench', 'studentId': f'noisy{n}',
+                                                 'screenshot': {'_placeholder': True, 'num': 0}}])
+    sent = 0
+    start = time.perf_counter()
+    while not state['done']:
+        await ws.send(header)
+        await ws.send(images[sent % len(images)])
+        sent += 1
+        await asyncio.sleep(max(0, start + sent / rate - time.perf_counter()))
+    state['sent'] += sent
+    await ws.close()
+
+
+async def measure(port, args):
+    url = f'ws://127.0.0.1:{port}/socket.io/?EIO=4&transport=websocket'
+    for _ in range(100):
+        try:
+            await (await open_socket(url, timeout=1)).close()
+            break
+        except Exception:
+            await asyncio.sleep(0.2)
+    state = {'done': False, 'phase': 'quiet', 'sent': 0}
+    rtts = {'quiet': [], 'flood': []}
+    probe_task = asyncio.create_task(probe(url, state, rtts))
+    await asyncio.sleep(args.seconds / 2)
+    state['phase'] = 'flood'
+    images = frames(64, args.payload, seed=1)
+    floods = [asyncio.create_task(flood(url, n, images, args.rate, state)) for n in range(args.noisy)]
+    await asyncio.sleep(args.seconds)
+    state['done'] = True
+    await asyncio.gather(probe_task, *floods, return_exceptions=True)
+    return rtts, state['sent']
+
+
+def run(label, limits, args):
+    port = free_port()
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ, PROCTOR_DB=os.path.join(workdir, 'proctor.db'), PYTHONPATH=ROOT, PROCTOR_GATEWAY='asgi')
+    if limits is not None:
+        env['SOCKET_RATE_LIMITS'] = limits
+    pin = (lambda: os.sched_setaffinity(0, {0})) if os.cpu_count() > 1 else None
+    server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', str(port),
+                               '--log-level', 'warning'], cwd=workdir, env=env, preexec_fn=pin,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        rtts, sent = asyncio.run(measure(port, args))
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+    for phase in ('quiet', 'flood'):
+        values = sorted(rtts[phase]) or [float('nan')]
+        p99 = values[min(len(values) - 1, int(len(values) * 0.99))]
+        print(f'{label:>10} {phase:>5}: probe p50 {statistics.median(values):7.1f} ms  p99 {p99:7.1f} ms  '
+              f'({len(rtts[phase])} samples)')
+    print(f'{label:>10} flood: {sent} screenshot events sent by {args.noisy} noisy clients')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--noisy', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=100.0, help='screenshot events per second per noisy client')
+    parser.add_argument('--payload', type=int, default=50000, help='approximate PNG bytes per event')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    args = parser.parse_args()
+    if os.cpu_count() > 1:
+        os.sched_setaffinity(0, set(range(1, os.cpu_count())))
+    run('limited', None, args)
+    run('unlimited', UNLIMITED, args)
+
+
+if __name__ == '__main__':
+    main()
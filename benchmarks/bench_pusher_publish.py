@@ -0,0 +1,102 @@
+"""Join-notification publishing: sequential triggers vs. one batch vs. async.
+
+Runs offline against a local HTTP stand-in for the Pusher REST API, which
+answers ``/apps/<id>/events`` and ``/apps/<id>/batch_events`` after
+``--latency-ms`` and counts requests and TCP connections. Each simulated
+invocation publishes the two events of a student join, and the time until
+the handler could return is measured.
+
+    python benchmarks/bench_pusher_publish.py --invocations 200 --latency-ms 40
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pusher import Pusher  # noqa: E402
+
+from functions.publish import Publisher  # noqa: E402
+
+
+class StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency):
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.latency = latency
+        self.requests = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like api-<cluster>.pusher.com
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.server.lock:
+            self.server.requests += 1
+        time.sleep(self.server.latency)
+        body = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def join_events(i):
+    return [('exam-bench-proctors', 'student_joined', {'studentId': f's{i}'}),
+            ('exam-bench-students', 'options_push', {'camera': True, 'mic': True, 'screen': True})]
+
+
+def run(mode, server, invocations):
+    port = server.server_address[1]
+    client = Pusher(app_id='1', key='key', secret='secret', host='127.0.0.1', port=port, ssl=False)
+    publisher = Publisher(client_factory=lambda: client, async_mode=(mode == 'async'))
+    server.requests = server.connections = 0
+    latencies = []
+    start = time.perf_counter()
+    for i in range(invocations):
+        t = time.perf_counter()
+        if mode == 'sequential':
+            for channel, event, data in join_events(i):
+                client.trigger(channel, event, data)
+        else:
+            with publisher.batch() as events:
+                for channel, event, data in join_events(i):
+                    events.trigger(channel, event, data)
+        latencies.append((time.perf_counter() - t) * 1000)
+    publisher.drain()
+    total = time.perf_counter() - start
+    print(f'{mode:10s} handler p50 {statistics.median(latencies):7.2f} ms  max {max(latencies):7.2f} ms  '
+          f'{server.requests / invocations:.1f} requests/join  {server.connections} connections  '
+          f'{invocations / total:7.1f} joins/s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--invocations', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=40.0)
+    args = parser.parse_args()
+    server = StandIn(args.latency_ms / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    for mode in ('sequential', 'batch', 'async'):
+        run(mode, server, args.invocations)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
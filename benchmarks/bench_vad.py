@@ -0,0 +1,120 @@
+"""Voice-activity detection over many students' audio streams.
+
+Each simulated student records ``--minutes`` of Opus/WebM audio: a low
+noise floor, a few seconds of voiced speech at random times, a keyboard
+click and a burst of broadband hiss. The recordings are cut into
+MediaRecorder-sized pieces and fed through ``AudioStreams.append`` and
+``VoiceActivity.submit`` as app.py does. The script reports:
+
+- analysis throughput (seconds of audio analyzed per second of CPU time);
+- how many speech segments were found, against how many were spoken;
+- the audio bytes sent towards the teacher: every piece (old ``audio_chunk``
+  relay) against only the speech clips.
+
+    pip install numpy av
+    python benchmarks/bench_vad.py --students 50 --minutes 2
+"""
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import av
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from audio_stream import AudioStreams  # noqa: E402
+from voice_activity import VoiceActivity  # noqa: E402
+
+RATE = 48000
+
+
+def synth(rng, seconds, utterances):
+    t = np.arange(seconds * RATE) / RATE
+    x = rng.normal(0, 10 ** (-62 / 20), t.size)
+    spoken = []
+    for start in np.sort(rng.choice(np.arange(2, seconds - 6, 8), utterances, replace=False)):
+        length = rng.uniform(1.5, 4)
+        m = (t >= start) & (t < start + length)
+        f0 = rng.uniform(100, 220) + 20 * np.sin(2 * np.pi * 0.5 * t[m])
+        phase = 2 * np.pi * np.cumsum(f0) / RATE
+        envelope = 0.5 + 0.5 * np.abs(np.sin(2 * np.pi * 3 * t[m]))
+        x[m] += 0.05 * envelope * sum(np.sin(k * phase) / k for k in range(1, 8))
+        spoken.append(start)
+    click = int((spoken[0] + 5) * RATE)
+    x[click:click + RATE // 20] += rng.normal(0, 0.2, RATE // 20)
+    hiss = int((spoken[-1] + 5) * RATE) % (x.size - RATE)
+    x[hiss:hiss + RATE] += rng.normal(0, 0.03, RATE)
+    return x.astype(np.float32), len(spoken)
+
+
+def encode(pcm):
+    out = io.BytesIO()
+    with av.open(out, 'w', format='webm') as container:
+        stream = container.add_stream('libopus', rate=RATE)
+        stream.layout = 'mono'
+        for i in range(0, pcm.size, 960):
+            frame = av.AudioFrame.from_ndarray(pcm[None, i:i + 960], format='flt', layout='mono')
+            frame.sample_rate = RATE
+            frame.pts = i
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+    return out.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=50)
+    parser.add_argument('--minutes', type=float, default=2.0)
+    parser.add_argument('--pieces-per-minute', type=int, default=6, help='10 s MediaRecorder timeslices')
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    seconds = int(args.minutes * 60)
+    recordings = []
+    spoken = 0
+    for _ in range(args.students):
+        pcm, n = synth(rng, seconds, utterances=max(1, seconds // 20))
+        recordings.append(encode(pcm))
+        spoken += n
+
+    root = tempfile.mkdtemp()
+    try:
+        streams = AudioStreams(root)
+        found = []
+        vad = VoiceActivity(streams, on_speech=lambda exam, student, segment: found.append((student, segment)),
+                            workers=args.workers)
+        pieces = int(args.minutes * args.pieces_per_minute)
+        cpu, wall = time.process_time(), time.perf_counter()
+        for piece in range(pieces):
+            for student, data in enumerate(recordings):
+                size = -(-len(data) // pieces)
+                status = streams.append('bench', f's{student}', data[piece * size:(piece + 1) * size])
+                vad.submit('bench', f's{student}', status['session'])
+        vad.executor.shutdown(wait=True)
+        cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+
+        clip_bytes = sum(sum(end - start for start, end in streams.clip(
+            'bench', student, segment['start'], segment['start'] + int(segment['duration'] * 1000),
+            session=segment['session'])[1]) for student, segment in found)
+        relayed = sum(len(data) for data in recordings)
+        report = vad.report()
+        audio_seconds = report['decoded_ms'] / 1000
+        print(f'{args.students} students x {seconds} s: {audio_seconds:.0f} s of audio analyzed in {cpu:.2f} s CPU '
+              f'({audio_seconds / cpu:.0f}x real time), {wall:.2f} s wall, {report["analyses"]} analyses, '
+              f'{report["coalesced"]} coalesced')
+        print(f'speech segments: {len(found)} found, {spoken} spoken; speech ratio {report["speech_ratio"]}')
+        print(f'teacher-bound audio: {relayed / 1e6:.1f} MB relayed before, {clip_bytes / 1e6:.1f} MB of speech clips '
+              f'now ({100 * (1 - clip_bytes / relayed):.0f}% less)')
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,573 @@
+"""Load generator: simulated students and a teacher against a local server.
+
+``run`` starts the app on a free port, either under the asyncio gateway
+(``--server asgi``) or in threading mode (``--server threading``). The
+server process counts the Socket.IO and HTTP bytes it moves. A teacher
+logs in, creates and starts an exam, and joins it. Client worker
+processes (``--workers``) each drive a share of the students with
+python-socketio's AsyncClient. Every student goes through the page's
+lifecycle:
+
+- GET /student (to get its student id), connect, ``join_student``, then
+  wait for the options and ``options_confirmed``;
+- heartbeats, screenshots of ``--screenshot-bytes``, audio pieces and
+  tab changes until the end of the run. Screenshots follow the interval
+  of the server's capture profile unless ``--fixed-capture`` is given;
+- a chunked /upload_chunk upload of ``--upload-bytes``, ``student_leave``
+  and disconnect.
+
+Screenshots are distinct noise PNGs, so dedup forwards them all. Audio
+is Opus/WebM when PyAV is installed and is left out otherwise.
+
+The teacher measures end-to-end latency from the dashboard frames it
+receives. A screenshot counts from the student's emit to the first frame
+that carries its URL; a tab change counts to the frame with the new
+``tabChanges`` count. Both include the dashboard interval. Each scenario
+reports:
+
+- throughput: events sent per second and teacher updates received;
+- latency p50/p95/p99: screenshot and tab change (end to end), admission
+  (join to options) and upload (per chunk);
+- the server's average CPU and peak RSS, sampled from /proc;
+- bytes in and out at the server, for Socket.IO packets and for HTTP.
+
+Results are saved as JSON with the scenario settings and the server's
+/metrics at the end of the run. ``compare`` prints two result files side
+by side.
+
+    pip install "python-socketio[asyncio_client]" uvicorn numpy Pillow av
+    python benchmarks/loadgen.py run --scenario classroom --scenario lecture --output after.json
+    python benchmarks/loadgen.py compare before.json after.json
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+
+import aiohttp
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+
+SCENARIOS = {
+    'smoke': {'students': 20, 'duration': 20.0},
+    'classroom': {'students': 50, 'duration': 60.0},
+    'lecture': {'students': 300, 'duration': 60.0},
+    'hall': {'students': 1000, 'duration': 120.0},
+}
+DEFAULTS = {
+    'heartbeat': 5.0,
+    'screenshot_interval': 5.0,
+    'screenshot_bytes': 40000,
+    'audio_interval': 10.0,
+    'tab_changes_per_minute': 0.5,
+    'upload_bytes': 2 * 1024 * 1024,
+    'ramp': 10.0,
+}
+CHUNK_BYTES = 1024 * 1024  # the page's upload chunk size; /upload_chunk expects it
+OPTIONS = {'camera': True, 'mic': True, 'screen': True, 'record': True}
+# Settings shown by ``compare``: (label, path in a scenario result)
+SUMMARY = (
+    ('events/s', ('throughput', 'events_per_second')),
+    ('screenshot p50 ms', ('latency_ms', 'screenshot', 'p50')),
+    ('screenshot p99 ms', ('latency_ms', 'screenshot', 'p99')),
+    ('tab change p99 ms', ('latency_ms', 'tab_change', 'p99')),
+    ('admission p99 ms', ('latency_ms', 'admission', 'p99')),
+    ('upload p99 ms', ('latency_ms', 'upload', 'p99')),
+    ('server CPU %', ('server', 'cpu_percent')),
+    ('server RSS MB', ('server', 'rss_peak_mb')),
+    ('MB in', ('server', 'mb_in')),
+    ('MB out', ('server', 'mb_out')),
+    ('errors', ('errors', 'total')),
+)
+
+
+# --- server side -------------------------------------------------------------------------
+
+def serve(args):
+    """Run the app with byte counters on Engine.IO packets and HTTP bodies (``run`` starts this)."""
+    sys.path.insert(0, ROOT)
+    if args.server == 'asgi':
+        os.environ['PROCTOR_GATEWAY'] = 'asgi'
+    import engineio.async_socket
+    import engineio.socket
+    import app as proctor
+
+    counters = defaultdict(int)
+
+    def size(pkt):
+        return 1 + (len(pkt.data) if isinstance(pkt.data, (str, bytes)) else 0)
+
+    def counted(cls, name, direction):
+        original = getattr(cls, name)
+
+        def method(self, pkt, *a, **kw):
+            counters[f'socket_{direction}'] += size(pkt)
+            counters[f'packets_{direction}'] += 1
+            return original(self, pkt, *a, **kw)  # a coroutine on AsyncSocket, awaited by the caller
+        setattr(cls, name, method)
+
+    for cls in (engineio.socket.Socket, engineio.async_socket.AsyncSocket):
+        counted(cls, 'receive', 'in')
+        counted(cls, 'send', 'out')
+
+    inner = proctor.app.wsgi_app
+
+    class CountedBody:
+        def __init__(self, body):
+            self.body = body
+
+        def __iter__(self):
+            for chunk in self.body:
+                counters['http_out'] += len(chunk)
+                yield chunk
+
+        def close(self):
+            if hasattr(self.body, 'close'):
+                self.body.close()
+
+    def wsgi_app(environ, start_response):
+        if environ.get('PATH_INFO', '').startswith('/socket.io'):
+            return inner(environ, start_response)
+        counters['http_in'] += int(environ.get('CONTENT_LENGTH') or 0)
+        counters['http_requests'] += 1
+        return CountedBody(inner(environ, start_response))
+    proctor.app.wsgi_app = wsgi_app
+    proctor.app.add_url_rule('/loadgen/stats', 'loadgen_stats', lambda: proctor.jsonify(counters))
+
+    if args.server == 'asgi':
+        import uvicorn
+        import asgi
+        uvicorn.run(asgi.application, host='127.0.0.1', port=args.port, log_level='warning', backlog=4096)
+    else:
+        proctor.socketio.run(proctor.app, host='127.0.0.1', port=args.port, allow_unsafe_werkzeug=True,
+                             log_output=False)
+
+
+def start_server(kind, port, workdir, env):
+    def pin():
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        if os.cpu_count() > 1:
+            os.sched_setaffinity(0, {0})
+    env = dict(os.environ, PROCTOR_DB=os.path.join(workdir, 'proctor.db'), PYTHONPATH=ROOT, **env)
+    # Run in a scratch directory so recordings/ and the database do not land in the repo.
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), 'serve', '--server', kind, '--port', str(port)],
+                            cwd=workdir, env=env, preexec_fn=pin, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def proc_sample(pid):
+    with open(f'/proc/{pid}/status') as f:
+        status = dict(line.split(':', 1) for line in f)
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return int(status['VmRSS'].split()[0]) / 1024, (int(fields[11]) + int(fields[12])) / CLK_TCK
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# --- payloads ------------------------------------------------------------------------------
+
+def screenshot_frames(count, size, seed):
+    try:
+        import numpy as np
+        from PIL import Image
+    except ImportError:  # dedup cannot hash these, so they are all forwarded anyway
+        rng = random.Random(seed)
+        return [b'\x89PNG\r\n\x1a\n' + rng.randbytes(size) for _ in range(count)]
+    side = max(8, int((size / 3) ** 0.5))
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(count):
+        buf = io.BytesIO()
+        Image.fromarray(rng.integers(0, 256, (side, side, 3), dtype=np.uint8)).save(buf, 'PNG')
+        frames.append(buf.getvalue())
+    return frames
+
+
+def audio_pieces(interval, seconds=60):
+    """One minute of Opus/WebM cut into ``interval``-second pieces, the first with the header."""
+    try:
+        import numpy as np
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from bench_vad import encode, synth
+    except ImportError:
+        return []
+    data = encode(synth(np.random.default_rng(5), seconds, utterances=3)[0])
+    count = max(1, int(seconds / interval))
+    size = -(-len(data) // count)
+    return [data[i * size:(i + 1) * size] for i in range(count)]
+
+
+# --- clients -------------------------------------------------------------------------------
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def at(p):
+        return round(values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))], 1)
+    return {'count': len(values), 'p50': at(50), 'p95': at(95), 'p99': at(99), 'max': round(values[-1], 1)}
+
+
+async def student(n, ctx, deadline, rec):
+    cfg = ctx['config']
+    base, exam_id = ctx['base'], ctx['exam_id']
+    frames, pieces = ctx['frames'], ctx['audio']
+    state = {'interval': cfg['screenshot_interval']}
+    options = asyncio.Event()
+    sio = socketio.AsyncClient(reconnection=False)
+
+    @sio.on('options_push')
+    def on_options(data):
+        options.set()
+
+    @sio.on('capture_profile')
+    def on_profile(profile):
+        rec['profiles'] += 1
+        if not cfg['fixed_capture']:
+            state['interval'] = profile['interval'] / 1000
+
+    @sio.on('disconnect')
+    def on_disconnect(reason=None):
+        if time.time() < deadline:
+            rec['errors']['disconnected'] += 1
+
+    try:
+        async with ctx['http'].get(f'{base}/student', params={'examId': exam_id}) as res:
+            student_id = re.search(r"const studentId = '([^']+)'", await res.text()).group(1)
+            cookies = res.cookies  # the student session /upload_chunk checks; the shared jar keeps none
+        await sio.connect(base, transports=['websocket'], wait_timeout=30)
+    except Exception:
+        rec['errors']['connect'] += 1
+        return
+    ids = {'examId': exam_id, 'studentId': student_id}
+
+    async def emit(event, data, nbytes=0):
+        sent = time.time()
+        await sio.emit(event, dict(ids, **data))
+        rec['sent'][event] += 1
+        rec['bytes_sent'] += nbytes
+        return sent
+
+    try:
+        joined = time.time()
+        await sio.emit('join_student', ids)
+        await asyncio.wait_for(options.wait(), timeout=120)
+        rec['admission'].append((time.time() - joined) * 1000)
+        await emit('options_confirmed', {})
+
+        async def every(interval, action):
+            wake = time.time() + random.uniform(0, interval())
+            while True:
+                await asyncio.sleep(max(0, min(wake, deadline) - time.time()))
+                if time.time() >= deadline:
+                    break
+                await action()
+                wake = time.time() + interval()
+
+        shots = iter(range(n, 1 << 30))
+
+        async def screenshot():
+            frame = frames[next(shots) % len(frames)]
+            sent = await emit('screenshot', {'screenshot': frame, 'mimeType': 'image/png',
+                                             'timestamp': datetime.now().isoformat()}, len(frame))
+            rec['screenshots'].append((sent, student_id, hashlib.sha256(frame).hexdigest()))
+
+        audio = iter(range(1 << 30))
+
+        async def audio_chunk():
+            piece = pieces[next(audio) % len(pieces)]
+            await emit('audio_chunk', {'audio': piece, 'timestamp': datetime.now().isoformat()}, len(piece))
+
+        tabs = iter(range(1, 1 << 30))
+
+        async def tab_changed():
+            rec['tab_changes'].append((await emit('tab_changed', {}), student_id, next(tabs)))
+
+        tasks = [every(lambda: cfg['heartbeat'], lambda: emit('heartbeat', {})),
+                 every(lambda: state['interval'], screenshot)]
+        if pieces:
+            tasks.append(every(lambda: cfg['audio_interval'], audio_chunk))
+        if cfg['tab_changes_per_minute'] > 0:
+            tasks.append(every(lambda: random.expovariate(cfg['tab_changes_per_minute'] / 60), tab_changed))
+        await asyncio.gather(*tasks)
+
+        total = math.ceil(cfg['upload_bytes'] / CHUNK_BYTES)
+        recording = os.urandom(cfg['upload_bytes'])
+        for index in range(total):
+            payload = recording[index * CHUNK_BYTES:(index + 1) * CHUNK_BYTES]
+            form = aiohttp.FormData()
+            for key, value in (('examId', exam_id), ('studentId', student_id), ('chunkIndex', str(index)),
+                               ('totalChunks', str(total)), ('filename', f'{exam_id}_{student_id}_recording.webm')):
+                form.add_field(key, value)
+            form.add_field('chunk', payload, filename=f'chunk-{index}')
+            started = time.time()
+            async with ctx['http'].post(f'{base}/upload_chunk', data=form, cookies=cookies) as res:
+                ok = res.status == 200 and (await res.json()).get('success')
+            rec['upload'].append((time.time() - started) * 1000)
+            rec['bytes_sent'] += len(payload)
+            if not ok:
+                rec['errors']['upload'] += 1
+        await emit('student_leave', {})
+    except Exception:
+        rec['errors']['lifecycle'] += 1
+    finally:
+        await sio.disconnect()
+
+
+async def drive(students, ctx):
+    rec = {'sent': defaultdict(int), 'errors': defaultdict(int), 'admission': [], 'upload': [], 'screenshots': [],
+           'tab_changes': [], 'bytes_sent': 0, 'profiles': 0}
+    cfg = ctx['config']
+    deadline = ctx['started'] + cfg['ramp'] + cfg['duration']
+    async with aiohttp.ClientSession(cookie_jar=aiohttp.DummyCookieJar()) as http:
+        ctx = dict(ctx, http=http)
+
+        async def launch(n):
+            await asyncio.sleep(max(0, ctx['started'] + cfg['ramp'] * n / cfg['students'] - time.time()))
+            await student(n, ctx, deadline, rec)
+        await asyncio.gather(*(launch(n) for n in students))
+    return {k: dict(v) if isinstance(v, defaultdict) else v for k, v in rec.items()}
+
+
+def worker(students, ctx):
+    """Entry point of one client process."""
+    resource.setrlimit(resource.RLIMIT_NOFILE, (resource.getrlimit(resource.RLIMIT_NOFILE)[1],) * 2)
+    ctx = dict(ctx, frames=screenshot_frames(16, ctx['config']['screenshot_bytes'], seed=ctx['seed']))
+    return asyncio.run(drive(students, ctx))
+
+
+class Teacher:
+    def __init__(self, base):
+        self.base = base
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.frames = []  # (received_at, students)
+        self.sio.on('dashboard', lambda frame: self.frames.append((time.time(), frame.get('students', {}))))
+
+    async def start(self, http):
+        async with http.post(f'{self.base}/login', json={'username': 'admin', 'password': 'password'}) as res:
+            assert (await res.json())['success'], 'teacher login failed'
+        async with http.get(f'{self.base}/create_exam') as res:
+            self.exam_id = (await res.json())['exam_id']
+        await self.sio.connect(self.base, transports=['websocket'])
+        await self.sio.emit('join_teacher', {'examId': self.exam_id})
+        await self.sio.emit('start_exam', {'examId': self.exam_id, 'options': OPTIONS})
+        return self.exam_id
+
+    def latencies(self, screenshots, tab_changes):
+        """Match each send to the first dashboard frame that shows it; returns latencies and unseen counts."""
+        pending_shots, pending_tabs = defaultdict(deque), {}
+        for sent, student_id, digest in sorted(screenshots):
+            pending_shots[student_id, digest].append(sent)
+        for sent, student_id, count in tab_changes:
+            pending_tabs[student_id, count] = sent
+        shots, tabs = [], []
+        for received, students in self.frames:
+            for student_id, fields in students.items():
+                if 'screenshot' in fields:
+                    queue = pending_shots.get((student_id, fields['screenshot'].rsplit('/', 1)[1]), ())
+                    while queue and queue[0] <= received:
+                        shots.append((received - queue.popleft()) * 1000)
+                if 'tabChanges' in fields:
+                    # Coalesced changes show up as one count; every earlier one was delivered by that frame.
+                    for count in range(fields['tabChanges'], 0, -1):
+                        sent = pending_tabs.pop((student_id, count), None)
+                        if sent is None:
+                            break
+                        tabs.append((received - sent) * 1000)
+        return shots, tabs, len(screenshots) - len(shots), len(tab_changes) - len(tabs)
+
+
+async def scenario(name, cfg, args):
+    port = free_port()
+    base = f'http://127.0.0.1:{port}'
+    workdir = tempfile.mkdtemp()
+    server = start_server(args.server, port, workdir, dict(args.env))
+    try:
+        async with aiohttp.ClientSession(cookie_jar=aiohttp.CookieJar(unsafe=True)) as http:  # cookies for 127.0.0.1
+            for _ in range(150):
+                try:
+                    async with http.get(f'{base}/login') as res:
+                        if res.status == 200:
+                            break
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.2)
+            else:
+                raise RuntimeError('server did not start')
+            teacher = Teacher(base)
+            exam_id = await teacher.start(http)
+            rss0, cpu0 = proc_sample(server.pid)
+            started = time.time() + 3  # client processes import and build their payloads first
+            ctx = {'base': base, 'exam_id': exam_id, 'config': cfg, 'started': started, 'audio': args.audio}
+            loop = asyncio.get_running_loop()
+            shares = [list(range(w, cfg['students'], args.workers)) for w in range(args.workers)]
+            with ProcessPoolExecutor(args.workers, mp_context=get_context('spawn')) as pool:
+                futures = [loop.run_in_executor(pool, worker, share, dict(ctx, seed=w))
+                           for w, share in enumerate(shares) if share]
+                samples = []
+                while not all(f.done() for f in futures):
+                    await asyncio.sleep(1)
+                    samples.append(proc_sample(server.pid))
+                records = [f.result() for f in futures]
+            window = time.time() - started
+            await asyncio.sleep(2 * float(dict(args.env).get('DASHBOARD_INTERVAL', 1)))  # the last frames
+            async with http.get(f'{base}/metrics') as res:
+                metrics = await res.json()
+            async with http.get(f'{base}/loadgen/stats') as res:
+                counters = await res.json()
+            await teacher.sio.disconnect()
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    merged = {'sent': defaultdict(int), 'errors': defaultdict(int)}
+    for rec in records:
+        for key in ('sent', 'errors'):
+            for k, v in rec[key].items():
+                merged[key][k] += v
+        for key in ('admission', 'upload', 'screenshots', 'tab_changes'):
+            merged.setdefault(key, []).extend(rec[key])
+        merged['bytes_sent'] = merged.get('bytes_sent', 0) + rec['bytes_sent']
+        merged['profiles'] = merged.get('profiles', 0) + rec['profiles']
+    shots, tabs, unseen_shots, unseen_tabs = teacher.latencies(merged['screenshots'], merged['tab_changes'])
+    events = sum(merged['sent'].values())
+    cpu = (samples[-1][1] - cpu0) / window if samples else 0.0
+    result = {
+        'scenario': name,
+        'config': cfg,
+        'throughput': {'events': events, 'events_per_second': round(events / window, 1), 'by_event': dict(merged['sent']),
+                       'teacher_frames': len(teacher.frames),
+                       'teacher_updates': sum(len(students) for _, students in teacher.frames),
+                       'capture_profiles_received': merged['profiles'], 'seconds': round(window, 1)},
+        'latency_ms': {'screenshot': percentiles(shots), 'tab_change': percentiles(tabs),
+                       'admission': percentiles(merged['admission']), 'upload': percentiles(merged['upload'])},
+        'unseen': {'screenshot': unseen_shots, 'tab_change': unseen_tabs},
+        'server': {'cpu_percent': round(100 * cpu, 1), 'rss_start_mb': round(rss0, 1),
+                   'rss_peak_mb': round(max((s[0] for s in samples), default=rss0), 1),
+                   'mb_in': round((counters.get('socket_in', 0) + counters.get('http_in', 0)) / 1e6, 2),
+                   'mb_out': round((counters.get('socket_out', 0) + counters.get('http_out', 0)) / 1e6, 2),
+                   'counters': counters, 'client_payload_mb': round(merged['bytes_sent'] / 1e6, 2)},
+        'errors': dict(merged['errors'], total=sum(merged['errors'].values())),
+        'metrics': metrics,
+    }
+    print_result(result)
+    return result
+
+
+def print_result(r):
+    t, s, lat = r['throughput'], r['server'], r['latency_ms']
+    print(f'== {r["scenario"]}: {r["config"]["students"]} students, {t["seconds"]:.0f} s')
+    print(f'   {t["events"]} events ({t["events_per_second"]}/s), {t["teacher_frames"]} dashboard frames, '
+          f'{t["teacher_updates"]} student updates; errors {r["errors"]["total"]}')
+    for kind, values in lat.items():
+        if values:
+            print(f'   {kind:>10}: p50 {values["p50"]:8.1f}  p95 {values["p95"]:8.1f}  p99 {values["p99"]:8.1f} ms'
+                  f'  ({values["count"]})')
+    print(f'   server: CPU {s["cpu_percent"]}%, RSS {s["rss_start_mb"]} -> {s["rss_peak_mb"]} MB, '
+          f'{s["mb_in"]} MB in, {s["mb_out"]} MB out')
+
+
+def run(args):
+    if os.cpu_count() > 1:
+        os.sched_setaffinity(0, set(range(1, os.cpu_count())))  # keep the clients off the server's core
+    args.audio = audio_pieces(DEFAULTS['audio_interval'] if args.audio_interval is None else args.audio_interval)
+    if not args.audio:
+        print('PyAV not installed: no audio pieces will be sent')
+    overrides = {key: getattr(args, key) for key in list(DEFAULTS) + ['students', 'duration']
+                 if getattr(args, key) is not None}
+    results = []
+    for name in args.scenario or ['smoke']:
+        cfg = {**DEFAULTS, **SCENARIOS[name], **overrides, 'fixed_capture': args.fixed_capture}
+        results.append(asyncio.run(scenario(name, cfg, args)))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip()
+    except OSError:
+        commit = None
+    output = args.output or f'loadgen-{args.server}-{datetime.now():%Y%m%d-%H%M%S}.json'
+    with open(output, 'w') as f:
+        json.dump({'started': datetime.now().isoformat(), 'commit': commit, 'server': args.server,
+                   'env': dict(args.env), 'workers': args.workers,
+                   'host': {'cpus': os.cpu_count(), 'python': platform.python_version(), 'platform': platform.platform()},
+                   'scenarios': results}, f, indent=2)
+    print(f'results saved to {output}')
+
+
+def compare(args):
+    runs = []
+    for path in args.files:
+        with open(path) as f:
+            runs.append({r['scenario']: r for r in json.load(f)['scenarios']})
+
+    def get(result, path):
+        for key in path:
+            result = (result or {}).get(key)
+        return result
+
+    width = max(12, *(len(os.path.basename(p)) for p in args.files))
+    for name in dict.fromkeys(n for run_ in runs for n in run_):
+        print(f'== {name}')
+        print(f'   {"":>18}' + ''.join(f'{os.path.basename(p):>{width + 2}}' for p in args.files))
+        for label, path in SUMMARY:
+            values = [get(run_.get(name), path) for run_ in runs]
+            print(f'   {label:>18}' + ''.join(f'{"-" if v is None else v:>{width + 2}}' for v in values))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command', required=True)
+    p = commands.add_parser('run', help='run scenarios and save the results as JSON')
+    p.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='repeatable; default smoke')
+    p.add_argument('--server', choices=['asgi', 'threading'], default='asgi')
+    p.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1), help='client processes')
+    p.add_argument('--students', type=int)
+    p.add_argument('--duration', type=float, help='seconds of activity after the ramp')
+    p.add_argument('--ramp', type=float, help='seconds over which students join')
+    for key in ('heartbeat', 'screenshot_interval', 'audio_interval', 'tab_changes_per_minute'):
+        p.add_argument('--' + key.replace('_', '-'), type=float)
+    for key in ('screenshot_bytes', 'upload_bytes'):
+        p.add_argument('--' + key.replace('_', '-'), type=int)
+    p.add_argument('--fixed-capture', action='store_true', help='ignore the server capture profile interval')
+    p.add_argument('--env', action='append', default=[], type=lambda kv: tuple(kv.split('=', 1)),
+                   help='server environment, e.g. --env DASHBOARD_INTERVAL=0.5 (repeatable)')
+    p.add_argument('--output', help='JSON results file (default loadgen-<server>-<time>.json)')
+    p.set_defaults(func=run)
+    p = commands.add_parser('compare', help='print result files side by side')
+    p.add_argument('files', nargs='+')
+    p.set_defaults(func=compare)
+    p = commands.add_parser('serve', help=argparse.SUPPRESS)
+    p.add_argument('--server', choices=['asgi', 'threading'], default='asgi')
+    p.add_argument('--port', type=int, required=True)
+    p.set_defaults(func=serve)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
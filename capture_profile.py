@@ -0,0 +1,168 @@
+"""Screenshot capture profiles negotiated from server load.
+
+The student page used to run html2canvas at scale 0.5, encode a PNG and
+send it every 5 s, whatever the size of the exam. Now the server picks a
+rung on ``LADDER`` for each exam, and the page uses it: the encoder
+(WebP or JPEG), its quality, the html2canvas scale and the capture
+interval. Rungs run from full fidelity down to a small frame every 20 s.
+Each rung sends between a half and three quarters of the bytes per second
+of the one above it.
+
+The rung of an exam is its size step plus a server-wide pressure level.
+
+- The size step comes from the number of students in the exam
+  (``STUDENT_STEPS``). A 50-student exam gets the top rung and a
+  1,000-student exam sits three rungs down.
+- Pressure rises by one rung for every tick on which media ingest is over
+  ``ingest_budget`` bytes/s or event-loop lag is over ``lag_budget``
+  seconds. It falls by one only after ``recover_ticks`` ticks in a row
+  under half of both budgets. A step back up at most doubles ingest, so
+  that margin keeps the level from bouncing between two rungs.
+
+An admitted student gets the exam's profile from ``attach``. When an
+exam's rung changes, ``on_change`` is called with the new profile and the
+sids on this worker. The lowest rungs use JPEG. Its frames are larger than
+WebP's, but Pillow decodes JPEG at reduced size, so dedup hashes it about
+ten times faster (see screenshot_dedup.py). That CPU is what a large exam
+runs out of.
+"""
+import bisect
+import logging
+import threading
+import time
+from collections import defaultdict
+
+log = logging.getLogger(__name__)
+
+# Best first. ``scale`` is html2canvas's, ``quality`` the encoder's (0-1), ``interval`` in ms.
+LADDER = (
+    {'format': 'image/webp', 'quality': 0.8, 'scale': 0.5, 'interval': 5000},
+    {'format': 'image/webp', 'quality': 0.65, 'scale': 0.5, 'interval': 7500},
+    {'format': 'image/webp', 'quality': 0.5, 'scale': 0.4, 'interval': 10000},
+    {'format': 'image/jpeg', 'quality': 0.5, 'scale': 0.25, 'interval': 15000},
+    {'format': 'image/jpeg', 'quality': 0.4, 'scale': 0.2, 'interval': 20000},
+)
+# Exam sizes past which each further rung down starts: 1-100 students, 101-250, ...
+STUDENT_STEPS = (100, 250, 500, 1000)
+
+
+class CaptureProfiles:
+    def __init__(self, ladder=LADDER, student_steps=STUDENT_STEPS, ingest_budget=4e6, lag_budget=0.1,
+                 tick=5.0, recover_ticks=3, count=None, lag_probe=None, on_change=None, clock=time.monotonic):
+        self.ladder = ladder
+        self.student_steps = student_steps
+        self.ingest_budget = ingest_budget
+        self.lag_budget = lag_budget
+        self.tick = tick
+        self.recover_ticks = recover_ticks
+        self.count = count  # exam_id -> students in the exam; defaults to those attached here
+        self.lag_probe = lag_probe  # seconds of event-loop lag; defaults to the ticker's own sleep overshoot
+        self.on_change = on_change
+        self.clock = clock
+        self._sids = defaultdict(dict)  # exam_id -> {student_id: sid}
+        self._rungs = {}  # exam_id -> rung last sent
+        self._ingested = 0
+        self._measured_at = clock()
+        self._pressure = 0
+        self._calm = 0
+        self._lock = threading.Lock()
+        self._running = False
+        self.stats = {'renegotiations': 0, 'changes': 0, 'pushes': 0, 'ingest_rate': 0, 'lag_ms': 0.0}
+
+    def _size(self, exam_id):
+        return self.count(exam_id) if self.count else len(self._sids.get(exam_id, ()))
+
+    def _rung(self, size):
+        step = bisect.bisect_left(self.student_steps, size)
+        return min(len(self.ladder) - 1, step + self._pressure)
+
+    def _profile(self, rung):
+        return dict(self.ladder[rung], level=rung)
+
+    def attach(self, exam_id, student_id, sid):
+        """Register an admitted student's socket; returns the profile to send it."""
+        with self._lock:
+            self._sids[exam_id][student_id] = sid
+            rung = self._rungs.get(exam_id)
+        if rung is None:
+            # ``count`` may query the registry, so it runs outside the lock.
+            size = self._size(exam_id)
+            with self._lock:
+                rung = self._rungs.setdefault(exam_id, self._rung(size))
+        return self._profile(rung)
+
+    def detach(self, exam_id, student_id):
+        with self._lock:
+            self._sids.get(exam_id, {}).pop(student_id, None)
+
+    def drop_exam(self, exam_id):
+        with self._lock:
+            self._sids.pop(exam_id, None)
+            self._rungs.pop(exam_id, None)
+
+    def ingested(self, nbytes):
+        """Count media bytes received (screenshots, audio) towards the ingest rate."""
+        with self._lock:
+            self._ingested += nbytes
+
+    def renegotiate(self, lag=0.0):
+        """Update pressure from ingest and ``lag``; returns ``[(exam_id, profile, sids)]`` that changed."""
+        with self._lock:
+            exam_ids = list(self._sids)
+        sizes = {exam_id: self._size(exam_id) for exam_id in exam_ids}
+        now = self.clock()
+        with self._lock:
+            rate = self._ingested / max(now - self._measured_at, 1e-3)
+            self._ingested = 0
+            self._measured_at = now
+            self.stats['renegotiations'] += 1
+            self.stats['ingest_rate'] = int(rate)
+            self.stats['lag_ms'] = round(lag * 1000, 1)
+            if rate > self.ingest_budget or lag > self.lag_budget:
+                self._pressure = min(len(self.ladder) - 1, self._pressure + 1)
+                self._calm = 0
+            elif rate < self.ingest_budget / 2 and lag < self.lag_budget / 2 and self._pressure:
+                self._calm += 1
+                if self._calm >= self.recover_ticks:
+                    self._pressure -= 1
+                    self._calm = 0
+            else:
+                self._calm = 0
+            changes = []
+            for exam_id, students in self._sids.items():
+                if exam_id not in sizes:
+                    continue  # attached since sizes were taken; attach set its rung
+                rung = self._rung(sizes[exam_id])
+                if students and self._rungs.get(exam_id) != rung:
+                    self._rungs[exam_id] = rung
+                    changes.append((exam_id, self._profile(rung), list(students.values())))
+            self.stats['changes'] += len(changes)
+            self.stats['pushes'] += sum(len(sids) for _, _, sids in changes)
+        if self.on_change:
+            for exam_id, profile, sids in changes:
+                try:
+                    self.on_change(exam_id, profile, sids)
+                except Exception:
+                    log.exception('pushing capture profile level %s for exam %s failed', profile['level'], exam_id)
+        return changes
+
+    def run(self, sleep=time.sleep):
+        """Renegotiate every ``tick``."""
+        self._running = True
+        while self._running:
+            started = self.clock()
+            sleep(self.tick)
+            overshoot = max(0.0, self.clock() - started - self.tick)
+            try:
+                self.renegotiate(self.lag_probe() if self.lag_probe else overshoot)
+            except Exception:
+                log.exception('capture profile renegotiation failed')
+
+    def stop(self):
+        self._running = False
+
+    def report(self):
+        with self._lock:
+            levels = dict(self._rungs)
+            students = sum(len(s) for s in self._sids.values())
+        return dict(self.stats, pressure=self._pressure, exams=levels, students=students)
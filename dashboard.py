@@ -0,0 +1,81 @@
+"""Per-exam dashboard state, pushed to the teacher as coalesced diffs.
+
+Student events no longer go to the proctor room one by one. Each handler
+updates the student's entry instead: status, last screenshot URL, latest
+audio/speech clip, tab-change count and last-seen time. A ticker calls
+``flush`` on a fixed interval and sends one frame per exam, holding only
+the students whose entry changed, and only the fields that changed. Any
+number of events from a student within one interval collapse into one
+update. The teacher's message rate therefore depends on the interval,
+not on how often students send.
+
+Last-seen alone does not make an entry dirty; otherwise every heartbeat
+would. It is sent along whenever something else about the student
+changes, and in the snapshot a joining teacher receives.
+"""
+import threading
+import time
+from collections import defaultdict
+
+
+class Dashboard:
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._students = defaultdict(dict)  # exam_id -> {student_id: entry}
+        self._pending = defaultdict(dict)  # exam_id -> {student_id: changed fields}
+        self._lock = threading.Lock()
+        self.stats = {'events': 0, 'coalesced': 0, 'frames': 0, 'updates_sent': 0}
+
+    def update(self, exam_id, student_id, **fields):
+        """Merge ``fields`` into the student's entry; changed fields go out with the next flush."""
+        with self._lock:
+            self._update(exam_id, student_id, fields)
+
+    def _update(self, exam_id, student_id, fields):
+        # Caller holds self._lock.
+        now = int(self.clock() * 1000)
+        self.stats['events'] += 1
+        entry = self._students[exam_id].setdefault(student_id, {})
+        entry['lastSeen'] = now
+        changed = {k: v for k, v in fields.items() if entry.get(k) != v}
+        if not changed:
+            return
+        entry.update(changed)
+        pending = self._pending[exam_id]
+        if student_id in pending:
+            self.stats['coalesced'] += 1
+        pending.setdefault(student_id, {}).update(changed, lastSeen=now)
+
+    def seen(self, exam_id, student_id):
+        with self._lock:
+            self.stats['events'] += 1
+            entry = self._students.get(exam_id, {}).get(student_id)
+            if entry is not None:
+                entry['lastSeen'] = int(self.clock() * 1000)
+
+    def tab_changed(self, exam_id, student_id):
+        with self._lock:
+            count = self._students.get(exam_id, {}).get(student_id, {}).get('tabChanges', 0) + 1
+            self._update(exam_id, student_id, {'status': 'tab_changed', 'tabChanges': count})
+
+    def snapshot(self, exam_id):
+        with self._lock:
+            return {student_id: dict(entry) for student_id, entry in self._students.get(exam_id, {}).items()}
+
+    def drop_exam(self, exam_id):
+        with self._lock:
+            self._students.pop(exam_id, None)
+            self._pending.pop(exam_id, None)
+
+    def flush(self):
+        """``[(exam_id, {student_id: changed fields})]`` for every exam with changes since the last flush."""
+        with self._lock:
+            frames = [(exam_id, students) for exam_id, students in self._pending.items() if students]
+            self._pending.clear()
+            self.stats['frames'] += len(frames)
+            self.stats['updates_sent'] += sum(len(students) for _, students in frames)
+        return frames
+
+    def report(self):
+        return dict(self.stats, exams=len(self._students),
+                    students=sum(len(students) for students in self._students.values()))
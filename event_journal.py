@@ -0,0 +1,146 @@
+"""Write-behind journal for high-frequency proctoring events.
+
+Socket handlers call ``journal.record(...)``, which only appends to a bounded
+in-memory queue. A background writer thread drains the queue and writes each
+batch to the ``events`` table in a single transaction. A batch is flushed
+when it reaches ``batch_size`` events or when its oldest event is
+``max_delay`` seconds old, whichever comes first. Some event types have a
+projection onto the current-state tables (a join inserts a ``students`` row,
+a leave deletes it). The projection is applied in the same transaction, so
+the audit trail and the state tables never disagree.
+
+When the queue is full, ``record`` blocks the caller for up to
+``put_timeout`` seconds. This is the backpressure. If the queue is still
+full, the event is dropped and counted. Heartbeats are recorded with
+``block=False`` because losing one is harmless.
+"""
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+from functions import sqlite_db as db
+
+log = logging.getLogger(__name__)
+
+INSERT_EVENT = "INSERT INTO events (ts, exam_id, student_id, type, payload) VALUES (?, ?, ?, ?, ?)"
+
+# event type -> (sql, fn(event) -> params) applied alongside the journal insert
+PROJECTIONS = {
+    'join': ("INSERT OR IGNORE INTO students (id, exam_id, joined_at) VALUES (?, ?, ?)",
+             lambda e: (e[2], e[1], e[0])),
+    'leave': ("DELETE FROM students WHERE id=? AND exam_id=?",
+              lambda e: (e[2], e[1])),
+}
+
+_STOP = object()
+
+
+class EventJournal:
+    def __init__(self, db_file=None, max_queue=50000, batch_size=500, max_delay=0.25, put_timeout=0.05):
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.stats = {'recorded': 0, 'written': 0, 'dropped': 0, 'batches': 0, 'errors': 0}
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                db.init_db(self.db_file)
+                self._thread = threading.Thread(target=self._run, name='event-journal', daemon=True)
+                self._thread.start()
+        return self
+
+    def record(self, event_type, exam_id, student_id=None, payload=None, block=True):
+        """Queue an event. Returns False if it had to be dropped."""
+        event = (datetime.now().isoformat(), exam_id, student_id, event_type,
+                 json.dumps(payload) if payload is not None else None)
+        try:
+            if block:
+                self._queue.put(event, timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait(event)
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+        self.stats['recorded'] += 1
+        return True
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def flush(self):
+        """Block until every event queued so far has been written."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def close(self):
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                self._queue.task_done()
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+        # Drain anything that raced in behind the stop marker.
+        rest = []
+        while True:
+            try:
+                rest.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        events = [e for e in rest if e is not _STOP]
+        if events:
+            self._write(events)
+        for _ in rest:
+            self._queue.task_done()
+
+    def _write(self, batch):
+        try:
+            with db.transaction(self.db_file) as c:
+                c.executemany(INSERT_EVENT, batch)
+                # Applied in arrival order so a leave followed by a rejoin ends joined.
+                for e in batch:
+                    projection = PROJECTIONS.get(e[3])
+                    if projection:
+                        c.execute(projection[0], projection[1](e))
+            self.stats['written'] += len(batch)
+            self.stats['batches'] += 1
+        except Exception as e:
+            self.stats['errors'] += 1
+            log.error(f'Event journal batch of {len(batch)} failed: {e}')
+
+
+journal = EventJournal()
+atexit.register(journal.close)
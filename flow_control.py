@@ -0,0 +1,177 @@
+"""Rate limits on incoming socket events and bounded outgoing queues.
+
+Incoming: every limited event type has a token bucket per connection,
+refilled at ``rate`` tokens per second up to ``burst``. Buckets are keyed
+by the Socket.IO sid, not the exam and student ids in the payload, which a
+client could vary at will; they are dropped when the socket disconnects. An event that
+finds its bucket empty is dropped before the handler runs, so it is not
+stored, logged or fanned out, and only counted. A client looping on
+``screenshot`` then costs one dict lookup per message, and everyone else
+in the exam is unaffected.
+
+Outgoing: Engine.IO keeps a queue of packets per connection, and that
+queue is unbounded. A teacher on a slow link would make it grow without
+limit. ``SendQueues`` installs queues that hold at most ``limit`` packets.
+Past that, the oldest *lossy* packet is dropped. Lossy packets are
+dashboard frames, which only carry screenshot and audio URLs and are
+superseded by later frames anyway. Control packets (pings, connects,
+options) are never dropped. A connection that lost a frame is reported by
+``take_resyncs`` so that the caller can send it a full snapshot.
+"""
+import asyncio
+import functools
+import queue
+import threading
+import time
+
+import engineio
+from engineio import packet as eio_packet
+
+# (rate per second, burst). The student page sends a screenshot every 5 s,
+# an audio piece every 10 s and a heartbeat every few seconds.
+DEFAULT_LIMITS = {
+    'screenshot': (1.0, 5),
+    'audio_chunk': (1.0, 5),
+    'tab_changed': (2.0, 10),
+    'heartbeat': (2.0, 10),
+}
+
+
+def parse_limits(spec, defaults=DEFAULT_LIMITS):
+    """``'screenshot=1/5,heartbeat=2/10'`` (rate/burst per event) merged over ``defaults``."""
+    limits = dict(defaults)
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        event, _, value = item.partition('=')
+        rate, _, burst = value.partition('/')
+        limits[event.strip()] = (float(rate), int(burst or max(1, float(rate))))
+    return limits
+
+
+class RateLimiter:
+    def __init__(self, limits=None, current_sid=None, clock=time.monotonic):
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.current_sid = current_sid  # sid of the socket whose event is being handled
+        self.clock = clock
+        self._buckets = {}  # sid -> {event: [tokens, refilled_at]}
+        self._lock = threading.Lock()
+        self.stats = {event: {'allowed': 0, 'throttled': 0} for event in self.limits}
+
+    def allow(self, event, sid):
+        limit = self.limits.get(event)
+        if limit is None:
+            return True
+        rate, burst = limit
+        now = self.clock()
+        with self._lock:
+            buckets = self._buckets.setdefault(sid, {})
+            bucket = buckets.get(event)
+            if bucket is None:
+                bucket = buckets[event] = [burst, now]
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            allowed = tokens >= 1
+            bucket[0] = tokens - 1 if allowed else tokens
+            self.stats[event]['allowed' if allowed else 'throttled'] += 1
+        return allowed
+
+    def limit(self, event):
+        """Handler decorator: events over the sender's limit are dropped before the handler runs."""
+        def admit(data):
+            return self.allow(event, self.current_sid())
+
+        def decorator(handler):
+            @functools.wraps(handler)
+            def limited(data):
+                return handler(data) if admit(data) else None
+            # The ASGI gateway calls ``admit`` on the event loop, so dropped events never take a worker,
+            # and then runs ``__wrapped__`` (set by functools.wraps) directly.
+            limited.admit = admit
+            return limited
+        return decorator
+
+    def forget(self, sid):
+        with self._lock:
+            self._buckets.pop(sid, None)
+
+    def report(self):
+        return dict(self.stats, buckets=len(self._buckets))
+
+
+def _drop_oldest(items, lossy, on_drop):
+    for i, pkt in enumerate(items):
+        if (pkt is not None and pkt.packet_type == eio_packet.MESSAGE and isinstance(pkt.data, str)
+                and pkt.data.startswith(lossy)):
+            del items[i]
+            on_drop(pkt)
+            return True
+    return False
+
+
+class BoundedSendQueue(queue.Queue):
+    def __init__(self, limit, lossy, on_drop):
+        super().__init__()
+        self.limit = limit
+        self.lossy = lossy
+        self.on_drop = on_drop
+
+    def _put(self, item):  # called with the queue's mutex held
+        self.queue.append(item)
+        if len(self.queue) > self.limit and _drop_oldest(self.queue, self.lossy, self._dropped):
+            self.unfinished_tasks -= 1  # keep join() balanced for the dropped packet
+
+    def _dropped(self, pkt):
+        self.on_drop(self, pkt)
+
+
+class AsyncBoundedSendQueue(asyncio.Queue):
+    def __init__(self, limit, lossy, on_drop):
+        super().__init__()
+        self.limit = limit
+        self.lossy = lossy
+        self.on_drop = on_drop
+
+    def _put(self, item):
+        self._queue.append(item)
+        if len(self._queue) > self.limit and _drop_oldest(self._queue, self.lossy, self._dropped):
+            self._unfinished_tasks -= 1
+
+    def _dropped(self, pkt):
+        self.on_drop(self, pkt)
+
+
+class SendQueues:
+    def __init__(self, limit=64, lossy_events=('dashboard',)):
+        self.limit = limit
+        # Socket.IO EVENT packets on the default namespace: 2["name",...]
+        self.lossy = tuple(f'2["{event}"' for event in lossy_events)
+        self.eio = None
+        self._resync = set()
+        self._lock = threading.Lock()
+        self.stats = {'queues': 0, 'dropped': 0}
+
+    def install(self, eio):
+        """Make ``eio`` (an Engine.IO server) create bounded queues for new connections."""
+        cls = AsyncBoundedSendQueue if isinstance(eio, engineio.AsyncServer) else BoundedSendQueue
+
+        def create_queue(*args, **kwargs):
+            self.stats['queues'] += 1
+            return cls(self.limit, self.lossy, self._dropped)
+        eio.create_queue = create_queue
+        self.eio = eio
+
+    def _dropped(self, send_queue, pkt):
+        with self._lock:
+            self.stats['dropped'] += 1
+            self._resync.add(send_queue)
+
+    def take_resyncs(self):
+        """Engine.IO sids of the connections that lost a packet since the last call."""
+        with self._lock:
+            pending, self._resync = self._resync, set()
+        if not pending or self.eio is None:
+            return []
+        return [eio_sid for eio_sid, sock in list(self.eio.sockets.items()) if sock.queue in pending]
+
+    def report(self):
+        depths = [sock.queue.qsize() for sock in list(self.eio.sockets.values())] if self.eio else []
+        return dict(self.stats, connections=len(depths), max_depth=max(depths, default=0), limit=self.limit)
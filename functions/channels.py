@@ -0,0 +1,35 @@
+"""Room and channel names for routing exam traffic.
+
+Each exam is split by audience. The proctor side receives student media
+(screenshots, audio) and status events. The student side receives only
+control events (options_push, exam_ended). Students never get each other's
+media, so the bytes fanned out per media event no longer grow with the
+number of students.
+
+Socket.IO (app.py) uses rooms. The serverless deployment uses Pusher
+channels. On Pusher, students send their client events on a per-student
+uplink channel, because a client has to be subscribed to a channel before
+it can trigger on it. Only the teacher subscribes to the uplink channels.
+Pusher accepts client events only on private channels, so uplink channels
+are private and subscriptions are authorized by functions/pusher_auth.py.
+"""
+
+
+def proctor_room(exam_id):
+    return f'{exam_id}:proctors'
+
+
+def student_room(exam_id):
+    return f'{exam_id}:students'
+
+
+def proctor_channel(exam_id):
+    return f'exam-{exam_id}-proctors'
+
+
+def student_channel(exam_id):
+    return f'exam-{exam_id}-students'
+
+
+def uplink_channel(exam_id, student_id):
+    return f'private-exam-{exam_id}-student-{student_id}'
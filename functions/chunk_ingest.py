@@ -0,0 +1,393 @@
+"""Offset-addressed, resumable chunk ingest for recording uploads.
+
+Chunk ``i`` is written with ``os.pwrite`` at ``i * chunk_size`` into a
+preallocated ``<name>.part`` file, so chunks can arrive in any order and in
+parallel. A manifest next to the upload records which chunks have arrived.
+It holds a bitmap and the length of the last chunk, and is updated under an
+``flock``, so several threads or worker processes can ingest the same upload
+safely. Retried chunks are idempotent. Once every bit is set, the file is
+truncated to its exact size and renamed into place. Only the call that
+completes the upload sees ``finalized=True``, so it alone records the
+recording.
+
+The declared size (``total_chunks * chunk_size``) is checked against
+``max_upload_bytes`` before anything is allocated. The manifest is removed
+once the upload completes. A retried chunk that arrives after that finds the
+finished file and is reported as a duplicate. ``abort`` discards an upload
+and ``abort_stale`` discards every upload left idle for too long.
+"""
+import glob
+import json
+import os
+import time
+
+from functions.keyed_locks import KeyedLocks
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: in-process locking only
+    fcntl = None
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.environ.get('PROCTOR_MAX_UPLOAD_BYTES', str(4 * 1024 ** 3)))
+MAX_SEGMENT_BYTES = int(os.environ.get('PROCTOR_MAX_SEGMENT_BYTES', str(16 * 1024 ** 2)))
+
+
+class UploadNotStarted(Exception):
+    """A chunk arrived before the upload it belongs to was created; the client retries it."""
+
+
+class UploadTooLarge(ValueError):
+    """A chunk, segment or whole upload is over its size limit."""
+
+
+class ChunkIngest:
+    def __init__(self, root, chunk_size=DEFAULT_CHUNK_SIZE, max_upload_bytes=MAX_UPLOAD_BYTES):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.max_upload_bytes = max_upload_bytes
+        self.state_dir = os.path.join(root, '.uploads')
+        self._locks = KeyedLocks()
+        os.makedirs(self.state_dir, exist_ok=True)
+
+    def final_path(self, name):
+        return os.path.join(self.root, name)
+
+    def part_path(self, name):
+        return os.path.join(self.state_dir, name + '.part')
+
+    def manifest_path(self, name):
+        return os.path.join(self.state_dir, name + '.manifest')
+
+    def _locked_manifest(self, name):
+        return _ManifestLock(self.manifest_path(name), self._locks, name)
+
+    def write_chunk(self, name, index, total_chunks, data):
+        """Write one chunk. Returns a status dict (see ``status``) plus ``duplicate``/``finalized``."""
+        if not 0 <= index < total_chunks:
+            raise ValueError(f'chunk index {index} out of range for {total_chunks} chunks')
+        if total_chunks * self.chunk_size > self.max_upload_bytes:
+            raise UploadTooLarge(f'upload of {total_chunks} chunks exceeds the {self.max_upload_bytes}-byte limit')
+        if len(data) > self.chunk_size or (index < total_chunks - 1 and len(data) != self.chunk_size):
+            raise ValueError(f'chunk {index} has {len(data)} bytes, expected {self.chunk_size}')
+        with self._locked_manifest(name) as lock:
+            manifest = lock.read()
+            if manifest is None:
+                if os.path.exists(self.final_path(name)):
+                    lock.remove()
+                    return dict(self._finished(name), duplicate=True, finalized=False)
+                manifest = self._new_upload(name, total_chunks)
+                lock.write(manifest)
+        if manifest['total_chunks'] != total_chunks:
+            raise ValueError(f'upload {name} was started with {manifest["total_chunks"]} chunks')
+        # The data write happens outside the lock so parallel chunks hit the disk concurrently;
+        # only the bitmap update is serialized.
+        if not manifest['complete'] and not _has_bit(manifest, index):
+            try:
+                fd = os.open(self.part_path(name), os.O_WRONLY)
+            except FileNotFoundError:  # finalized by a concurrent retry of this chunk
+                pass
+            else:
+                try:
+                    _pwrite_all(fd, data, index * self.chunk_size)
+                finally:
+                    os.close(fd)
+        finalized = False
+        with self._locked_manifest(name) as lock:
+            manifest = lock.read()
+            if manifest is None:  # completed or aborted by a concurrent call
+                lock.remove()
+                if not os.path.exists(self.final_path(name)):
+                    raise ValueError(f'upload {name} was aborted')
+                return dict(self._finished(name), duplicate=True, finalized=False)
+            duplicate = manifest['complete'] or _has_bit(manifest, index)
+            if not duplicate:
+                bitmap = bytearray.fromhex(manifest['bitmap'])
+                bitmap[index // 8] |= 1 << (index % 8)
+                manifest['bitmap'] = bitmap.hex()
+                manifest['received'] += 1
+                if index == total_chunks - 1:
+                    manifest['last_chunk_size'] = len(data)
+                if manifest['received'] == total_chunks:
+                    self._finalize(name, manifest)
+                    finalized = True
+            lock.write(manifest)
+            if manifest['complete']:
+                lock.remove()
+        status = self._status(manifest)
+        status.update(duplicate=duplicate, finalized=finalized)
+        return status
+
+    def status(self, name):
+        """``{'total', 'received', 'missing', 'complete'}`` for an upload, or None if unknown."""
+        if os.path.exists(self.manifest_path(name)):
+            with self._locked_manifest(name) as lock:
+                manifest = lock.read()
+            if manifest is not None:
+                return self._status(manifest)
+        if os.path.exists(self.final_path(name)):
+            return self._finished(name)
+        return None
+
+    def _finished(self, name):
+        # Every chunk but the last is full size, so the chunk count follows from the file size.
+        total = max(1, -(-os.path.getsize(self.final_path(name)) // self.chunk_size))
+        return {'total': total, 'received': total, 'missing': [], 'complete': True}
+
+    def abort(self, name):
+        """Discard an unfinished upload: its preallocated part file and its manifest."""
+        with self._locked_manifest(name) as lock:
+            try:
+                os.unlink(self.part_path(name))
+            except FileNotFoundError:
+                pass
+            lock.remove()
+
+    def abort_stale(self, max_age):
+        """Abort uploads whose manifest has not changed for ``max_age`` seconds; returns how many."""
+        return _abort_stale(self, self.manifest_path('*'), max_age)
+
+    def _status(self, manifest):
+        total = manifest['total_chunks']
+        bitmap = bytes.fromhex(manifest['bitmap'])
+        missing = [] if manifest['complete'] else [
+            i for i in range(total) if not bitmap[i // 8] & (1 << (i % 8))]
+        return {'total': total, 'received': manifest['received'], 'missing': missing,
+                'complete': manifest['complete']}
+
+    def _new_upload(self, name, total_chunks):
+        fd = os.open(self.part_path(name), os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            size = total_chunks * self.chunk_size
+            if hasattr(os, 'posix_fallocate'):
+                try:
+                    os.posix_fallocate(fd, 0, size)
+                except OSError:  # e.g. filesystems without fallocate support
+                    os.ftruncate(fd, size)
+            else:
+                os.ftruncate(fd, size)
+        finally:
+            os.close(fd)
+        return {'total_chunks': total_chunks, 'chunk_size': self.chunk_size, 'received': 0,
+                'bitmap': bytes((total_chunks + 7) // 8).hex(), 'last_chunk_size': None, 'complete': False}
+
+    def _finalize(self, name, manifest):
+        size = (manifest['total_chunks'] - 1) * self.chunk_size + manifest['last_chunk_size']
+        fd = os.open(self.part_path(name), os.O_WRONLY)
+        try:
+            os.ftruncate(fd, size)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(self.part_path(name), self.final_path(name))
+        manifest['complete'] = True
+
+
+def _has_bit(manifest, index):
+    return bool(bytes.fromhex(manifest['bitmap'][index // 8 * 2:index // 8 * 2 + 2])[0] & (1 << (index % 8)))
+
+
+def _pwrite_all(fd, data, offset):
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+class _ManifestLock:
+    """Thread lock plus an flock on the manifest file for cross-process exclusion."""
+
+    def __init__(self, path, locks, name):
+        self.path = path
+        self.locks = locks
+        self.name = name
+        self.fd = None
+
+    def __enter__(self):
+        self.locks.acquire(self.name)
+        try:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            if fcntl:
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+        except BaseException:
+            self.locks.release(self.name)
+            raise
+        return self
+
+    def read(self):
+        raw = b''
+        while True:
+            block = os.pread(self.fd, 65536, len(raw))
+            if not block:
+                break
+            raw += block
+        return json.loads(raw) if raw else None
+
+    def write(self, manifest):
+        raw = json.dumps(manifest).encode()
+        os.ftruncate(self.fd, 0)
+        _pwrite_all(self.fd, raw, 0)
+
+    def remove(self):
+        """Unlink the manifest while holding its lock; a waiter then reads what was last written."""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __exit__(self, *exc):
+        try:
+            os.close(self.fd)  # also releases the flock
+        finally:
+            self.locks.release(self.name)
+
+
+def _abort_stale(ingest, pattern, max_age):
+    cutoff = time.time() - max_age
+    suffix = pattern.rsplit('*', 1)[1]
+    aborted = 0
+    for path in glob.glob(pattern):
+        try:
+            if os.path.getmtime(path) >= cutoff:
+                continue
+        except FileNotFoundError:  # finished meanwhile
+            continue
+        ingest.abort(os.path.basename(path)[:-len(suffix)])
+        aborted += 1
+    return aborted
+
+
+class SegmentStream:
+    """Incremental assembly of a recording uploaded as ordered segments during the exam.
+
+    Segments (MediaRecorder timeslices) are appended to the recording file as
+    soon as every earlier segment is present. A segment that arrives early is
+    parked in the state directory until the gap is filled. So the file on
+    disk is always a valid prefix of the recording, even if the student's tab
+    crashes mid-exam. The client marks its last segment ``final``. The call
+    that appends the last missing segment gets ``finalized=True``, and the
+    manifest and any parked segments are removed.
+
+    A client gives up on a segment after a few failed attempts. Once
+    ``max_pending`` segments are parked behind a gap, the gap is skipped
+    (and counted in ``skipped``) instead of refusing every later segment.
+
+    A segment over ``max_segment_bytes``, or one that would take the
+    recording plus its parked segments past ``max_upload_bytes``, raises
+    ``UploadTooLarge``.
+    """
+
+    def __init__(self, root, max_pending=64, max_segment_bytes=MAX_SEGMENT_BYTES, max_upload_bytes=MAX_UPLOAD_BYTES):
+        self.root = root
+        self.max_pending = max_pending
+        self.max_segment_bytes = max_segment_bytes
+        self.max_upload_bytes = max_upload_bytes
+        self.state_dir = os.path.join(root, '.uploads')
+        self._locks = KeyedLocks()
+        os.makedirs(self.state_dir, exist_ok=True)
+
+    def final_path(self, name):
+        return os.path.join(self.root, name)
+
+    def _pending_path(self, name, seq):
+        return os.path.join(self.state_dir, f'{name}.seg{seq}')
+
+    def manifest_path(self, name):
+        return os.path.join(self.state_dir, name + '.segments')
+
+    def _locked_manifest(self, name):
+        return _ManifestLock(self.manifest_path(name), self._locks, name)
+
+    def append(self, name, seq, data, final=False):
+        """Accept segment ``seq``.
+
+        Returns ``{'next_seq', 'size', 'complete', 'duplicate', 'finalized', 'started', 'skipped'}``.
+        """
+        if len(data) > self.max_segment_bytes:
+            raise UploadTooLarge(f'segment {seq} has {len(data)} bytes, the limit is {self.max_segment_bytes}')
+        with self._locked_manifest(name) as lock:
+            manifest = lock.read()
+            if manifest is None and os.path.exists(self.final_path(name)):
+                # Finished (or abandoned) and cleaned up: a late retry changes nothing.
+                lock.remove()
+                return {'next_seq': seq + 1, 'size': os.path.getsize(self.final_path(name)), 'complete': True,
+                        'duplicate': True, 'finalized': False, 'started': False, 'skipped': 0}
+            manifest = manifest or {'next_seq': 0, 'size': 0, 'pending': [], 'final_seq': None}
+            manifest.setdefault('skipped', 0)
+            manifest.setdefault('parked', 0)
+            started = manifest['next_seq'] == 0 and not manifest['pending']
+            was_complete = self._complete(manifest)
+            duplicate = seq < manifest['next_seq'] or seq in manifest['pending']
+            if final:
+                manifest['final_seq'] = seq
+            if not duplicate and manifest['size'] + manifest['parked'] + len(data) > self.max_upload_bytes:
+                raise UploadTooLarge(f'recording {name} would exceed the {self.max_upload_bytes}-byte limit')
+            if not duplicate:
+                if seq > manifest['next_seq'] and len(manifest['pending']) >= self.max_pending:
+                    first = min(manifest['pending'])
+                    manifest['skipped'] += first - manifest['next_seq']
+                    manifest['next_seq'] = first
+                    self._drain(name, manifest)
+                if seq == manifest['next_seq']:
+                    self._append(name, manifest, data)
+                    self._drain(name, manifest)
+                else:
+                    with open(self._pending_path(name, seq), 'wb') as f:
+                        f.write(data)
+                    manifest['pending'].append(seq)
+                    manifest['parked'] += len(data)
+            lock.write(manifest)
+            complete = self._complete(manifest)
+            if complete:
+                self._discard_pending(name, manifest)
+                lock.remove()
+        return {'next_seq': manifest['next_seq'], 'size': manifest['size'], 'complete': complete,
+                'duplicate': duplicate, 'finalized': complete and not was_complete,
+                'started': started and not duplicate, 'skipped': manifest['skipped']}
+
+    def abort(self, name):
+        """Stop assembling a recording; what has been appended so far stays in place."""
+        with self._locked_manifest(name) as lock:
+            manifest = lock.read()
+            if manifest is not None:
+                self._discard_pending(name, manifest)
+            lock.remove()
+
+    def abort_stale(self, max_age):
+        """Abort recordings whose manifest has not changed for ``max_age`` seconds; returns how many."""
+        return _abort_stale(self, self.manifest_path('*'), max_age)
+
+    def _discard_pending(self, name, manifest):
+        # Segments parked past the final one (or behind a gap when aborted) are never appended.
+        for seq in manifest['pending']:
+            try:
+                os.unlink(self._pending_path(name, seq))
+            except FileNotFoundError:
+                pass
+        manifest['pending'] = []
+        manifest['parked'] = 0
+
+    def _append(self, name, manifest, data):
+        fd = os.open(self.final_path(name), os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            _pwrite_all(fd, data, manifest['size'])
+        finally:
+            os.close(fd)
+        manifest['size'] += len(data)
+        manifest['next_seq'] += 1
+
+    def _drain(self, name, manifest):
+        while manifest['next_seq'] in manifest['pending']:
+            seq = manifest['next_seq']
+            path = self._pending_path(name, seq)
+            with open(path, 'rb') as f:
+                data = f.read()
+            self._append(name, manifest, data)
+            manifest['parked'] -= len(data)
+            os.unlink(path)
+            manifest['pending'].remove(seq)
+
+    @staticmethod
+    def _complete(manifest):
+        return manifest['final_seq'] is not None and manifest['next_seq'] > manifest['final_seq']
@@ -0,0 +1,52 @@
+"""Lazily built, memoized service clients for the serverless handlers.
+
+A client (and the import of its SDK) is only paid for by the first
+invocation that needs it. Warm invocations reuse the cached instance.
+"""
+import os
+from functools import lru_cache
+
+BUCKET = os.environ.get('S3_BUCKET', 'proctor-recordings')
+
+
+@lru_cache(maxsize=None)
+def get_pusher():
+    from pusher import Pusher
+    return Pusher(
+        app_id=os.environ['PUSHER_APP_ID'],
+        key=os.environ['PUSHER_KEY'],
+        secret=os.environ['PUSHER_SECRET'],
+        cluster=os.environ['PUSHER_CLUSTER'],
+        ssl=True
+    )
+
+
+def s3_enabled():
+    return bool(os.environ.get('AWS_ACCESS_KEY_ID'))
+
+
+@lru_cache(maxsize=None)
+def get_s3():
+    """boto3 S3 client, or None when no AWS credentials are configured (local storage)."""
+    if not s3_enabled():
+        return None
+    import boto3
+    return boto3.client(
+        's3',
+        aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
+        endpoint_url=os.environ.get('S3_ENDPOINT_URL')  # e.g. a local MinIO for testing
+    )
+
+
+@lru_cache(maxsize=None)
+def get_fauna():
+    """FaunaClient; FAUNA_DOMAIN/FAUNA_PORT/FAUNA_SCHEME point it at a local Fauna dev container."""
+    from faunadb.client import FaunaClient
+    port = os.environ.get('FAUNA_PORT')
+    return FaunaClient(
+        secret=os.environ['FAUNA_SECRET'],
+        domain=os.environ.get('FAUNA_DOMAIN', 'db.fauna.com'),
+        scheme=os.environ.get('FAUNA_SCHEME', 'https'),
+        port=int(port) if port else None
+    )
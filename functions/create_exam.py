@@ -2,6 +2,7 @@ import json
 from http import HTTPStatus
 import uuid
 from functions.db import create_exam
+from functions.pusher_auth import proctor_token
 
 def handler(event, context):
     try:
@@ -9,7 +10,7 @@ def handler(event, context):
         create_exam(exam_id)
         return {
             'statusCode': HTTPStatus.OK,
-            'body': json.dumps({'exam_id': exam_id})
+            'body': json.dumps({'exam_id': exam_id, 'proctor_token': proctor_token(exam_id)})
         }
     except Exception as e:
         return {
@@ -2,87 +2,142 @@ import os
 import json
 from datetime import datetime
 import uuid
-from faunadb import query as q
-from faunadb.client import FaunaClient
-import sqlite3
+from functions import sqlite_db
+from functions.clients import get_fauna
+from functions.exam_cache import ExamState, ExamStateCache, sqlite_loader
 
 USE_FAUNA = bool(os.environ.get('FAUNA_SECRET'))
 
+# Collections and indexes are created by `python -m functions.provision`, not on every cold start.
 if USE_FAUNA:
-    client = FaunaClient(secret=os.environ['FAUNA_SECRET'])
-    # Create collections and indexes (run once)
-    try:
-        client.query(q.CreateCollection({'name': 'exams'}))
-        client.query(q.CreateIndex({'name': 'exams_by_id', 'source': q.Collection('exams'), 'terms': [{'field': ['data', 'id']}], 'unique': True}))
-        client.query(q.CreateCollection({'name': 'students'}))
-        client.query(q.CreateIndex({'name': 'students_by_id', 'source': q.Collection('students'), 'terms': [{'field': ['data', 'id']}], 'unique': True}))
-        client.query(q.CreateCollection({'name': 'recordings'}))
-    except:
-        pass  # Collections/indexes exist
+    from faunadb import query as q
+    from faunadb.errors import NotFound
 else:
-    DB_FILE = 'proctoring.db'
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS exams (id TEXT PRIMARY KEY, options TEXT, active INTEGER, created_at TEXT)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS students (id TEXT PRIMARY KEY, exam_id TEXT, joined_at TEXT)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS recordings (id TEXT PRIMARY KEY, exam_id TEXT, student_id TEXT, filename TEXT, uploaded_at TEXT)''')
-    conn.commit()
-    conn.close()
+    sqlite_db.init_db()
+
+# exam id -> Fauna document ref. Exam documents are never re-created under the same id, so a
+# cached ref stays valid for the life of the function instance and saves the index read.
+_exam_refs = {}
+
+def _exam_ref(exam_id):
+    return _exam_refs.get(exam_id) or q.Select('ref', q.Get(q.Match(q.Index('exams_by_id'), exam_id)))
+
+def _exam_doc(exam_id):
+    ref = _exam_refs.get(exam_id)
+    return q.Get(ref) if ref else q.Get(q.Match(q.Index('exams_by_id'), exam_id))
+
+def _fauna_query(exam_id, build):
+    """Run ``build()`` in one round trip, dropping a cached exam ref once if it has gone stale."""
+    try:
+        return get_fauna().query(build())
+    except NotFound:
+        if _exam_refs.pop(exam_id, None) is None:
+            raise
+        return get_fauna().query(build())
+
+def _state_from_fauna(data):
+    if data is None:
+        return None
+    options = data.get('options')
+    return ExamState(json.loads(options) if options else None, bool(data.get('active')), data.get('started_at'))
+
+def _load_exam_state(exam_id):
+    if not USE_FAUNA:
+        return sqlite_loader(exam_id)
+    try:
+        result = _fauna_query(exam_id, lambda: _exam_doc(exam_id))
+    except NotFound:
+        return None
+    _exam_refs[exam_id] = result['ref']
+    return _state_from_fauna(result['data'])
+
+exam_cache = ExamStateCache(_load_exam_state)
 
 def create_exam(exam_id):
     if USE_FAUNA:
-        client.query(q.Create(q.Collection('exams'), {'data': {'id': exam_id, 'active': 0, 'created_at': datetime.now().isoformat()}}))
+        result = get_fauna().query(q.Create(q.Collection('exams'), {'data': {'id': exam_id, 'active': 0, 'created_at': datetime.now().isoformat()}}))
+        _exam_refs[exam_id] = result['ref']
     else:
-        conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-        c = conn.cursor()
-        c.execute("INSERT INTO exams (id, active, created_at) VALUES (?, 0, ?)", (exam_id, datetime.now().isoformat()))
-        conn.commit()
-        conn.close()
+        sqlite_db.execute("INSERT INTO exams (id, active, created_at) VALUES (?, 0, ?)", (exam_id, datetime.now().isoformat()))
+    exam_cache.invalidate(exam_id)
 
 def get_exam_options(exam_id):
-    if USE_FAUNA:
-        try:
-            result = client.query(q.Get(q.Match(q.Index('exams_by_id'), exam_id)))
-            return json.loads(result['data'].get('options', '{}'))
-        except:
-            return {}
-    else:
-        conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-        c = conn.cursor()
-        c.execute("SELECT options FROM exams WHERE id=?", (exam_id,))
-        row = c.fetchone()
-        conn.close()
-        return json.loads(row[0]) if row and row[0] else {}
+    state = exam_cache.get(exam_id)
+    return (state.options or {}) if state else {}
 
 def update_exam_options(exam_id, options):
+    """Store the options of a starting exam and write them through to the cache."""
     options_json = json.dumps(options)
+    started_at = datetime.now().isoformat()
+    if USE_FAUNA:
+        result = _fauna_query(exam_id, lambda: q.Update(_exam_ref(exam_id), {'data': {'options': options_json, 'active': 1, 'started_at': started_at}}))
+        _exam_refs[exam_id] = result['ref']
+    else:
+        sqlite_db.execute("UPDATE exams SET options=?, active=1, started_at=? WHERE id=?", (options_json, started_at, exam_id))
+    exam_cache.put(exam_id, ExamState(options, True, started_at))
+
+def end_exam(exam_id):
+    """Mark the exam inactive and clear its options, so late joiners are not prompted."""
     if USE_FAUNA:
-        client.query(q.Update(q.Select('ref', q.Get(q.Match(q.Index('exams_by_id'), exam_id))), {'data': {'options': options_json, 'active': 1}}))
+        result = _fauna_query(exam_id, lambda: q.Update(_exam_ref(exam_id), {'data': {'options': '{}', 'active': 0}}))
+        _exam_refs[exam_id] = result['ref']
+        started_at = result['data'].get('started_at')
     else:
-        conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-        c = conn.cursor()
-        c.execute("UPDATE exams SET options=?, active=1 WHERE id=?", (options_json, exam_id))
-        conn.commit()
-        conn.close()
+        sqlite_db.execute("UPDATE exams SET options='{}', active=0 WHERE id=?", (exam_id,))
+        started_at = (sqlite_db.fetchone("SELECT started_at FROM exams WHERE id=?", (exam_id,)) or (None,))[0]
+    exam_cache.put(exam_id, ExamState({}, False, started_at))
 
 def add_student(student_id, exam_id):
+    add_students([(student_id, exam_id)])
+
+def add_students(students):
+    """Bulk insert ``(student_id, exam_id)`` pairs: one Fauna query or one SQLite transaction."""
+    joined_at = datetime.now().isoformat()
     if USE_FAUNA:
-        client.query(q.Create(q.Collection('students'), {'data': {'id': student_id, 'exam_id': exam_id, 'joined_at': datetime.now().isoformat()}}))
+        docs = [{'id': student_id, 'exam_id': exam_id, 'joined_at': joined_at} for student_id, exam_id in students]
+        get_fauna().query(q.Map(docs, q.Lambda('doc', q.Create(q.Collection('students'), {'data': q.Var('doc')}))))
     else:
-        conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-        c = conn.cursor()
-        c.execute("INSERT OR IGNORE INTO students (id, exam_id, joined_at) VALUES (?, ?, ?)", (student_id, exam_id, datetime.now().isoformat()))
-        conn.commit()
-        conn.close()
+        sqlite_db.executemany("INSERT OR IGNORE INTO students (id, exam_id, joined_at) VALUES (?, ?, ?)",
+                              [(student_id, exam_id, joined_at) for student_id, exam_id in students])
+
+def join_exam(student_id, exam_id):
+    """Add the student and return the exam's options; a single round trip on Fauna.
+
+    On a cache hit only the student is written. On a miss, the Fauna query that
+    creates the student also reads the exam and fills the cache.
+    """
+    if not USE_FAUNA:
+        add_student(student_id, exam_id)
+        return get_exam_options(exam_id)
+    def build():
+        create = q.Create(q.Collection('students'), {'data': {'id': student_id, 'exam_id': exam_id, 'joined_at': datetime.now().isoformat()}})
+        exam = {'ref': q.Select('ref', q.Var('exam')), 'data': q.Select('data', q.Var('exam'))}
+        if exam_id in _exam_refs:
+            return q.Do(create, q.Let({'exam': _exam_doc(exam_id)}, exam))
+        match = q.Match(q.Index('exams_by_id'), exam_id)
+        return q.Do(create, q.If(q.Exists(match), q.Let({'exam': q.Get(match)}, exam), {'ref': None, 'data': None}))
+    joined = []
+    def load_and_join(exam_id):
+        result = _fauna_query(exam_id, build)
+        joined.append(True)
+        if result['ref'] is not None:
+            _exam_refs[exam_id] = result['ref']
+        return _state_from_fauna(result['data'])
+    state = exam_cache.get(exam_id, loader=load_and_join)
+    if not joined:
+        add_student(student_id, exam_id)
+    return (state.options or {}) if state else {}
 
 def save_recording(exam_id, student_id, filename):
-    recording_id = str(uuid.uuid4())[:8]
+    return save_recordings([(exam_id, student_id, filename)])[0]
+
+def save_recordings(recordings):
+    """Bulk insert ``(exam_id, student_id, filename)`` rows; returns the new recording ids in order."""
+    uploaded_at = datetime.now().isoformat()
+    rows = [(str(uuid.uuid4())[:8], exam_id, student_id, filename, uploaded_at) for exam_id, student_id, filename in recordings]
     if USE_FAUNA:
-        client.query(q.Create(q.Collection('recordings'), {'data': {'id': recording_id, 'exam_id': exam_id, 'student_id': student_id, 'filename': filename, 'uploaded_at': datetime.now().isoformat()}}))
+        docs = [{'id': r[0], 'exam_id': r[1], 'student_id': r[2], 'filename': r[3], 'uploaded_at': r[4]} for r in rows]
+        get_fauna().query(q.Map(docs, q.Lambda('doc', q.Create(q.Collection('recordings'), {'data': q.Var('doc')}))))
     else:
-        conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-        c = conn.cursor()
-        c.execute("INSERT INTO recordings (id, exam_id, student_id, filename, uploaded_at) VALUES (?, ?, ?, ?, ?)", (recording_id, exam_id, student_id, filename, datetime.now().isoformat()))
-        conn.commit()
-        conn.close()
-    return recording_id
+        sqlite_db.executemany("INSERT INTO recordings (id, exam_id, student_id, filename, uploaded_at) VALUES (?, ?, ?, ?, ?)", rows)
+    return [r[0] for r in rows]
@@ -1,37 +1,34 @@
 import json
 from http import HTTPStatus
-import boto3
+import base64
+import mmap
 import os
+from functions.clients import BUCKET, get_s3
+from functions.http_range import RangeNotSatisfiable, file_etag, not_modified, parse_range, range_applies
 
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY')
-) if os.environ.get('AWS_ACCESS_KEY_ID') else None
-BUCKET = os.environ.get('S3_BUCKET', 'proctor-recordings')
+# Function responses are size-capped, so no response carries more than this many bytes. A request
+# without Range for a larger file gets the first window as a 206, and video players fetch the rest
+# with follow-up Range requests.
+MAX_RESPONSE_BYTES = 4 * 1024 * 1024
 
 def handler(event, context):
     try:
-        filename = event['pathParameters']['filename']
+        filename = os.path.basename(event['pathParameters']['filename'])
+        headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+        s3_client = get_s3()
         if s3_client:
-            key = filename
-            url = s3_client.generate_presigned_url('get_object', Params={'Bucket': BUCKET, 'Key': key}, ExpiresIn=3600)
+            # S3 serves Range/If-Range itself; the browser repeats its Range header on the redirect.
+            url = s3_client.generate_presigned_url('get_object', Params={
+                'Bucket': BUCKET, 'Key': filename, 'ResponseContentType': 'video/webm'}, ExpiresIn=3600)
             return {
                 'statusCode': HTTPStatus.FOUND,
-                'headers': {'Location': url},
+                'headers': {'Location': url, 'Cache-Control': 'no-store'},
                 'body': ''
             }
         else:
             filepath = os.path.join('recordings', filename)
             if os.path.exists(filepath):
-                with open(filepath, 'rb') as f:
-                    content = f.read()
-                return {
-                    'statusCode': HTTPStatus.OK,
-                    'headers': {'Content-Type': 'video/webm', 'Content-Disposition': f'attachment; filename="{filename}"'},
-                    'body': base64.b64encode(content).decode(),
-                    'isBase64Encoded': True
-                }
+                return serve_local(filepath, filename, headers)
             else:
                 return {
                     'statusCode': HTTPStatus.NOT_FOUND,
@@ -42,3 +39,40 @@ def handler(event, context):
             'statusCode': HTTPStatus.INTERNAL_SERVER_ERROR,
             'body': json.dumps({'error': str(e)})
         }
+
+def serve_local(filepath, filename, headers):
+    with open(filepath, 'rb') as f:
+        st = os.fstat(f.fileno())
+        size = st.st_size
+        etag = file_etag(st)
+        base_headers = {'Accept-Ranges': 'bytes', 'ETag': etag, 'Content-Type': 'video/webm',
+                        'Content-Disposition': f'attachment; filename="{filename}"'}
+        if not_modified(headers, etag):
+            return {'statusCode': HTTPStatus.NOT_MODIFIED, 'headers': base_headers, 'body': ''}
+        try:
+            byte_range = parse_range(headers.get('range'), size) if range_applies(headers, etag) else None
+        except RangeNotSatisfiable:
+            return {'statusCode': HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE,
+                    'headers': dict(base_headers, **{'Content-Range': f'bytes */{size}'}), 'body': ''}
+        if byte_range is None and size <= MAX_RESPONSE_BYTES:
+            start, end, status = 0, size - 1, HTTPStatus.OK
+        else:
+            start, end = byte_range or (0, size - 1)
+            end = min(end, start + MAX_RESPONSE_BYTES - 1)
+            status = HTTPStatus.PARTIAL_CONTENT
+        if size == 0:
+            body = ''
+        else:
+            # Only the requested window is paged in; it is encoded straight from the mapping.
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as view:
+                    body = base64.b64encode(view[start:end + 1]).decode()
+    response_headers = dict(base_headers, **{'Content-Length': str(end - start + 1 if size else 0)})
+    if status == HTTPStatus.PARTIAL_CONTENT:
+        response_headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return {
+        'statusCode': status,
+        'headers': response_headers,
+        'body': body,
+        'isBase64Encoded': True
+    }
@@ -0,0 +1,85 @@
+"""Process-wide cache of per-exam state (parsed options, active flag, start time).
+
+Options only change when an exam is started or ended, so joins read them from
+here instead of querying the exams table and parsing the JSON again. The
+start/end handlers write through with ``put``. Entries also expire after
+``ttl`` seconds, so a process that missed the write (another worker or
+function instance) catches up. Concurrent misses for the same exam are
+coalesced, so a join storm performs one load. A load that races with a
+``put`` is discarded, so the cache never ends up with an older state.
+"""
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+from functions.keyed_locks import KeyedLocks
+
+DEFAULT_TTL = float(os.environ.get('PROCTOR_EXAM_CACHE_TTL', '10'))
+
+ExamState = namedtuple('ExamState', 'options active started_at')
+
+
+def sqlite_loader(exam_id):
+    from functions import sqlite_db
+    row = sqlite_db.fetchone("SELECT options, active, started_at FROM exams WHERE id=?", (exam_id,))
+    if row is None:
+        return None
+    options, active, started_at = row
+    return ExamState(json.loads(options) if options else None, bool(active), started_at)
+
+
+class ExamStateCache:
+    def __init__(self, loader=sqlite_loader, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.loader = loader
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = {}  # exam_id -> (expires_at, ExamState or None)
+        self._versions = {}  # exam_id -> number of puts/invalidations
+        self._key_locks = KeyedLocks()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'puts': 0, 'invalidations': 0}
+
+    def get(self, exam_id, loader=None):
+        """ExamState for the exam, or None if it does not exist.
+
+        ``loader`` overrides the cache's loader for this call, e.g. with a query that also
+        does other work in the same round trip. It runs only on a miss.
+        """
+        entry = self._entries.get(exam_id)
+        if entry and entry[0] > self.clock():
+            self.stats['hits'] += 1
+            return entry[1]
+        with self._key_locks.hold(exam_id):
+            entry = self._entries.get(exam_id)
+            if entry and entry[0] > self.clock():  # loaded by the thread we waited for
+                self.stats['coalesced'] += 1
+                return entry[1]
+            self.stats['misses'] += 1
+            version = self._versions.get(exam_id, 0)
+            state = (loader or self.loader)(exam_id)
+            with self._lock:
+                if self._versions.get(exam_id, 0) == version:
+                    self._entries[exam_id] = (self.clock() + self.ttl, state)
+            return state
+
+    def put(self, exam_id, state):
+        """Write-through after the exam row has been updated in storage."""
+        with self._lock:
+            self._versions[exam_id] = self._versions.get(exam_id, 0) + 1
+            self._entries[exam_id] = (self.clock() + self.ttl, state)
+        self.stats['puts'] += 1
+
+    def invalidate(self, exam_id):
+        with self._lock:
+            self._versions[exam_id] = self._versions.get(exam_id, 0) + 1
+            self._entries.pop(exam_id, None)
+        self.stats['invalidations'] += 1
+
+    def hit_ratio(self):
+        lookups = self.stats['hits'] + self.stats['coalesced'] + self.stats['misses']
+        return (lookups - self.stats['misses']) / lookups if lookups else 0.0
+
+    def report(self):
+        return dict(self.stats, entries=len(self._entries), hit_ratio=round(self.hit_ratio(), 4))
@@ -0,0 +1,49 @@
+"""HTTP Range / conditional request helpers for recording downloads."""
+import re
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def file_etag(st):
+    """Strong validator from size and mtime. It changes whenever a streamed recording grows."""
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def parse_range(header, size):
+    """``(start, end)`` inclusive for a single-range ``Range`` header, or None for the whole file.
+
+    Multi-range requests are answered with the whole file, as RFC 9110 allows.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:  # suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+
+def range_applies(headers, etag):
+    """False when ``If-Range`` names a different representation, in which case Range is ignored."""
+    if_range = headers.get('if-range')
+    return not if_range or if_range.strip() == etag
+
+
+def not_modified(headers, etag):
+    tags = headers.get('if-none-match')
+    return bool(tags) and (tags.strip() == '*' or etag in [t.strip() for t in tags.split(',')])
@@ -0,0 +1,43 @@
+"""Per-key thread locks that are dropped once nobody holds or waits on them.
+
+Uploads, audio streams and exam loads each serialize on a lock per name. A
+plain dict of locks keeps one entry for every name ever seen. Popping the
+entry when the upload finishes is not safe either: a thread already waiting
+on the old lock and a newcomer holding a fresh one would both get in. So
+each entry counts its holders and waiters, and the last one out removes it.
+"""
+import threading
+from contextlib import contextmanager
+
+
+class KeyedLocks:
+    def __init__(self):
+        self._locks = {}  # key -> [lock, holders and waiters]
+        self._guard = threading.Lock()
+
+    def acquire(self, key):
+        with self._guard:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        entry[0].acquire()
+
+    def release(self, key):
+        with self._guard:
+            entry = self._locks[key]
+            entry[0].release()
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    @contextmanager
+    def hold(self, key):
+        self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    def __len__(self):
+        return len(self._locks)
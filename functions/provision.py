@@ -0,0 +1,55 @@
+"""One-shot schema provisioning: ``python -m functions.provision``.
+
+Creates the Fauna collections and indexes when FAUNA_SECRET is set,
+otherwise the SQLite tables. Run it once per environment (or from a deploy
+step), not from the request path. Existing objects are reported and skipped.
+"""
+import os
+import sys
+
+FAUNA_SCHEMA = [
+    ('collection', {'name': 'exams'}),
+    ('index', {'name': 'exams_by_id', 'source': 'exams', 'terms': [{'field': ['data', 'id']}], 'unique': True}),
+    ('collection', {'name': 'students'}),
+    ('index', {'name': 'students_by_id', 'source': 'students', 'terms': [{'field': ['data', 'id']}], 'unique': True}),
+    ('collection', {'name': 'recordings'}),
+]
+
+
+def provision_fauna():
+    from faunadb import query as q
+    from faunadb.errors import BadRequest
+    from functions.clients import get_fauna
+    client = get_fauna()
+    failed = 0
+    for kind, params in FAUNA_SCHEMA:
+        if kind == 'collection':
+            expr = q.CreateCollection(params)
+        else:
+            expr = q.CreateIndex(dict(params, source=q.Collection(params['source'])))
+        try:
+            client.query(expr)
+            print(f'created {kind} {params["name"]}')
+        except BadRequest as e:
+            if 'instance already exists' not in str(e):
+                print(f'failed {kind} {params["name"]}: {e}', file=sys.stderr)
+                failed += 1
+                continue
+            print(f'exists  {kind} {params["name"]}')
+    return failed
+
+
+def provision_sqlite():
+    from functions import sqlite_db
+    sqlite_db.init_db()
+    print(f'initialised {sqlite_db.DB_FILE}')
+    return 0
+
+
+def main():
+    failed = provision_fauna() if os.environ.get('FAUNA_SECRET') else provision_sqlite()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
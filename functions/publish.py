@@ -0,0 +1,94 @@
+"""Pusher publishing for the serverless handlers.
+
+The events one invocation triggers are collected and sent together: a
+single event goes out with ``trigger``, and several go out as one
+``trigger_batch`` request (Pusher accepts up to 10 events per batch). The
+Pusher client comes from ``functions.clients.get_pusher`` and is memoized,
+so its HTTP session, and with it the keep-alive connection to the Pusher
+API, is reused across warm invocations.
+
+With ``PUSHER_ASYNC=1`` the send happens on a background thread and the
+handler returns without waiting for it. Only use this when a late or lost
+notification is acceptable. Once the response is returned, the platform
+may freeze the instance until its next invocation, so the publish can be
+delayed. If the instance is recycled before then, it is lost. Async errors
+are only counted and logged.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from functions.clients import get_pusher
+
+MAX_BATCH = 10
+
+log = logging.getLogger(__name__)
+
+
+class Publisher:
+    def __init__(self, client_factory=get_pusher, async_mode=None):
+        self.client_factory = client_factory
+        self.async_mode = os.environ.get('PUSHER_ASYNC') == '1' if async_mode is None else async_mode
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.stats = {'events': 0, 'requests': 0, 'errors': 0}
+
+    @contextmanager
+    def batch(self):
+        """Collect ``events.trigger(channel, event, data)`` calls and publish them on exit."""
+        events = EventBatch()
+        yield events
+        self.publish(events.events)
+
+    def trigger(self, channel, event, data):
+        self.publish([{'channel': channel, 'name': event, 'data': data}])
+
+    def publish(self, events):
+        if not events:
+            return
+        if not self.async_mode:
+            self._send(events)
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pusher-publish')
+            future = self._executor.submit(self._send_logged, events)
+            self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+
+    def drain(self, timeout=None):
+        """Wait for async publishes still in flight."""
+        for future in list(self._pending):
+            future.result(timeout)
+
+    def _send(self, events):
+        client = self.client_factory()
+        for i in range(0, len(events), MAX_BATCH):
+            chunk = events[i:i + MAX_BATCH]
+            if len(chunk) == 1:
+                client.trigger(chunk[0]['channel'], chunk[0]['name'], chunk[0]['data'])
+            else:
+                client.trigger_batch(chunk)
+            self.stats['requests'] += 1
+            self.stats['events'] += len(chunk)
+
+    def _send_logged(self, events):
+        try:
+            self._send(events)
+        except Exception:
+            self.stats['errors'] += 1
+            log.exception('async Pusher publish of %d events failed', len(events))
+
+
+class EventBatch:
+    def __init__(self):
+        self.events = []
+
+    def trigger(self, channel, event, data):
+        self.events.append({'channel': channel, 'name': event, 'data': data})
+
+
+publisher = Publisher()
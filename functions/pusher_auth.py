@@ -0,0 +1,70 @@
+"""Pusher channel authorization for the private uplink channels.
+
+Pusher delivers client events only on private (or presence) channels, and
+a client may subscribe to one only with a signature from this endpoint.
+Each uplink channel (see channels.py) may be joined by two parties:
+
+- the student it belongs to, whose page was rendered with a token for
+  that channel;
+- the teacher of the exam, who gets a proctor token from create_exam.
+
+Tokens are HMACs under the Pusher app secret, so no state is kept. Client
+events must also be enabled in the Pusher app settings.
+"""
+import hashlib
+import hmac
+import json
+import os
+import re
+from http import HTTPStatus
+from urllib.parse import parse_qs
+
+from functions.clients import get_pusher
+from functions.multipart import decode_body
+
+_UPLINK = re.compile(r'private-exam-([^-]+)-student-[^-]+')
+
+
+def _sign(value):
+    return hmac.new(os.environ['PUSHER_SECRET'].encode(), value.encode(), hashlib.sha256).hexdigest()
+
+
+def uplink_token(channel):
+    return _sign(f'uplink:{channel}')
+
+
+def proctor_token(exam_id):
+    return _sign(f'proctor:{exam_id}')
+
+
+def authorized(channel, token):
+    match = _UPLINK.fullmatch(channel)
+    if not match or not token:
+        return False
+    return (hmac.compare_digest(token, uplink_token(channel))
+            or hmac.compare_digest(token, proctor_token(match.group(1))))
+
+def handler(event, context):
+    try:
+        form = {k: v[0] for k, v in parse_qs(bytes(decode_body(event)).decode()).items()}
+        channel = form['channel_name']
+        if not authorized(channel, form.get('token')):
+            return {
+                'statusCode': HTTPStatus.FORBIDDEN,
+                'body': json.dumps({'error': 'Forbidden'})
+            }
+        return {
+            'statusCode': HTTPStatus.OK,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps(get_pusher().authenticate(channel=channel, socket_id=form['socket_id']))
+        }
+    except KeyError as e:
+        return {
+            'statusCode': HTTPStatus.BAD_REQUEST,
+            'body': json.dumps({'error': f'missing {e}'})
+        }
+    except Exception as e:
+        return {
+            'statusCode': HTTPStatus.INTERNAL_SERVER_ERROR,
+            'body': json.dumps({'error': str(e)})
+        }
@@ -0,0 +1,198 @@
+"""Recording chunk ingest built on S3 multipart uploads.
+
+The recording ends up as one S3 object, keyed by its filename, which is the
+key functions/download.py presigns. The steps are:
+
+- chunk 0 calls ``create_multipart_upload``. It stores the UploadId, chunk
+  size and part layout in a small state object under ``.uploads/<name>/``,
+  which later invocations read.
+- S3 requires every part except the last to be at least 5 MiB, but a
+  Netlify function body cannot carry that much. Consecutive chunks are
+  therefore buffered as staging objects until a part's worth has arrived.
+  The invocation that stores the last chunk of a group concatenates the
+  group and calls ``upload_part``. When chunks are already at least 5 MiB,
+  each chunk is uploaded directly as its own part.
+- S3 keeps the part ETags, and they are read back with ``list_parts``. The
+  invocation that sees every part present calls
+  ``complete_multipart_upload``.
+
+Invocations are stateless and may run concurrently. The only ordering
+requirement is that chunk 0 is processed first. Before that, other chunks
+get ``UploadNotStarted``, and the client retries them. Repeating a part or
+a completion is harmless. The state object is created with ``If-None-Match:
+*``. When a retried chunk 0 races the original, only one of them creates
+the state. The other aborts the multipart upload it started and carries on
+with the winner's.
+
+Uploads a client abandons leave an incomplete multipart upload and staging
+objects behind. ``abort`` removes both. Give the bucket a lifecycle rule so
+that S3 removes the ones nobody aborts:
+
+    {"Rules": [{"ID": "abandoned-recordings", "Status": "Enabled", "Filter": {"Prefix": ""},
+                "AbortIncompleteMultipartUpload": {"DaysAfterInitiation": 2}},
+               {"ID": "upload-staging", "Status": "Enabled", "Filter": {"Prefix": ".uploads/"},
+                "Expiration": {"Days": 2}}]}
+
+tests/test_s3_multipart.py runs the whole path against moto.
+"""
+import json
+
+from botocore.exceptions import ClientError
+
+from functions.chunk_ingest import UploadNotStarted  # noqa: F401 (re-exported)
+from functions.multipart import ViewReader
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+def _body(data):
+    # memoryview chunks from functions/multipart.py are streamed to botocore without a copy
+    return ViewReader(data) if isinstance(data, memoryview) else data
+
+
+def _error_code(exc):
+    return exc.response.get('Error', {}).get('Code')
+
+
+class S3MultipartIngest:
+    def __init__(self, s3_client, bucket, min_part_size=MIN_PART_SIZE):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.min_part_size = min_part_size
+
+    def _state_key(self, name):
+        return f'.uploads/{name}/state.json'
+
+    def _staging_prefix(self, name, part_number):
+        return f'.uploads/{name}/part{part_number:05d}/'
+
+    def _load_state(self, name):
+        try:
+            body = self.s3.get_object(Bucket=self.bucket, Key=self._state_key(name))['Body'].read()
+        except ClientError as e:
+            if _error_code(e) in ('NoSuchKey', '404'):
+                return None
+            raise
+        return json.loads(body)
+
+    def _exists(self, name):
+        try:
+            self.s3.head_object(Bucket=self.bucket, Key=name)
+        except ClientError as e:
+            if _error_code(e) in ('NoSuchKey', '404'):
+                return False
+            raise
+        return True
+
+    def _start(self, name, chunk_size, total_chunks):
+        upload_id = self.s3.create_multipart_upload(Bucket=self.bucket, Key=name,
+                                                    ContentType='video/webm')['UploadId']
+        chunks_per_part = max(1, -(-self.min_part_size // chunk_size))
+        state = {'upload_id': upload_id, 'chunk_size': chunk_size, 'total_chunks': total_chunks,
+                 'chunks_per_part': chunks_per_part, 'total_parts': -(-total_chunks // chunks_per_part)}
+        try:
+            self.s3.put_object(Bucket=self.bucket, Key=self._state_key(name), Body=json.dumps(state).encode(),
+                               IfNoneMatch='*')
+        except ClientError as e:
+            if _error_code(e) not in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                raise
+            # A concurrent chunk 0 got there first: drop our upload and follow theirs.
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=name, UploadId=upload_id)
+            state = self._load_state(name)
+            if state is None:  # their write is still in flight
+                raise UploadNotStarted(f'upload of {name} is being started') from e
+        return state
+
+    def abort(self, name):
+        """Discard an unfinished upload: its multipart upload, staging objects and state."""
+        state = self._load_state(name)
+        if state is not None:
+            try:
+                self.s3.abort_multipart_upload(Bucket=self.bucket, Key=name, UploadId=state['upload_id'])
+            except ClientError as e:
+                if _error_code(e) != 'NoSuchUpload':
+                    raise
+        self._clear_prefix(f'.uploads/{name}/')
+
+    def write_chunk(self, name, index, total_chunks, data):
+        """Ingest one chunk. Returns ``{'part', 'part_uploaded', 'finalized'}``."""
+        state = self._load_state(name)
+        if state is None:
+            if self._exists(name):  # retry of a chunk of an already completed upload
+                return {'part': None, 'part_uploaded': False, 'finalized': False}
+            if index != 0:
+                raise UploadNotStarted(f'chunk 0 of {name} has not been received yet')
+            state = self._start(name, len(data), total_chunks)
+        per_part = state['chunks_per_part']
+        part_number = index // per_part + 1
+        if per_part == 1:
+            body = data
+        else:
+            body = self._buffer(name, state, part_number, index, data)
+        part_uploaded = body is not None
+        if part_uploaded:
+            try:
+                self.s3.upload_part(Bucket=self.bucket, Key=name, UploadId=state['upload_id'],
+                                    PartNumber=part_number, Body=_body(body))
+            except ClientError as e:
+                if _error_code(e) == 'NoSuchUpload':  # a retried chunk after completion
+                    return {'part': part_number, 'part_uploaded': False, 'finalized': False}
+                raise
+            if per_part > 1:
+                self._clear_prefix(self._staging_prefix(name, part_number))
+        finalized = part_uploaded and self._try_complete(name, state)
+        return {'part': part_number, 'part_uploaded': part_uploaded, 'finalized': finalized}
+
+    def _buffer(self, name, state, part_number, index, data):
+        """Stage a chunk. Returns the assembled part body once its group is complete, else None."""
+        prefix = self._staging_prefix(name, part_number)
+        self.s3.put_object(Bucket=self.bucket, Key=f'{prefix}{index:06d}', Body=_body(data))
+        first = (part_number - 1) * state['chunks_per_part']
+        expected = min(state['chunks_per_part'], state['total_chunks'] - first)
+        listing = self.s3.list_objects_v2(Bucket=self.bucket, Prefix=prefix)
+        keys = sorted(obj['Key'] for obj in listing.get('Contents', []))
+        if len(keys) < expected:
+            return None
+        body = bytearray()
+        for key in keys:
+            if key == f'{prefix}{index:06d}':
+                body += data
+                continue
+            try:
+                body += self.s3.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+            except ClientError as e:
+                if _error_code(e) == 'NoSuchKey':  # a concurrent invocation already uploaded this part
+                    return None
+                raise
+        return body
+
+    def _clear_prefix(self, prefix):
+        listing = self.s3.list_objects_v2(Bucket=self.bucket, Prefix=prefix)
+        objects = [{'Key': obj['Key']} for obj in listing.get('Contents', [])]
+        if objects:
+            self.s3.delete_objects(Bucket=self.bucket, Delete={'Objects': objects, 'Quiet': True})
+
+    def _list_parts(self, name, upload_id):
+        parts = []
+        kwargs = {'Bucket': self.bucket, 'Key': name, 'UploadId': upload_id}
+        while True:
+            page = self.s3.list_parts(**kwargs)
+            parts.extend({'PartNumber': p['PartNumber'], 'ETag': p['ETag']} for p in page.get('Parts', []))
+            if not page.get('IsTruncated'):
+                return parts
+            kwargs['PartNumberMarker'] = page['NextPartNumberMarker']
+
+    def _try_complete(self, name, state):
+        try:
+            parts = self._list_parts(name, state['upload_id'])
+            if len(parts) < state['total_parts']:
+                return False
+            self.s3.complete_multipart_upload(Bucket=self.bucket, Key=name, UploadId=state['upload_id'],
+                                              MultipartUpload={'Parts': sorted(parts, key=lambda p: p['PartNumber'])})
+        except ClientError as e:
+            if _error_code(e) == 'NoSuchUpload':  # completed by a concurrent invocation
+                return False
+            raise
+        # State object plus any staging left behind by retried chunks
+        self._clear_prefix(f'.uploads/{name}/')
+        return True
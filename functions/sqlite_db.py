@@ -0,0 +1,168 @@
+"""Shared SQLite access layer for app.py and the serverless functions.
+
+Each thread keeps one persistent connection per database file instead of
+calling ``sqlite3.connect`` for every statement. A thread's connections are
+closed when the thread exits, so per-request threads do not leak them. Connections run in WAL mode
+so readers never block the single writer. They also have a busy timeout, so
+concurrent writers wait for the lock instead of failing with
+``database is locked``. Statements are prepared once per connection and
+reused through sqlite3's statement cache, which is keyed by SQL text. For
+that reason, callers always pass parameters and never format values into SQL.
+"""
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+DB_FILE = os.environ.get('PROCTOR_DB', 'proctoring.db')
+BUSY_TIMEOUT_MS = int(os.environ.get('PROCTOR_DB_BUSY_TIMEOUT_MS', '5000'))
+BUSY_RETRIES = 3
+STATEMENT_CACHE_SIZE = 256
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS exams
+       (id TEXT PRIMARY KEY, options TEXT, active INTEGER, created_at TEXT, started_at TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS students
+       (id TEXT PRIMARY KEY, exam_id TEXT, joined_at TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS recordings
+       (id TEXT PRIMARY KEY, exam_id TEXT, student_id TEXT, filename TEXT, uploaded_at TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS events
+       (id INTEGER PRIMARY KEY AUTOINCREMENT, ts TEXT, exam_id TEXT, student_id TEXT, type TEXT, payload TEXT)''',
+    '''CREATE INDEX IF NOT EXISTS events_by_exam ON events (exam_id, ts)''',
+    '''CREATE TABLE IF NOT EXISTS exam_roster
+       (exam_id TEXT, student_id TEXT, state TEXT, ready INTEGER, PRIMARY KEY (exam_id, student_id))''',
+    '''CREATE TABLE IF NOT EXISTS socket_exams
+       (sid TEXT PRIMARY KEY, exam_id TEXT, worker TEXT)''',
+)
+# Columns added after a table was first shipped: (table, column, declaration).
+ADDED_COLUMNS = (
+    ('exams', 'started_at', 'TEXT'),
+    ('socket_exams', 'worker', 'TEXT'),
+)
+
+_local = threading.local()
+_lock = threading.Lock()
+_all_conns = weakref.WeakSet()  # live threads' _ThreadConns, for close_all() at shutdown
+_initialized = set()
+
+
+class _ThreadConns(dict):
+    """One thread's connections by database file.
+
+    Only the thread-local refers to it, so it is released, and its
+    connections closed, when the thread exits.
+    """
+    # Compared by identity, so each thread's holder gets its own WeakSet entry.
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def close(self):
+        while self:
+            try:
+                self.popitem()[1].close()
+            except sqlite3.Error:
+                pass
+
+    def __del__(self):
+        self.close()
+
+
+def _connect(db_file):
+    # isolation_level=None: single statements autocommit, multi-statement work
+    # goes through transaction() with an explicit BEGIN IMMEDIATE.
+    conn = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                           check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+
+def get_conn(db_file=None):
+    """Return this thread's connection to ``db_file``, opening it on first use."""
+    db_file = db_file or DB_FILE
+    conns = getattr(_local, 'conns', None)
+    if conns is None:
+        conns = _local.conns = _ThreadConns()
+        with _lock:
+            _all_conns.add(conns)
+    conn = conns.get(db_file)
+    if conn is None:
+        conn = conns[db_file] = _connect(db_file)
+    return conn
+
+
+def _is_busy(exc):
+    msg = str(exc)
+    return 'locked' in msg or 'busy' in msg
+
+
+def _with_retry(fn):
+    # busy_timeout already waits inside SQLite; this covers the cases where
+    # SQLite gives up immediately (e.g. a lock upgrade it detects as a deadlock).
+    for attempt in range(BUSY_RETRIES):
+        try:
+            return fn()
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e) or attempt == BUSY_RETRIES - 1:
+                raise
+            time.sleep(0.01 * (2 ** attempt))
+
+
+def init_db(db_file=None):
+    db_file = db_file or DB_FILE
+    if db_file in _initialized:
+        return
+    with transaction(db_file) as c:
+        for stmt in SCHEMA:
+            c.execute(stmt)
+        for table, column, decl in ADDED_COLUMNS:
+            if column not in {row[1] for row in c.execute(f'PRAGMA table_info({table})')}:
+                c.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+    _initialized.add(db_file)
+
+
+def execute(sql, params=(), db_file=None):
+    conn = get_conn(db_file)
+    return _with_retry(lambda: conn.execute(sql, params))
+
+
+def executemany(sql, seq_of_params, db_file=None):
+    with transaction(db_file) as c:
+        c.executemany(sql, seq_of_params)
+
+
+def fetchone(sql, params=(), db_file=None):
+    return execute(sql, params, db_file).fetchone()
+
+
+def fetchall(sql, params=(), db_file=None):
+    return execute(sql, params, db_file).fetchall()
+
+
+@contextmanager
+def transaction(db_file=None):
+    """Run several statements atomically on this thread's connection.
+
+    BEGIN IMMEDIATE takes the write lock up front, so two writers never both
+    hold a read lock and then deadlock when they try to upgrade.
+    """
+    conn = get_conn(db_file)
+    _with_retry(lambda: conn.execute('BEGIN IMMEDIATE'))
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    else:
+        conn.execute('COMMIT')
+
+
+def close_all():
+    with _lock:
+        for conns in list(_all_conns):
+            conns.close()
+    _local.__dict__.pop('conns', None)
@@ -1,18 +1,12 @@
 import json
 from http import HTTPStatus
-from flask import render_template_string
 import uuid
 import os
-from functions.db import get_exam_options, add_student
-from pusher import Pusher
-
-pusher = Pusher(
-    app_id=os.environ['PUSHER_APP_ID'],
-    key=os.environ['PUSHER_KEY'],
-    secret=os.environ['PUSHER_SECRET'],
-    cluster=os.environ['PUSHER_CLUSTER'],
-    ssl=True
-)
+from functions.db import join_exam
+from functions import templates
+from functions.publish import publisher
+from functions.channels import proctor_channel, student_channel, uplink_channel
+from functions.pusher_auth import uplink_token
 
 STUDENT_HTML = """
 <!DOCTYPE html>
@@ -48,18 +42,27 @@ STUDENT_HTML = """
     <script src="https://html2canvas.hertzen.com/dist/html2canvas.min.js"></script>
     <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js"></script>
     <script>
-        const pusher = new Pusher('{{ PUSHER_KEY }}', { cluster: '{{ PUSHER_CLUSTER }}', forceTLS: true });
+        const pusher = new Pusher('{{ PUSHER_KEY }}', {
+            cluster: '{{ PUSHER_CLUSTER }}', forceTLS: true,
+            channelAuthorization: {endpoint: '/api/pusher_auth', params: {token: '{{ uplink_token }}'}}
+        });
         const examId = '{{ exam_id }}';
         const studentId = '{{ student_id }}';
-        const channel = pusher.subscribe(`exam-${examId}`);
+        // Control events arrive on the students channel; our own events go out on a
+        // per-student uplink channel that only the teacher listens to.
+        const channel = pusher.subscribe('{{ control_channel }}');
+        const uplink = pusher.subscribe('{{ uplink_channel }}');
         let options = {};
         let streams = {};
         let mediaRecorder;
         let audioRecorder;
         let recordedChunks = [];
+        let recordingUpload = Promise.resolve();
         let audioChunks = [];
         let chunkSize = 1024 * 1024;
-        let screenshotInterval;
+        let screenshotTimer = null;
+        // The server-hosted page negotiates this from load (capture_profile.py); here it may be pushed on the control channel.
+        let captureProfile = {format: 'image/webp', quality: 0.8, scale: 0.5, interval: 5000};
 
         function joinExam() {
             console.log('Joining exam:', examId, studentId);
@@ -67,6 +70,9 @@ STUDENT_HTML = """
                 method: 'POST',
                 headers: {'Content-Type': 'application/json'},
                 body: JSON.stringify({examId, studentId, action: 'join'})
+            }).then(res => res.json()).then(data => {
+                // Options come back to this student only; options_push is for exam start.
+                if (data.options && Object.keys(data.options).length) showOptions(data.options);
             });
         }
 
@@ -81,7 +87,10 @@ STUDENT_HTML = """
             setTimeout(joinExam, 3000);
         });
 
-        channel.bind('options_push', (data) => {
+        channel.bind('options_push', showOptions);
+        channel.bind('capture_profile', (profile) => { captureProfile = profile; });
+
+        function showOptions(data) {
             console.log('Received options:', data);
             options = data;
             document.getElementById('camera').checked = options.camera;
@@ -89,18 +98,18 @@ STUDENT_HTML = """
             document.getElementById('screen').checked = options.screen;
             document.getElementById('optionsConfirm').style.display = 'block';
             document.getElementById('status').innerHTML = 'Please confirm proctoring options to start the exam.';
-        });
+        }
 
         document.getElementById('confirmOptions').onclick = async () => {
             console.log('Start Exam clicked');
-            channel.trigger('client-options_confirmed', {examId, studentId});
+            uplink.trigger('client-options_confirmed', {examId, studentId});
             document.getElementById('optionsConfirm').style.display = 'none';
             document.getElementById('testIframe').style.display = 'block';
             await initMedia();
             document.getElementById('status').innerHTML = 'Exam Started - Do not switch tabs or leave the page!';
             if (options.record && (streams.camera || streams.mic || streams.screen)) mediaRecorder.start();
             if (options.mic) audioRecorder.start(10000);
-            if (options.screen || options.camera) screenshotInterval = setInterval(captureScreenshot, 5000);
+            if (options.screen || options.camera) scheduleScreenshot(Math.random() * captureProfile.interval);
         };
 
         async function initMedia() {
@@ -119,7 +128,7 @@ STUDENT_HTML = """
                             const reader = new FileReader();
                             reader.onload = () => {
                                 const audio = reader.result.split(',')[1];
-                                channel.trigger('client-audio_chunk', {examId, studentId, audio, timestamp: new Date().toISOString()});
+                                uplink.trigger('client-audio_chunk', {examId, studentId, audio, timestamp: new Date().toISOString()});
                             };
                             reader.readAsDataURL(event.data);
                         }
@@ -139,17 +148,17 @@ STUDENT_HTML = """
                     const combined = new MediaStream(tracks);
                     mediaRecorder = new MediaRecorder(combined, {mimeType: 'video/webm'});
                     mediaRecorder.ondataavailable = handleChunk;
-                    mediaRecorder.onstop = finalizeUpload;
+                    mediaRecorder.onstop = () => { recordingUpload = finalizeUpload(); };
                     console.log('MediaRecorder initialized');
                 }
                 
                 if (options.tabDetect) {
                     document.addEventListener('visibilitychange', () => {
-                        if (document.hidden) channel.trigger('client-tab_changed', {examId, studentId});
+                        if (document.hidden) uplink.trigger('client-tab_changed', {examId, studentId});
                     });
                 }
                 
-                setInterval(() => channel.trigger('client-heartbeat', {examId, studentId}), 5000);
+                setInterval(() => uplink.trigger('client-heartbeat', {examId, studentId}), 5000);
             } catch (err) {
                 console.error('Media access error:', err);
                 alert('Media access denied: ' + err.message);
@@ -161,13 +170,36 @@ STUDENT_HTML = """
             if (event.data.size > 0) recordedChunks.push(event.data);
         }
 
-        function finalizeUpload() {
+        const uploadConcurrency = 4;
+        const uploadRetries = 4;
+
+        async function finalizeUpload() {
             const blob = new Blob(recordedChunks, {type: 'video/webm'});
             const totalChunks = Math.ceil(blob.size / chunkSize);
-            uploadChunk(blob, 0, totalChunks);
+            const filename = `${examId}_${studentId}_${Date.now()}.webm`;
+            // Chunk 0 starts the S3 multipart upload; the rest can then go in parallel.
+            await uploadChunkWithRetry(blob, filename, 0, totalChunks);
+            const queue = [...Array(totalChunks).keys()].slice(1);
+            const worker = async () => {
+                while (queue.length) await uploadChunkWithRetry(blob, filename, queue.shift(), totalChunks);
+            };
+            await Promise.all(Array.from({length: uploadConcurrency}, worker));
+        }
+
+        async function uploadChunkWithRetry(blob, filename, chunkIndex, totalChunks) {
+            for (let attempt = 0; attempt <= uploadRetries; attempt++) {
+                try {
+                    const res = await uploadChunk(blob, filename, chunkIndex, totalChunks);
+                    if (res.ok) return;
+                } catch (err) {
+                    console.error('Upload error:', err);
+                }
+                await new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt));
+            }
+            alert(`Upload failed for chunk ${chunkIndex}`);
         }
 
-        function uploadChunk(blob, chunkIndex, totalChunks) {
+        function uploadChunk(blob, filename, chunkIndex, totalChunks) {
             const start = chunkIndex * chunkSize;
             const end = Math.min(start + chunkSize, blob.size);
             const chunk = blob.slice(start, end);
@@ -177,24 +209,32 @@ STUDENT_HTML = """
             formData.append('chunk', chunk, `chunk-${chunkIndex}`);
             formData.append('chunkIndex', chunkIndex);
             formData.append('totalChunks', totalChunks);
-            formData.append('filename', `${examId}_${studentId}_${Date.now()}.webm`);
+            formData.append('filename', filename);
+            return fetch('/api/upload_chunk', {method: 'POST', body: formData});
+        }
 
-            fetch('/api/upload_chunk', {method: 'POST', body: formData}).then(res => res.json()).then(data => {
-                if (data.success && chunkIndex < totalChunks - 1) {
-                    uploadChunk(blob, chunkIndex + 1, totalChunks);
-                }
-            }).catch(err => {
-                console.error('Upload error:', err);
-                alert('Upload failed: ' + err.message);
-            });
+        function scheduleScreenshot(delay) {
+            screenshotTimer = setTimeout(async () => {
+                await captureScreenshot();
+                if (screenshotTimer) scheduleScreenshot(captureProfile.interval);
+            }, delay);
+        }
+
+        function stopScreenshots() {
+            clearTimeout(screenshotTimer);
+            screenshotTimer = null;
         }
 
         async function captureScreenshot() {
             try {
-                const canvas = await html2canvas(document.body, {scale: 0.5});
-                const dataUrl = canvas.toDataURL('image/png');
-                const screenshot = dataUrl.split(',')[1];
-                channel.trigger('client-screenshot', {examId, studentId, screenshot, timestamp: new Date().toISOString()});
+                const {format, quality, scale} = captureProfile;
+                const canvas = await html2canvas(document.body, {scale});
+                let dataUrl = canvas.toDataURL(format, quality);
+                // Browsers without a WebP encoder hand back a PNG instead; JPEG is much smaller.
+                if (!dataUrl.startsWith(`data:${format}`)) dataUrl = canvas.toDataURL('image/jpeg', quality);
+                const [header, screenshot] = dataUrl.split(',');
+                const mimeType = header.slice(5, header.indexOf(';'));
+                uplink.trigger('client-screenshot', {examId, studentId, screenshot, mimeType, timestamp: new Date().toISOString()});
             } catch (err) {
                 console.error('Screenshot failed:', err);
             }
@@ -203,21 +243,32 @@ STUDENT_HTML = """
         window.onbeforeunload = () => {
             if (mediaRecorder && mediaRecorder.state === 'recording') mediaRecorder.stop();
             if (audioRecorder && audioRecorder.state === 'recording') audioRecorder.stop();
-            if (screenshotInterval) clearInterval(screenshotInterval);
-            channel.trigger('client-student_leave', {examId, studentId});
+            stopScreenshots();
+            uplink.trigger('client-student_leave', {examId, studentId});
         };
 
-        channel.bind('exam_ended', () => {
+        // Resolves once the recorder has delivered its last data and the upload has settled.
+        function stopRecording() {
+            if (!mediaRecorder || mediaRecorder.state === 'inactive') return recordingUpload;
+            return new Promise(resolve => {
+                mediaRecorder.addEventListener('stop', () => resolve(recordingUpload), {once: true});
+                mediaRecorder.stop();
+            });
+        }
+
+        channel.bind('exam_ended', async () => {
             alert('Exam ended by teacher.');
-            if (mediaRecorder) mediaRecorder.stop();
-            if (audioRecorder) audioRecorder.stop();
-            if (screenshotInterval) clearInterval(screenshotInterval);
+            if (audioRecorder && audioRecorder.state !== 'inactive') audioRecorder.stop();
+            stopScreenshots();
+            document.getElementById('status').innerHTML = 'Exam ended - uploading your recording...';
+            await stopRecording();
             window.location = '/';
         });
     </script>
 </body>
 </html>
 """
+STUDENT_PAGE = templates.load('student', STUDENT_HTML)
 
 def handler(event, context):
     try:
@@ -226,12 +277,9 @@ def handler(event, context):
             if data.get('action') == 'join':
                 exam_id = data['examId']
                 student_id = data['studentId']
-                add_student(student_id, exam_id)
-                options = get_exam_options(exam_id)
-                pusher.trigger(f'exam-{exam_id}', 'student_joined', {'studentId': student_id})
-                if options:
-                    pusher.trigger(f'exam-{exam_id}', 'options_push', options)
-                return {'statusCode': HTTPStatus.OK, 'body': json.dumps({'success': True})}
+                options = join_exam(student_id, exam_id)
+                publisher.trigger(proctor_channel(exam_id), 'student_joined', {'studentId': student_id})
+                return {'statusCode': HTTPStatus.OK, 'body': json.dumps({'success': True, 'options': options})}
         else:
             exam_id = event['queryStringParameters'].get('examId')
             if not exam_id:
@@ -240,10 +288,14 @@ def handler(event, context):
                     'body': json.dumps({'error': 'No examId provided'})
                 }
             student_id = str(uuid.uuid4())[:8]
+            uplink = uplink_channel(exam_id, student_id)
             return {
                 'statusCode': HTTPStatus.OK,
                 'headers': {'Content-Type': 'text/html'},
-                'body': render_template_string(STUDENT_HTML, exam_id=exam_id, student_id=student_id, PUSHER_KEY=os.environ['PUSHER_KEY'], PUSHER_CLUSTER=os.environ['PUSHER_CLUSTER'])
+                'body': templates.render(STUDENT_PAGE, exam_id=exam_id, student_id=student_id,
+                                        control_channel=student_channel(exam_id), uplink_channel=uplink,
+                                        uplink_token=uplink_token(uplink),
+                                        PUSHER_KEY=os.environ['PUSHER_KEY'], PUSHER_CLUSTER=os.environ['PUSHER_CLUSTER'])
             }
     except Exception as e:
         return {
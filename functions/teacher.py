@@ -1,16 +1,9 @@
 import json
 from http import HTTPStatus
-from flask import render_template_string
-from pusher import Pusher
 import os
-
-pusher = Pusher(
-    app_id=os.environ['PUSHER_APP_ID'],
-    key=os.environ['PUSHER_KEY'],
-    secret=os.environ['PUSHER_SECRET'],
-    cluster=os.environ['PUSHER_CLUSTER'],
-    ssl=True
-)
+from functions import templates
+from functions.publish import publisher
+from functions.channels import proctor_channel, student_channel
 
 TEACHER_HTML = """
 <!DOCTYPE html>
@@ -49,28 +42,57 @@ TEACHER_HTML = """
     <script src="https://js.pusher.com/8.2/pusher.min.js"></script>
     <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js"></script>
     <script>
-        const pusher = new Pusher('{{ PUSHER_KEY }}', { cluster: '{{ PUSHER_CLUSTER }}' });
         let examId;
+        let proctorToken;
         let channel;
+        // Uplink channels are private; create_exam hands out the token that authorizes us on them.
+        const pusher = new Pusher('{{ PUSHER_KEY }}', {
+            cluster: '{{ PUSHER_CLUSTER }}',
+            channelAuthorization: {
+                customHandler: ({socketId, channelName}, callback) => {
+                    const body = new URLSearchParams({socket_id: socketId, channel_name: channelName, token: proctorToken});
+                    fetch('/api/pusher_auth', {method: 'POST', body})
+                        .then(res => res.ok ? res.json() : Promise.reject(new Error(`auth failed: ${res.status}`)))
+                        .then(auth => callback(null, auth), err => callback(err, null));
+                }
+            }
+        });
 
         document.getElementById('createExam').onclick = () => {
             fetch('/api/create_exam').then(res => res.json()).then(data => {
                 examId = data.exam_id;
+                proctorToken = data.proctor_token;
                 document.getElementById('examControls').style.display = 'block';
                 document.getElementById('examId').innerHTML = `Exam ID: ${examId} (Share with students)`;
-                channel = pusher.subscribe(`exam-${examId}`);
-                channel.bind('student_joined', (data) => updateStudentCard(data.studentId, 'Joined', 'status-active'));
-                channel.bind('tab_change', (data) => updateStudentCard(data.studentId, 'Tab Changed', 'status-tab-changed'));
-                channel.bind('screenshot', (data) => updateStudentCard(data.studentId, 'Active', 'status-active', data.screenshot, data.timestamp));
-                channel.bind('audio_chunk', (data) => updateStudentCard(data.studentId, 'Active', 'status-active', null, data.timestamp, data.audio));
+                channel = pusher.subscribe(`exam-${examId}-proctors`);
+                channel.bind('student_joined', (data) => {
+                    updateStudentCard(data.studentId, 'Joined', 'status-active');
+                    subscribeStudent(data.studentId);
+                });
                 channel.bind('recording_saved', (data) => {
                     document.getElementById('recordings').innerHTML += `<div class="alert alert-info">Recording saved: <a href="/api/download/${data.filename}" target="_blank">${data.filename}</a></div>`;
                 });
-                channel.bind('student_leave', (data) => updateStudentCard(data.studentId, 'Disconnected', 'status-disconnected'));
                 channel.bind('status', (data) => console.log('Status:', data.msg));
             });
         };
 
+        // Student media arrives on each student's uplink channel, which only the teacher subscribes to.
+        const uplinks = {};
+        function subscribeStudent(studentId) {
+            if (uplinks[studentId]) return;
+            const uplink = uplinks[studentId] = pusher.subscribe(`private-exam-${examId}-student-${studentId}`);
+            uplink.bind('client-tab_changed', () => updateStudentCard(studentId, 'Tab Changed', 'status-tab-changed'));
+            uplink.bind('client-screenshot', (data) => updateStudentCard(studentId, 'Active', 'status-active',
+                `data:${data.mimeType || 'image/png'};base64,${data.screenshot}`, data.timestamp));
+            uplink.bind('client-audio_chunk', (data) => updateStudentCard(studentId, 'Active', 'status-active', null, data.timestamp, data.audio));
+            uplink.bind('client-options_confirmed', () => console.log('Status:', `Student ${studentId} confirmed`));
+            uplink.bind('client-student_leave', () => {
+                updateStudentCard(studentId, 'Disconnected', 'status-disconnected');
+                pusher.unsubscribe(`private-exam-${examId}-student-${studentId}`);
+                delete uplinks[studentId];
+            });
+        }
+
         document.getElementById('startExam').onclick = () => {
             const options = {
                 camera: document.getElementById('camera').checked,
@@ -109,7 +131,7 @@ TEACHER_HTML = """
                     <div class="card-header">Student ${studentId}</div>
                     <div class="card-body">
                         <p>Status: <span class="status-indicator ${statusClass}">${status}</span></p>
-                        ${screenshot ? `<img src="data:image/png;base64,${screenshot}" class="card-img-top" alt="Screenshot" style="max-width: 100%;">` : ''}
+                        ${screenshot ? `<img src="${screenshot}" class="card-img-top" alt="Screenshot" style="max-width: 100%;">` : ''}
                         ${audio ? `<audio class="audio-player" controls><source src="data:audio/webm;base64,${audio}" type="audio/webm"></audio>` : ''}
                         ${timestamp ? `<p>Last Update: ${timestamp}</p>` : ''}
                     </div>
@@ -119,26 +141,27 @@ TEACHER_HTML = """
 </body>
 </html>
 """
+TEACHER_PAGE = templates.load('teacher', TEACHER_HTML)
 
 def handler(event, context):
     try:
         if event['httpMethod'] == 'POST':
             data = json.loads(event.get('body', '{}'))
-            from functions.db import update_exam_options
+            from functions.db import end_exam, update_exam_options
             if data['action'] == 'start_exam':
                 update_exam_options(data['examId'], data['options'])
-                pusher.trigger(f'exam-{data["examId"]}', 'exam_started', {'examId': data['examId']})
-                pusher.trigger(f'exam-{data["examId"]}', 'options_push', data['options'])
+                with publisher.batch() as events:
+                    events.trigger(proctor_channel(data['examId']), 'exam_started', {'examId': data['examId']})
+                    events.trigger(student_channel(data['examId']), 'options_push', data['options'])
                 return {'statusCode': HTTPStatus.OK, 'body': json.dumps({'success': True})}
             elif data['action'] == 'end_exam':
-                from functions.db import update_exam_options
-                update_exam_options(data['examId'], {})
-                pusher.trigger(f'exam-{data["examId"]}', 'exam_ended', {})
+                end_exam(data['examId'])
+                publisher.trigger(student_channel(data['examId']), 'exam_ended', {})
                 return {'statusCode': HTTPStatus.OK, 'body': json.dumps({'success': True})}
         return {
             'statusCode': HTTPStatus.OK,
             'headers': {'Content-Type': 'text/html'},
-            'body': render_template_string(TEACHER_HTML, PUSHER_KEY=os.environ['PUSHER_KEY'], PUSHER_CLUSTER=os.environ['PUSHER_CLUSTER'])
+            'body': templates.render(TEACHER_PAGE, PUSHER_KEY=os.environ['PUSHER_KEY'], PUSHER_CLUSTER=os.environ['PUSHER_CLUSTER'])
         }
     except Exception as e:
         return {
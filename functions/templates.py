@@ -0,0 +1,64 @@
+"""Build-time compiled page templates for the serverless handlers.
+
+The pages only substitute ``{{ name }}`` placeholders. Importing Flask/Jinja
+on every cold start just to call ``render_template_string`` is therefore
+wasted time. ``python -m functions.templates`` (run by the Netlify build)
+splits each template into alternating literal and placeholder segments. It
+writes them to ``functions/_compiled_templates.py`` together with a hash of
+the source. At runtime, rendering is a ``''.join`` with HTML-escaped values,
+the same escaping Flask's autoescape applies. If the compiled module is
+missing or stale, the template is compiled at import instead, which costs
+microseconds.
+"""
+import hashlib
+import html
+import os
+import re
+
+_PLACEHOLDER_RE = re.compile(r'{{\s*([A-Za-z_][A-Za-z0-9_]*)\s*}}')
+COMPILED_MODULE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '_compiled_templates.py')
+
+
+def source_hash(source):
+    return hashlib.sha1(source.encode()).hexdigest()
+
+
+def compile_template(source):
+    """Tuple of segments: literals at even indexes, placeholder names at odd ones."""
+    if '{%' in source or '{#' in source:
+        raise ValueError('only {{ name }} placeholders are supported')
+    return tuple(_PLACEHOLDER_RE.split(source))
+
+
+def load(name, source):
+    try:
+        from functions._compiled_templates import TEMPLATES
+    except ImportError:
+        TEMPLATES = {}
+    compiled = TEMPLATES.get(name)
+    if compiled and compiled[0] == source_hash(source):
+        return compiled[1]
+    return compile_template(source)
+
+
+def render(segments, **context):
+    out = list(segments)
+    for i in range(1, len(out), 2):
+        out[i] = html.escape(str(context[out[i]]), quote=True)
+    return ''.join(out)
+
+
+def build():
+    from functions import student, teacher
+    sources = {'student': student.STUDENT_HTML, 'teacher': teacher.TEACHER_HTML}
+    with open(COMPILED_MODULE, 'w') as f:
+        f.write('# Generated by `python -m functions.templates`; do not edit.\n')
+        f.write('TEMPLATES = {\n')
+        for name, source in sources.items():
+            f.write(f'    {name!r}: ({source_hash(source)!r}, {compile_template(source)!r}),\n')
+        f.write('}\n')
+    print(f'Compiled {len(sources)} templates into {COMPILED_MODULE}')
+
+
+if __name__ == '__main__':
+    build()
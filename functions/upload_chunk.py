@@ -1,78 +1,66 @@
 import json
-from http import HTTPStatus
-from werkzeug.utils import secure_filename
-import boto3
 import os
+import re
+from functools import lru_cache
+from http import HTTPStatus
 from functions.db import save_recording
-from pusher import Pusher
+from functions.channels import proctor_channel
+from functions.chunk_ingest import ChunkIngest, UploadNotStarted
+from functions.clients import BUCKET, get_s3
+from functions.publish import publisher
+from functions.multipart import MultipartError, boundary_from, decode_body, parse_form
+
+
+@lru_cache(maxsize=None)
+def get_ingest():
+    s3_client = get_s3()
+    if s3_client:
+        from functions.s3_multipart import S3MultipartIngest
+        return S3MultipartIngest(s3_client, BUCKET)
+    return ChunkIngest('recordings')
 
-pusher = Pusher(
-    app_id=os.environ['PUSHER_APP_ID'],
-    key=os.environ['PUSHER_KEY'],
-    secret=os.environ['PUSHER_SECRET'],
-    cluster=os.environ['PUSHER_CLUSTER'],
-    ssl=True
-)
+_UNSAFE = re.compile(r'[^A-Za-z0-9._-]')
 
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY')
-) if os.environ.get('AWS_ACCESS_KEY_ID') else None
-BUCKET = os.environ.get('S3_BUCKET', 'proctor-recordings')
+def safe_filename(name):
+    # werkzeug.utils.secure_filename would cost this function most of its cold start
+    name = _UNSAFE.sub('_', os.path.basename(name.replace('\\', '/'))).strip('._')
+    if not name:
+        raise ValueError('invalid filename')
+    return name
 
 def handler(event, context):
     try:
-        # Parse multipart form data
-        from io import BytesIO
-        from urllib.parse import parse_qs
-        body = event['body']
-        if event.get('isBase64Encoded'):
-            body = base64.b64decode(body)
-        boundary = event['headers']['content-type'].split('boundary=')[1]
-        parts = body.split(b'--' + boundary.encode())
-        form_data = {}
-        chunk = None
-        for part in parts:
-            if b'Content-Disposition' in part:
-                headers, content = part.split(b'\r\n\r\n', 1)
-                headers = headers.decode()
-                name_match = re.search(r'name="([^"]+)"', headers)
-                if name_match:
-                    name = name_match.group(1)
-                    content = content.rstrip(b'\r\n--')
-                    if name == 'chunk':
-                        chunk = BytesIO(content)
-                    else:
-                        form_data[name] = content.decode()
+        # Parse multipart form data; the chunk stays a view into the decoded body
+        body = decode_body(event)
+        headers = {k.lower(): v for k, v in event['headers'].items()}
+        form_data, files = parse_form(body, boundary_from(headers.get('content-type')))
+        chunk = files['chunk'][1]
 
         exam_id = form_data['examId']
         student_id = form_data['studentId']
         chunk_index = int(form_data['chunkIndex'])
         total_chunks = int(form_data['totalChunks'])
-        filename = secure_filename(form_data['filename'])
+        filename = safe_filename(form_data['filename'])
 
-        if s3_client:
-            key = f"{exam_id}/{filename}.part{chunk_index}"
-            s3_client.upload_fileobj(chunk, BUCKET, key)
-            if chunk_index == total_chunks - 1:
-                recording_id = save_recording(exam_id, student_id, filename)
-                pusher.trigger(f'exam-{exam_id}', 'recording_saved', {'filename': filename, 'recording_id': recording_id})
-        else:
-            os.makedirs('recordings', exist_ok=True)
-            filepath = os.path.join('recordings', filename)
-            with open(filepath, 'ab') as f:
-                f.seek(chunk_index * 1024 * 1024)
-                chunk.seek(0)
-                f.write(chunk.read())
-            if chunk_index == total_chunks - 1:
-                recording_id = save_recording(exam_id, student_id, filename)
-                pusher.trigger(f'exam-{exam_id}', 'recording_saved', {'filename': filename, 'recording_id': recording_id})
+        status = get_ingest().write_chunk(filename, chunk_index, total_chunks, chunk)
+        if status['finalized']:
+            recording_id = save_recording(exam_id, student_id, filename)
+            publisher.trigger(proctor_channel(exam_id), 'recording_saved', {'filename': filename, 'recording_id': recording_id})
 
         return {
             'statusCode': HTTPStatus.OK,
             'body': json.dumps({'success': True})
         }
+    except (MultipartError, KeyError, ValueError) as e:
+        return {
+            'statusCode': HTTPStatus.BAD_REQUEST,
+            'body': json.dumps({'success': False, 'error': str(e)})
+        }
+    except UploadNotStarted as e:
+        return {
+            'statusCode': HTTPStatus.CONFLICT,
+            'body': json.dumps({'success': False, 'error': str(e), 'retry': True})
+        }
     except Exception as e:
         return {
             'statusCode': HTTPStatus.INTERNAL_SERVER_ERROR,
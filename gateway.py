@@ -0,0 +1,179 @@
+"""Asyncio Socket.IO gateway (python-socketio AsyncServer on ASGI).
+
+``async_mode='threading'`` dedicates an OS thread to every connected
+client. Here every connection is a coroutine on one event loop, so idle
+students cost only memory. app.py switches to this gateway when
+``PROCTOR_GATEWAY=asgi`` is set. Serve it with ``uvicorn asgi:application``.
+
+The handlers in app.py are unchanged. ``AsyncGateway`` offers the part of
+the Flask-SocketIO API they use (``on``, ``emit``, ``sleep``,
+``start_background_task``), and module-level ``emit``/``join_room``/
+``leave_room``/``current_sid`` act on the socket whose event is being
+handled:
+
+- Handlers run in a bounded thread pool (``GATEWAY_WORKERS`` threads). At
+  most ``GATEWAY_MAX_INFLIGHT`` events are queued or running at once, and
+  beyond that new events wait on the loop. Blocking SQLite, file and image
+  work therefore never stalls the loop, and the number of threads (and
+  SQLite connections) stays fixed.
+- Handlers listed in ``inline_events`` never block and run directly on the
+  loop, which saves the thread hop on the hottest events.
+- Rate-limited handlers (see flow_control.py) are checked on the loop, so
+  an event over its limit is dropped without waiting for a worker.
+- Calls made from worker threads and background tasks are handed to the
+  loop in order.
+- HTTP routes are the Flask app, served through asgiref's WSGI adapter.
+"""
+import asyncio
+import contextvars
+import inspect
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import socketio
+from asgiref.wsgi import WsgiToAsgi
+
+log = logging.getLogger(__name__)
+
+_current_sid = contextvars.ContextVar('sid', default=None)
+_gateway = None
+
+
+def _fresh_context(asgi_app):
+    """Run each HTTP request in an empty context.
+
+    uvicorn resumes reading a paused request body (a large upload) from inside
+    the request task, so the connection's next request inherits that task's
+    context. That includes asgiref's mark that its WSGI thread is busy, and the
+    next request then fails ("would deadlock").
+    """
+    async def app(scope, receive, send):
+        await contextvars.Context().run(asyncio.ensure_future, asgi_app(scope, receive, send))
+    return app
+
+
+class AsyncGateway:
+    def __init__(self, app, inline_events=(), workers=None, max_inflight=None, **server_options):
+        global _gateway
+        self.app = app
+        self.inline_events = set(inline_events)
+        workers = workers or int(os.environ.get('GATEWAY_WORKERS', '16'))
+        self.max_inflight = max_inflight or int(os.environ.get('GATEWAY_MAX_INFLIGHT', str(workers * 8)))
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='gateway')
+        self.server = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*', **server_options)
+        self.asgi_app = socketio.ASGIApp(self.server, other_asgi_app=_fresh_context(WsgiToAsgi(app)),
+                                         on_startup=self._bind_loop)
+        self.loop = None
+        self._inflight = None
+        self.stats = {'events': 0, 'inline': 0, 'offloaded': 0, 'waited': 0, 'rejected': 0, 'errors': 0}
+        self.server.on('connect', self._on_connect)
+        _gateway = self
+
+    async def _bind_loop(self):
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            self._inflight = asyncio.Semaphore(self.max_inflight)
+
+    async def _on_connect(self, sid, environ, auth=None):
+        await self._bind_loop()
+
+    def on(self, event):
+        def decorator(handler):
+            self.server.on(event, self._wrap(event, handler))
+            return handler
+        return decorator
+
+    def _wrap(self, event, handler):
+        inline = event in self.inline_events
+        admit = getattr(handler, 'admit', None)  # see flow_control.RateLimiter.limit
+        if admit:
+            handler = handler.__wrapped__  # admitted here already; the wrapper would spend a second token
+
+        async def dispatch(sid, data=None):
+            self.stats['events'] += 1
+            token = _current_sid.set(sid)
+            try:
+                if admit and not admit(data):
+                    self.stats['rejected'] += 1
+                    return None
+                if inline:
+                    self.stats['inline'] += 1
+                    return self._run(handler, data)
+                if self._inflight.locked():
+                    self.stats['waited'] += 1
+                async with self._inflight:
+                    self.stats['offloaded'] += 1
+                    ctx = contextvars.copy_context()
+                    return await self.loop.run_in_executor(self.executor, ctx.run, self._run, handler, data)
+            finally:
+                _current_sid.reset(token)
+        return dispatch
+
+    def _run(self, handler, data):
+        try:
+            return handler(data)
+        except Exception:
+            self.stats['errors'] += 1
+            log.exception('socket handler %s failed', handler.__name__)
+
+    def call(self, fn, *args, **kwargs):
+        """Run a server method on the loop, awaiting it if it is a coroutine."""
+        async def run():
+            result = fn(*args, **kwargs)
+            if inspect.isawaitable(result):
+                await result
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:  # worker or background thread
+            if self.loop is not None:  # nobody can be connected before the loop is bound
+                asyncio.run_coroutine_threadsafe(run(), self.loop)
+            return
+        self.loop.create_task(run())
+
+    def emit(self, event, data=None, room=None, to=None, skip_sid=None):
+        self.call(self.server.emit, event, data, to=to or room, skip_sid=skip_sid)
+
+    def sleep(self, seconds=0):
+        time.sleep(seconds)
+
+    def start_background_task(self, target, *args, **kwargs):
+        # Background loops (presence ticks, admission, ready counts) are synchronous and
+        # sleep with time.sleep, so each gets its own thread rather than an executor slot.
+        thread = threading.Thread(target=target, args=args, kwargs=kwargs, daemon=True)
+        thread.start()
+        return thread
+
+    def loop_lag(self, timeout=1.0):
+        """Seconds a callback posted from another thread waits before the event loop runs it."""
+        if self.loop is None:
+            return 0.0
+        ran = threading.Event()
+        posted = time.perf_counter()
+        self.loop.call_soon_threadsafe(ran.set)
+        ran.wait(timeout)
+        return time.perf_counter() - posted
+
+    def report(self):
+        return dict(self.stats, workers=self.executor._max_workers, max_inflight=self.max_inflight)
+
+
+def current_sid():
+    return _current_sid.get()
+
+
+def emit(event, data=None, room=None, to=None, include_self=True):
+    """Flask-SocketIO semantics: without a room, reply to the socket being handled."""
+    sid = current_sid()
+    target = to or room or sid
+    _gateway.emit(event, data, to=target, skip_sid=None if include_self else sid)
+
+
+def join_room(room, sid=None):
+    _gateway.call(_gateway.server.enter_room, sid or current_sid(), room)
+
+
+def leave_room(room, sid=None):
+    _gateway.call(_gateway.server.leave_room, sid or current_sid(), room)
@@ -0,0 +1,32 @@
+"""Helpers for screenshot/audio payloads on the Socket.IO media path.
+
+Current clients send media as raw bytes, which Socket.IO carries as a binary
+attachment. Older clients still send base64 strings inside the JSON. These
+helpers accept either form, so handlers never need to care which one arrived.
+"""
+import base64
+
+# Socket.IO caps a single message at 1 MB by default; full-page PNGs exceed that.
+MAX_MEDIA_BYTES = 16 * 1024 * 1024
+
+
+def is_binary(value):
+    return isinstance(value, (bytes, bytearray, memoryview))
+
+
+def as_bytes(value):
+    """Raw media bytes, decoding legacy base64 payloads. Binary input is returned as is."""
+    if value is None:
+        return b''
+    if is_binary(value):
+        return value
+    return base64.b64decode(value)
+
+
+def media_size(value):
+    """Decoded size in bytes, without decoding base64 payloads."""
+    if value is None:
+        return 0
+    if is_binary(value):
+        return len(value)
+    return len(value) * 3 // 4 - value.count('=', -2)
@@ -0,0 +1,140 @@
+"""Server-side presence tracking for exam participants.
+
+Heartbeats only update a last-seen timestamp, which is O(1) and emits
+nothing. Expiry runs on a hashed timer wheel. Each student has exactly one
+pending timer, and each tick processes only the one slot whose timers are
+due, so the cost of a tick does not grow with the number of connected
+students. When a timer fires, it compares last-seen with the threshold. If
+the student was seen since the timer was set, the timer is re-armed for the
+remaining time. Otherwise the student moves one state down
+(active -> stale -> disconnected), and ``on_transition`` is called. Only
+these transitions go out to the teacher.
+"""
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+ACTIVE = 'active'
+STALE = 'stale'
+DISCONNECTED = 'disconnected'
+
+
+class _Entry:
+    __slots__ = ('key', 'last_seen', 'state', 'deadline_tick')
+
+    def __init__(self, key, now):
+        self.key = key
+        self.last_seen = now
+        self.state = ACTIVE
+        self.deadline_tick = 0
+
+
+class PresenceTracker:
+    def __init__(self, stale_after=15.0, disconnect_after=30.0, tick=1.0, wheel_size=64,
+                 on_transition=None, clock=time.monotonic):
+        self.stale_after = stale_after
+        self.disconnect_after = disconnect_after
+        self.tick = tick
+        self.on_transition = on_transition
+        self.clock = clock
+        self._wheel = [set() for _ in range(wheel_size)]
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._current_tick = int(clock() / tick)
+        self._running = False
+
+    def _schedule(self, entry, delay):
+        ticks = max(1, int(-(-delay // self.tick)))
+        entry.deadline_tick = self._current_tick + ticks
+        self._wheel[entry.deadline_tick % len(self._wheel)].add(entry)
+
+    def touch(self, exam_id, student_id):
+        """Record a sign of life. Returns the previous state (None if new)."""
+        key = (exam_id, student_id)
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(key, now)
+                self._schedule(entry, self.stale_after)
+                previous = None
+            else:
+                entry.last_seen = now
+                previous = entry.state
+                if previous != ACTIVE:
+                    entry.state = ACTIVE
+                    if previous == DISCONNECTED:
+                        self._schedule(entry, self.stale_after)
+        if previous not in (None, ACTIVE):
+            self._notify(exam_id, student_id, ACTIVE)
+        return previous
+
+    def remove(self, exam_id, student_id):
+        with self._lock:
+            entry = self._entries.pop((exam_id, student_id), None)
+            if entry is not None:
+                self._wheel[entry.deadline_tick % len(self._wheel)].discard(entry)
+
+    def state(self, exam_id, student_id):
+        entry = self._entries.get((exam_id, student_id))
+        return entry.state if entry else None
+
+    def snapshot(self, exam_id):
+        with self._lock:
+            return {sid: e.state for (eid, sid), e in self._entries.items() if eid == exam_id}
+
+    def advance(self):
+        """Process every wheel slot that has come due since the last call."""
+        transitions = []
+        target = int(self.clock() / self.tick)
+        with self._lock:
+            while self._current_tick < target:
+                self._current_tick += 1
+                slot = self._wheel[self._current_tick % len(self._wheel)]
+                due = [e for e in slot if e.deadline_tick <= self._current_tick]
+                for entry in due:
+                    slot.discard(entry)
+                    transition = self._expire(entry)
+                    if transition:
+                        transitions.append(transition)
+        for exam_id, student_id, state in transitions:
+            self._notify(exam_id, student_id, state)
+        return transitions
+
+    def _expire(self, entry):
+        idle = self.clock() - entry.last_seen
+        threshold = self.stale_after if entry.state == ACTIVE else self.disconnect_after
+        if idle < threshold:
+            # Seen since this timer was armed: re-arm for the remainder.
+            self._schedule(entry, threshold - idle)
+            return None
+        if entry.state == ACTIVE:
+            entry.state = STALE
+            self._schedule(entry, self.disconnect_after - idle)
+        else:
+            # Disconnected entries stay registered (unscheduled) until they
+            # touch() again or are removed.
+            entry.state = DISCONNECTED
+        return entry.key + (entry.state,)
+
+    def _notify(self, exam_id, student_id, state):
+        if self.on_transition:
+            try:
+                self.on_transition(exam_id, student_id, state)
+            except Exception:
+                log.exception('presence transition of %s in exam %s to %s failed', student_id, exam_id, state)
+
+    def run(self, sleep=time.sleep):
+        """Tick forever; pass ``socketio.sleep`` to cooperate with the server's async mode."""
+        self._running = True
+        while self._running:
+            try:
+                self.advance()
+            except Exception:
+                log.exception('presence tick failed')
+            sleep(self.tick)
+
+    def stop(self):
+        self._running = False
@@ -0,0 +1,167 @@
+"""Exam-scoped state shared by every worker process.
+
+With several Socket.IO workers (see backplane.py), a student's socket
+lives on one worker and the teacher's on another. Anything the teacher
+sees as a whole must therefore be kept outside any single process: the
+exam roster with each student's presence state and readiness, and which
+exam a teacher socket is bound to. ``PROCTOR_REGISTRY`` selects the store:
+
+- ``memory``: a single process (the default when no message queue is set).
+- ``sqlite``: the shared WAL database from functions/sqlite_db.py, for
+  workers on one host (the default when PROCTOR_MESSAGE_QUEUE is set).
+
+Workers on several hosts need a shared store such as a server database.
+None is provided here. The SQLite file must not live on a network share.
+
+Each socket binding records the worker (host and pid) that holds the
+socket. A worker that crashes never unbinds its sockets, so every worker
+sweeps on startup: it deletes the bindings of workers on its host that are
+no longer running, and any left under its own id by an earlier process
+that had the same pid.
+"""
+import os
+import platform
+import threading
+from collections import defaultdict
+
+from functions import sqlite_db as db
+
+ACTIVE = 'active'
+
+
+def registry_kind():
+    return os.environ.get('PROCTOR_REGISTRY') or ('sqlite' if os.environ.get('PROCTOR_MESSAGE_QUEUE') else 'memory')
+
+
+def make_registry(kind=None):
+    kind = kind or registry_kind()
+    if kind == 'memory':
+        return MemoryRegistry()
+    if kind == 'sqlite':
+        return SqliteRegistry()
+    raise ValueError(f'unknown registry: {kind}')
+
+
+class MemoryRegistry:
+    def __init__(self):
+        self._roster = defaultdict(dict)  # exam_id -> {student_id: [state, ready]}
+        self._sockets = {}
+        self._lock = threading.Lock()
+
+    def bind_socket(self, sid, exam_id):
+        self._sockets[sid] = exam_id
+
+    def socket_exam(self, sid):
+        return self._sockets.get(sid)
+
+    def unbind_socket(self, sid):
+        self._sockets.pop(sid, None)
+
+    def join(self, exam_id, student_id):
+        """Add the student as active; returns True if they were not on the roster yet."""
+        with self._lock:
+            entry = self._roster[exam_id].get(student_id)
+            if entry:
+                entry[0] = ACTIVE
+                return False
+            self._roster[exam_id][student_id] = [ACTIVE, False]
+            return True
+
+    def ready(self, exam_id, student_id):
+        with self._lock:
+            self._roster[exam_id].setdefault(student_id, [ACTIVE, False])[1] = True
+
+    def leave(self, exam_id, student_id):
+        with self._lock:
+            self._roster[exam_id].pop(student_id, None)
+
+    def set_presence(self, exam_id, student_id, state):
+        with self._lock:
+            entry = self._roster[exam_id].get(student_id)
+            if entry:
+                entry[0] = state
+
+    def presence(self, exam_id):
+        with self._lock:
+            return {student_id: entry[0] for student_id, entry in self._roster[exam_id].items()}
+
+    def counts(self, exam_id):
+        with self._lock:
+            roster = self._roster[exam_id]
+            return {'joined': len(roster), 'ready': sum(1 for entry in roster.values() if entry[1])}
+
+    def drop_exam(self, exam_id):
+        with self._lock:
+            self._roster.pop(exam_id, None)
+
+
+def _running(pid):
+    if os.name != 'posix':  # os.kill(pid, 0) would terminate the process on Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # alive, owned by another user
+        return True
+    return True
+
+
+class SqliteRegistry:
+    def __init__(self):
+        db.init_db()
+        self.host = platform.node()
+        self.worker = f'{self.host}:{os.getpid()}'
+        # Nothing is bound yet, so anything under our id was left by an earlier process with this pid.
+        db.execute("DELETE FROM socket_exams WHERE worker=?", (self.worker,))
+        self.sweep()
+
+    def sweep(self):
+        """Drop socket bindings of workers on this host that are no longer running; returns how many."""
+        stale = []
+        for (worker,) in db.fetchall("SELECT DISTINCT worker FROM socket_exams"):
+            host, _, pid = (worker or '').rpartition(':')
+            if worker is None or (host == self.host and worker != self.worker and not _running(int(pid))):
+                stale.append(worker)
+        with db.transaction() as c:
+            return sum(c.execute("DELETE FROM socket_exams WHERE worker IS ?", (worker,)).rowcount for worker in stale)
+
+    def bind_socket(self, sid, exam_id):
+        db.execute("INSERT OR REPLACE INTO socket_exams (sid, exam_id, worker) VALUES (?, ?, ?)",
+                   (sid, exam_id, self.worker))
+
+    def socket_exam(self, sid):
+        row = db.fetchone("SELECT exam_id FROM socket_exams WHERE sid=?", (sid,))
+        return row[0] if row else None
+
+    def unbind_socket(self, sid):
+        db.execute("DELETE FROM socket_exams WHERE sid=?", (sid,))
+
+    def join(self, exam_id, student_id):
+        cursor = db.execute("INSERT OR IGNORE INTO exam_roster (exam_id, student_id, state, ready) VALUES (?, ?, ?, 0)",
+                            (exam_id, student_id, ACTIVE))
+        if cursor.rowcount:
+            return True
+        self.set_presence(exam_id, student_id, ACTIVE)
+        return False
+
+    def ready(self, exam_id, student_id):
+        db.execute("INSERT INTO exam_roster (exam_id, student_id, state, ready) VALUES (?, ?, ?, 1) "
+                   "ON CONFLICT (exam_id, student_id) DO UPDATE SET ready=1", (exam_id, student_id, ACTIVE))
+
+    def leave(self, exam_id, student_id):
+        db.execute("DELETE FROM exam_roster WHERE exam_id=? AND student_id=?", (exam_id, student_id))
+
+    def set_presence(self, exam_id, student_id, state):
+        db.execute("UPDATE exam_roster SET state=? WHERE exam_id=? AND student_id=?", (state, exam_id, student_id))
+
+    def presence(self, exam_id):
+        return dict(db.fetchall("SELECT student_id, state FROM exam_roster WHERE exam_id=?", (exam_id,)))
+
+    def counts(self, exam_id):
+        joined, ready = db.fetchone("SELECT COUNT(*), COALESCE(SUM(ready), 0) FROM exam_roster WHERE exam_id=?",
+                                    (exam_id,))
+        return {'joined': joined, 'ready': ready}
+
+    def drop_exam(self, exam_id):
+        db.execute("DELETE FROM exam_roster WHERE exam_id=?", (exam_id,))
@@ -0,0 +1,91 @@
+"""Perceptual-hash dedup of screenshots before they are fanned out to proctors.
+
+Each frame is reduced to a 64-bit difference hash (dHash). The image is
+scaled to a 9x8 grayscale thumbnail by Pillow, and NumPy then compares each
+pixel with its right-hand neighbour. If a frame is within ``max_distance``
+bits (Hamming distance) of the last frame forwarded for the same student,
+it is dropped and only an "unchanged" tick is sent. Frames are always
+compared with the last *forwarded* frame, so slow drift still adds up to a
+forward eventually. ``keyframe_interval`` additionally forces a full frame
+every so often.
+
+NumPy and Pillow are optional. Without them every frame is forwarded.
+"""
+import io
+import threading
+import time
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:  # dedup disabled
+    np = None
+    Image = None
+
+HASH_SIZE = 8
+
+
+def dhash(image_bytes, hash_size=HASH_SIZE):
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        img.draft('L', (hash_size * 4, hash_size * 4))  # cheap downscale for JPEG sources
+        small = img.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    px = np.asarray(small, dtype=np.int16)
+    bits = px[:, 1:] > px[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class ScreenshotDeduper:
+    def __init__(self, max_distance=4, keyframe_interval=60.0, clock=time.monotonic):
+        self.max_distance = max_distance
+        self.keyframe_interval = keyframe_interval
+        self.clock = clock
+        self.enabled = np is not None
+        self._last = {}  # (exam_id, student_id) -> (hash, forwarded_at)
+        self._lock = threading.Lock()
+        self.stats = {'frames': 0, 'forwarded': 0, 'unchanged': 0, 'bytes_in': 0, 'bytes_forwarded': 0, 'errors': 0}
+
+    def should_forward(self, exam_id, student_id, image_bytes):
+        """True if this frame differs enough from the last forwarded one."""
+        size = len(image_bytes)
+        self.stats['frames'] += 1
+        self.stats['bytes_in'] += size
+        forward = True
+        if self.enabled and size:
+            try:
+                h = dhash(image_bytes)
+            except Exception:
+                self.stats['errors'] += 1
+                h = None
+            if h is not None:
+                key = (exam_id, student_id)
+                now = self.clock()
+                with self._lock:
+                    last = self._last.get(key)
+                    if (last is not None and hamming(h, last[0]) <= self.max_distance
+                            and now - last[1] < self.keyframe_interval):
+                        forward = False
+                    else:
+                        self._last[key] = (h, now)
+        if forward:
+            self.stats['forwarded'] += 1
+            self.stats['bytes_forwarded'] += size
+        else:
+            self.stats['unchanged'] += 1
+        return forward
+
+    def forget(self, exam_id, student_id):
+        with self._lock:
+            self._last.pop((exam_id, student_id), None)
+
+    def dedup_ratio(self):
+        """Fraction of incoming screenshot bytes that were not forwarded."""
+        if not self.stats['bytes_in']:
+            return 0.0
+        return 1 - self.stats['bytes_forwarded'] / self.stats['bytes_in']
+
+    def report(self):
+        return dict(self.stats, enabled=self.enabled, dedup_ratio=round(self.dedup_ratio(), 4))
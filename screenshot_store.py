@@ -0,0 +1,110 @@
+"""Content-addressed screenshot storage.
+
+Each frame is stored once, under its SHA-256 digest, in two levels of sharded
+directories (``ab/cd/abcd...``), so no directory grows too large. Identical
+frames cost nothing after the first write. The most recent frames of each
+exam are also kept in a bounded in-memory LRU, so serving a live dashboard
+rarely touches the disk. Socket events carry only the digest and the GET URL
+of the frame. The URL content never changes, which lets the browser cache
+it as immutable.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+)
+
+
+def sniff_mimetype(head):
+    for magic, mimetype in _SIGNATURES:
+        if head.startswith(magic):
+            return mimetype
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+
+class ScreenshotStore:
+    def __init__(self, root, hot_bytes_per_exam=32 * 1024 * 1024):
+        self.root = root
+        self.hot_bytes_per_exam = hot_bytes_per_exam
+        self._hot = {}  # exam_id -> OrderedDict(digest -> bytes)
+        self._hot_size = {}
+        self._lock = threading.Lock()
+        self.stats = {'stored': 0, 'duplicates': 0, 'hot_hits': 0, 'disk_reads': 0}
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def put(self, exam_id, data):
+        """Store a frame and return its digest. Empty frames raise ``ValueError``."""
+        if not data:
+            raise ValueError('empty screenshot')
+        digest = hashlib.sha256(data).hexdigest()
+        self._remember(exam_id, digest, data)
+        path = self.path(digest)
+        if os.path.exists(path):
+            self.stats['duplicates'] += 1
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)  # atomic: readers never see a partial frame
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.stats['stored'] += 1
+        return digest
+
+    def get(self, exam_id, digest):
+        """Frame bytes from the hot cache or disk, or None."""
+        with self._lock:
+            frames = self._hot.get(exam_id)
+            if frames is not None and digest in frames:
+                frames.move_to_end(digest)
+                self.stats['hot_hits'] += 1
+                return frames[digest]
+        path = self.path(digest)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.stats['disk_reads'] += 1
+        self._remember(exam_id, digest, data)
+        return data
+
+    def _remember(self, exam_id, digest, data):
+        with self._lock:
+            frames = self._hot.setdefault(exam_id, OrderedDict())
+            if digest in frames:
+                frames.move_to_end(digest)
+                return
+            frames[digest] = data
+            size = self._hot_size.get(exam_id, 0) + len(data)
+            while size > self.hot_bytes_per_exam and len(frames) > 1:
+                _, evicted = frames.popitem(last=False)
+                size -= len(evicted)
+            self._hot_size[exam_id] = size
+
+    def drop_exam(self, exam_id):
+        """Release an exam's hot frames (files on disk are kept)."""
+        with self._lock:
+            self._hot.pop(exam_id, None)
+            self._hot_size.pop(exam_id, None)
+
+    def report(self):
+        with self._lock:
+            hot = {'exams': len(self._hot), 'frames': sum(len(f) for f in self._hot.values()),
+                   'bytes': sum(self._hot_size.values())}
+        return dict(self.stats, hot=hot)
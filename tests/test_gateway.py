@@ -0,0 +1,28 @@
+import asyncio
+
+from flask import Flask
+
+import gateway
+from flow_control import RateLimiter
+
+
+def test_rate_limited_events_spend_one_token_each():
+    gw = gateway.AsyncGateway(Flask(__name__))
+    limiter = RateLimiter({'screenshot': (1.0, 5)}, current_sid=gateway.current_sid, clock=lambda: 0.0)
+    handled = []
+
+    @gw.on('screenshot')
+    @limiter.limit('screenshot')
+    def screenshot(data):
+        handled.append(gateway.current_sid())
+
+    async def send(count):
+        await gw._bind_loop()
+        dispatch = gw.server.handlers['/']['screenshot']
+        for _ in range(count):
+            await dispatch('sid-1', {'examId': 'e', 'studentId': 's'})
+
+    asyncio.run(send(10))
+    assert handled == ['sid-1'] * 5
+    assert limiter.report()['screenshot'] == {'allowed': 5, 'throttled': 5}
+    assert gw.stats['rejected'] == 5
@@ -0,0 +1,43 @@
+import threading
+
+from functions.chunk_ingest import ChunkIngest, SegmentStream
+from functions.exam_cache import ExamStateCache
+
+
+def test_upload_locks_are_dropped_when_idle(tmp_path):
+    ingest = ChunkIngest(str(tmp_path), chunk_size=4)
+    threads = [threading.Thread(target=ingest.write_chunk, args=('rec.webm', i, 8, b'abcd')) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert ingest.status('rec.webm')['complete']
+    assert len(ingest._locks) == 0
+
+    stream = SegmentStream(str(tmp_path))
+    stream.append('seg.webm', 1, b'b')
+    stream.append('seg.webm', 0, b'a', final=False)
+    stream.append('seg.webm', 2, b'c', final=True)
+    assert len(stream._locks) == 0
+
+
+def test_exam_loads_are_coalesced_and_locks_dropped():
+    started, release = threading.Event(), threading.Event()
+    loads = []
+
+    def loader(exam_id):
+        loads.append(exam_id)
+        started.set()
+        release.wait()
+        return None
+
+    cache = ExamStateCache(loader)
+    threads = [threading.Thread(target=cache.get, args=('e',)) for _ in range(4)]
+    for t in threads:
+        t.start()
+    started.wait()
+    release.set()
+    for t in threads:
+        t.join()
+    assert loads == ['e']
+    assert len(cache._key_locks) == 0
@@ -0,0 +1,66 @@
+"""S3MultipartIngest against moto's S3 (pip install -r requirements-dev.txt)."""
+import os
+import random
+
+import pytest
+
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+
+from functions.s3_multipart import S3MultipartIngest, UploadNotStarted  # noqa: E402
+
+BUCKET = 'proctor-recordings'
+CHUNK = 1024 * 1024
+
+
+@pytest.fixture
+def s3():
+    with moto.mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def upload(ingest, name, recording, order):
+    total = -(-len(recording) // CHUNK)
+    finalized = 0
+    pending = list(order)
+    while pending:
+        index = pending.pop(0)
+        try:
+            status = ingest.write_chunk(name, index, total, recording[index * CHUNK:(index + 1) * CHUNK])
+        except UploadNotStarted:
+            pending.append(index)  # the page retries until chunk 0 has started the upload
+            continue
+        finalized += status['finalized']
+    return finalized
+
+
+def test_shuffled_and_duplicated_chunks_assemble_in_order(s3):
+    ingest = S3MultipartIngest(s3, BUCKET)
+    recording = os.urandom(12 * CHUNK + 12345)  # three 5 MiB parts, the last one short
+    total = -(-len(recording) // CHUNK)
+    order = list(range(total)) + random.Random(7).sample(range(total), 5)
+    random.Random(3).shuffle(order)
+
+    assert upload(ingest, 'exam_student_1.webm', recording, order) == 1
+    assert s3.get_object(Bucket=BUCKET, Key='exam_student_1.webm')['Body'].read() == recording
+    assert s3.list_objects_v2(Bucket=BUCKET, Prefix='.uploads/').get('KeyCount') == 0
+    assert not s3.list_multipart_uploads(Bucket=BUCKET).get('Uploads')
+
+
+def test_concurrent_first_chunks_share_one_upload(s3):
+    ingest = S3MultipartIngest(s3, BUCKET)
+    first = ingest._start('race.webm', CHUNK, 3)
+    second = ingest._start('race.webm', CHUNK, 3)  # a retried chunk 0 that also saw no state
+    assert second['upload_id'] == first['upload_id']
+    uploads = s3.list_multipart_uploads(Bucket=BUCKET).get('Uploads', [])
+    assert [u['UploadId'] for u in uploads] == [first['upload_id']]
+
+
+def test_abort_removes_upload_and_staging(s3):
+    ingest = S3MultipartIngest(s3, BUCKET)
+    ingest.write_chunk('gone.webm', 0, 8, os.urandom(CHUNK))
+    ingest.abort('gone.webm')
+    assert not s3.list_multipart_uploads(Bucket=BUCKET).get('Uploads')
+    assert s3.list_objects_v2(Bucket=BUCKET, Prefix='.uploads/').get('KeyCount') == 0
@@ -0,0 +1,188 @@
+"""Voice-activity detection on the students' assembled audio streams.
+
+Instead of every audio piece, the teacher gets a ``speech`` event when a
+student talks: where it starts in the stream, how long it lasts, its RMS
+level, and the URL of just that clip (see audio_stream.py).
+
+Each stored piece schedules an analysis of the student's stream. Analyses
+run in a small thread pool and never on the socket handler's thread. There
+is at most one analysis per student at a time, and pieces that arrive
+while it runs are folded into the next one. An analysis decodes the
+stream from the last analyzed position to 16 kHz mono PCM (PyAV). It then
+splits the PCM into 30 ms frames and computes, per frame and vectorized
+in NumPy, the RMS level and the zero-crossing rate. A frame is speech
+when it is ``margin_db`` above the student's noise floor (and at least
+``threshold_db``), and its zero-crossing rate is below that of broadband
+noise. Gaps shorter than ``hangover_ms`` are bridged, and segments
+shorter than ``min_speech_ms`` (clicks, coughs) are dropped. A segment
+still open at the end of the decoded audio is reported by the next
+analysis, once it has ended, or after ``max_segment_ms``.
+
+NumPy and PyAV are optional. Without them ``enabled`` is False and the
+caller keeps notifying the teacher about every piece.
+"""
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import av
+    import numpy as np
+except ImportError:  # analysis disabled
+    av = None
+    np = None
+
+from audio_stream import read_ranges
+
+log = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+
+
+def decode(data, sample_rate=SAMPLE_RATE):
+    """``(pcm, start_ms)``: mono float32 samples of a WebM byte string, and the media time of the first one."""
+    chunks = []
+    start_ms = None
+    resampler = av.AudioResampler(format='flt', layout='mono', rate=sample_rate)
+    with av.open(io.BytesIO(data)) as container:
+        try:
+            for frame in container.decode(audio=0):
+                if start_ms is None and frame.time is not None:
+                    start_ms = frame.time * 1000
+                chunks.extend(f.to_ndarray()[0] for f in resampler.resample(frame))
+        except av.FFmpegError:
+            pass  # the newest cluster may be cut off mid-block; keep what decoded
+        chunks.extend(f.to_ndarray()[0] for f in resampler.resample(None))
+    pcm = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+    return pcm, start_ms or 0.0
+
+
+def frame_features(pcm, sample_rate=SAMPLE_RATE, frame_ms=FRAME_MS):
+    """Per-frame RMS level (dBFS) and zero-crossing rate (crossings per sample)."""
+    size = sample_rate * frame_ms // 1000
+    frames = pcm[:len(pcm) // size * size].reshape(-1, size)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    level = 20 * np.log10(np.maximum(rms, 1e-10))
+    zcr = np.count_nonzero(np.diff(np.signbit(frames), axis=1), axis=1) / size
+    return level, zcr
+
+
+def detect(level, zcr, threshold_db, zcr_max=0.35, hangover_frames=10, min_frames=8):
+    """``[(first_frame, end_frame, rms_db)]`` speech segments (end exclusive) from frame features."""
+    speech = (level > threshold_db) & (zcr < zcr_max)
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], speech.view(np.int8), [0]))))
+    starts, ends = edges[::2], edges[1::2]
+    if not len(starts):
+        return []
+    split = starts[1:] - ends[:-1] > hangover_frames
+    starts = np.concatenate((starts[:1], starts[1:][split]))
+    ends = np.concatenate((ends[:-1][split], ends[-1:]))
+    keep = ends - starts >= min_frames
+    starts, ends = starts[keep], ends[keep]
+    # Segment level: RMS over the segment's frames, from a running sum of per-frame power.
+    power = np.concatenate(([0.0], np.cumsum(10 ** (level / 10))))
+    rms_db = 10 * np.log10((power[ends] - power[starts]) / (ends - starts))
+    return list(zip(starts.tolist(), ends.tolist(), rms_db.tolist()))
+
+
+class _Track:
+    __slots__ = ('session', 'until_ms', 'floor', 'running', 'dirty')
+
+    def __init__(self, session):
+        self.session = session
+        self.until_ms = None  # media time analyzed so far
+        self.floor = None  # noise floor estimate, dBFS
+        self.running = False
+        self.dirty = False
+
+
+class VoiceActivity:
+    def __init__(self, streams, on_speech=None, workers=2, threshold_db=-50.0, margin_db=12.0,
+                 min_speech_ms=250, hangover_ms=300, max_segment_ms=30000, sample_rate=SAMPLE_RATE):
+        self.streams = streams
+        self.on_speech = on_speech
+        self.threshold_db = threshold_db
+        self.margin_db = margin_db
+        self.min_frames = max(1, min_speech_ms // FRAME_MS)
+        self.hangover_frames = hangover_ms // FRAME_MS
+        self.max_segment_ms = max_segment_ms
+        self.sample_rate = sample_rate
+        self.enabled = np is not None and av is not None
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='vad') if self.enabled else None
+        self._tracks = {}
+        self._lock = threading.Lock()
+        self.stats = {'pieces': 0, 'analyses': 0, 'coalesced': 0, 'errors': 0, 'segments': 0,
+                      'decoded_ms': 0, 'speech_ms': 0}
+
+    def submit(self, exam_id, student_id, session):
+        """Schedule analysis of everything stored since the last one."""
+        if not self.enabled:
+            return
+        key = (exam_id, student_id)
+        with self._lock:
+            self.stats['pieces'] += 1
+            track = self._tracks.get(key)
+            if track is None or track.session != session:
+                track = self._tracks[key] = _Track(session)
+            if track.running:
+                self.stats['coalesced'] += 1
+                track.dirty = True
+                return
+            track.running = True
+        self.executor.submit(self._run, key, track)
+
+    def _run(self, key, track):
+        while True:
+            track.dirty = False
+            try:
+                self._analyze(key, track)
+            except Exception:
+                self.stats['errors'] += 1
+                log.exception('voice activity analysis failed for %s/%s', *key)
+            with self._lock:
+                if not track.dirty or self._tracks.get(key) is not track:
+                    track.running = False
+                    return
+
+    def _analyze(self, key, track):
+        exam_id, student_id = key
+        clip = self.streams.clip(exam_id, student_id, track.until_ms, session=track.session)
+        if clip is None:
+            return
+        path, ranges, _ = clip
+        pcm, start_ms = decode(b''.join(read_ranges(path, ranges)), self.sample_rate)
+        if track.until_ms is not None and track.until_ms > start_ms:
+            pcm = pcm[int((track.until_ms - start_ms) * self.sample_rate / 1000):]
+            start_ms = track.until_ms
+        level, zcr = frame_features(pcm, self.sample_rate)
+        if not len(level):
+            return
+        self.stats['analyses'] += 1
+        self.stats['decoded_ms'] += len(level) * FRAME_MS
+        floor = float(np.percentile(level, 10))
+        track.floor = floor if track.floor is None else 0.9 * track.floor + 0.1 * floor
+        threshold = max(self.threshold_db, track.floor + self.margin_db)
+        until_ms = start_ms + len(level) * FRAME_MS
+        for first, end, rms_db in detect(level, zcr, threshold, hangover_frames=self.hangover_frames,
+                                         min_frames=self.min_frames):
+            duration_ms = (end - first) * FRAME_MS
+            if end >= len(level) - self.hangover_frames and duration_ms < self.max_segment_ms:
+                until_ms = start_ms + first * FRAME_MS  # still talking: report it once it ends
+                break
+            self.stats['segments'] += 1
+            self.stats['speech_ms'] += duration_ms
+            if self.on_speech:
+                self.on_speech(exam_id, student_id, {'session': track.session, 'start': round(start_ms + first * FRAME_MS),
+                                                     'duration': duration_ms / 1000, 'rms': round(rms_db, 1)})
+        track.until_ms = until_ms
+
+    def forget(self, exam_id, student_id):
+        with self._lock:
+            self._tracks.pop((exam_id, student_id), None)
+
+    def report(self):
+        decoded = self.stats['decoded_ms']
+        return dict(self.stats, enabled=self.enabled, tracks=len(self._tracks),
+                    speech_ratio=round(self.stats['speech_ms'] / decoded, 3) if decoded else 0.0)